@@ -0,0 +1,164 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 工作线程当前正在执行的查询句柄
+_current = threading.local()
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    """一次后台查询的句柄，同一 key 提交新查询后旧的句柄即被取消"""
+
+    def __init__(self, runner, key, generation):
+        self.runner = runner
+        self.key = key
+        self.generation = generation
+        # 查询借用中的数据库连接ID，用于取消时终止服务器上的查询；连接归还前清空
+        self.connection_id = None
+
+    @property
+    def cancelled(self):
+        return self.runner._generations.get(self.key) != self.generation
+
+
+class QueryRunner:
+    """后台查询执行器
+
+    查询在线程池中执行，结果通过队列交回Tk主线程，再用 after 分批回调，
+    避免大结果集一次性插入表格时阻塞界面。同一个 key（通常是一个标签页）
+    上提交新的查询会取消尚未完成的旧查询，旧查询的结果会被直接丢弃；
+    如果旧查询仍在服务器上执行，会在后台线程中调用 on_cancel(ticket) 终止它。
+    """
+
+    def __init__(self, root, max_workers=4, chunk_size=200, poll_interval=20, on_cancel=None):
+        self.root = root
+        self.on_cancel = on_cancel
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._results = queue.Queue()
+        self._generations = {}
+        self._tickets = {}
+        self._lock = threading.Lock()
+        # 记录/清空连接ID与终止查询互斥，保证被终止的连接仍由该查询借用
+        self._connection_lock = threading.Lock()
+        self._closed = False
+        self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, key, task, on_chunk=None, on_done=None, on_error=None, on_result=None):
+        """提交后台查询
+
+        task: 在工作线程中执行的函数，返回结果行列表
+        on_chunk(rows, offset): 在主线程中分批回调
+        on_done(total): 全部结果交付后回调
+        on_error(e): 查询出错时回调
+        on_result(result): 不分批，在主线程中一次性交付 task 的返回值
+        """
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._tickets.get(key)
+            ticket = Ticket(self, key, generation)
+            self._tickets[key] = ticket
+        self._kill(previous)
+        callbacks = (on_chunk, on_done, on_error, on_result)
+
+        def run():
+            if ticket.cancelled:
+                return
+            _current.ticket = ticket
+            try:
+                result = task()
+            except Exception as e:
+                self._results.put((ticket, callbacks, None, e))
+            else:
+                self._results.put((ticket, callbacks, result, None))
+            finally:
+                _current.ticket = None
+
+        self._executor.submit(run)
+        return ticket
+
+    def cancel(self, key):
+        """取消 key 上正在执行或正在交付的查询"""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            previous = self._tickets.pop(key, None)
+        self._kill(previous)
+
+    def _kill(self, ticket):
+        """终止已被取消但仍在服务器上执行的查询"""
+        if self.on_cancel is None or ticket is None or ticket.connection_id is None:
+            return
+
+        def kill():
+            # 持有连接锁期间查询不能归还连接，终止的一定是这个查询所在的连接
+            with self._connection_lock:
+                if ticket.connection_id is not None:
+                    self.on_cancel(ticket)
+
+        threading.Thread(target=kill, daemon=True).start()
+
+    @staticmethod
+    def attach_connection(conn):
+        """记录当前工作线程上的查询借用的连接，由数据访问层在执行语句前调用；
+        归还连接前以 None 调用，清空记录
+        """
+        ticket = getattr(_current, 'ticket', None)
+        if ticket is not None:
+            with ticket.runner._connection_lock:
+                ticket.connection_id = conn.connection_id if conn is not None else None
+
+    def _poll(self):
+        """在主线程中取出已完成的查询结果"""
+        if self._closed:
+            return
+        try:
+            while True:
+                try:
+                    ticket, callbacks, result, error = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if ticket.cancelled:
+                    continue
+                on_chunk, on_done, on_error, on_result = callbacks
+                # 单个回调出错（例如窗口已经关闭）不能影响其他查询结果的交付
+                try:
+                    if error is not None:
+                        if on_error:
+                            on_error(error)
+                    elif on_result:
+                        on_result(result)
+                    else:
+                        self._deliver(ticket, callbacks, result or [], 0)
+                except Exception:
+                    logger.exception("查询 %s 的回调出错", ticket.key)
+        finally:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def _deliver(self, ticket, callbacks, rows, offset):
+        """分批把结果交给回调，每批之间让出主循环"""
+        if ticket.cancelled or self._closed:
+            return
+        on_chunk, on_done, on_error, on_result = callbacks
+        chunk = rows[offset:offset + self.chunk_size]
+        try:
+            if on_chunk and (chunk or offset == 0):
+                on_chunk(chunk, offset)
+            offset += len(chunk)
+            if offset < len(rows):
+                self.root.after(1, self._deliver, ticket, callbacks, rows, offset)
+            elif on_done:
+                on_done(len(rows))
+        except Exception:
+            logger.exception("查询 %s 的回调出错", ticket.key)
+
+    def shutdown(self):
+        self._closed = True
+        try:
+            self.root.after_cancel(self._poll_id)
+        except Exception:
+            pass
+        self._executor.shutdown(wait=False, cancel_futures=True)
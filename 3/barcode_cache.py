@@ -0,0 +1,82 @@
+import threading
+
+# 扫码查询的商品字段，WHERE 条件由调用处追加
+SCAN_QUERY = """
+    SELECT p.id, p.name, p.price, p.barcode, IFNULL(i.quantity, 0) AS stock
+    FROM products p
+    LEFT JOIN inventory i ON i.product_id = p.id
+"""
+
+
+class BarcodeCache:
+    """条码 -> 商品 (id, name, price, stock) 的进程内缓存
+
+    启动后在后台一次性加载所有有条码的商品，扫码时直接在字典中查找，不访问数据库。
+    商品修改、删除和库存变动后调用 invalidate 移除对应的条目。lookup 只查找缓存，
+    缓存中没有的条码由调用方在后台线程中用 refresh 按 products.barcode 的唯一索引查询并重新缓存。
+    库存只用于扫码时提示，其他收银台的入库不会让缓存失效，提示库存不足时应先用 refresh 重新查询；
+    下单时仍在事务中检查实际库存。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._items = {}
+        # 商品ID -> 条码，用于按商品失效
+        self._barcodes = {}
+        self._lock = threading.Lock()
+        # 加载过程中被失效的商品ID，加载完成时不写入这些商品
+        self._dirty = None
+
+    def warm(self):
+        """加载所有有条码的商品，在后台线程中执行，返回缓存的条目数"""
+        with self._lock:
+            self._dirty = set()
+        rows = self.db.query(SCAN_QUERY + " WHERE p.barcode IS NOT NULL AND p.barcode <> ''")
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = None
+            for row in rows:
+                if row['id'] not in dirty:
+                    self._put(row)
+            return len(self._items)
+
+    def lookup(self, barcode):
+        """在缓存中查找条码，返回 (id, name, price, stock)，没有缓存时返回None，不访问数据库"""
+        return self._items.get(barcode)
+
+    def refresh(self, barcode):
+        """重新查询条码对应的商品并更新缓存，返回 (id, name, price, stock)，不存在时返回None
+
+        访问数据库，应在后台线程中执行；查询失败时抛出异常，原有的缓存条目保留不变
+        """
+        row = self.db.query_one(SCAN_QUERY + " WHERE p.barcode = %s", (barcode,))
+        with self._lock:
+            if row is None:
+                product_id = self._items.pop(barcode, (None,))[0]
+                self._barcodes.pop(product_id, None)
+                return None
+            return self._put(row)
+
+    def items(self):
+        """返回所有缓存的商品 [(id, name, price, stock)]，数据库不可用时用于选择商品"""
+        return list(self._items.values())
+
+    def invalidate(self, product_ids):
+        """移除指定商品的缓存条目"""
+        with self._lock:
+            for product_id in product_ids:
+                product_id = int(product_id)
+                barcode = self._barcodes.pop(product_id, None)
+                if barcode is not None:
+                    self._items.pop(barcode, None)
+                if self._dirty is not None:
+                    self._dirty.add(product_id)
+
+    def _put(self, row):
+        item = (row['id'], row['name'], row['price'], row['stock'])
+        old = self._barcodes.get(row['id'])
+        if old is not None and old != row['barcode']:
+            self._items.pop(old, None)
+        self._items[row['barcode']] = item
+        self._barcodes[row['id']] = row['barcode']
+        return item
@@ -0,0 +1,151 @@
+"""并发下单压力测试
+
+模拟多个收银台同时对少量热门商品下单，检查库存不会被超卖，并统计不同收银台数量下的吞吐量。
+测试数据使用名称以 __bench__ 开头的临时商品，结束后删除：
+
+    python bench_checkout.py                  # 依次测试 1 2 4 8 个收银台
+    python bench_checkout.py 2 16 --orders 200
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+
+from checkout import InsufficientStockError, checkout
+from db_pool import Database
+from inventory_ledger import open_stock
+
+BENCH_PREFIX = "__bench__"
+
+
+def create_products(db, count, stock):
+    """创建测试商品和库存，返回商品ID列表；与新增商品一样通过 open_stock 记录初始库存，账本保持一致"""
+    ids = []
+    with db.transaction() as cursor:
+        for i in range(count):
+            cursor.execute(
+                "INSERT INTO products (name, price, cost, stock, category) VALUES (%s, %s, %s, %s, %s)",
+                (f"{BENCH_PREFIX}{i}", Decimal("1.00"), Decimal("0.50"), stock, BENCH_PREFIX)
+            )
+            ids.append(cursor.lastrowid)
+            open_stock(cursor, cursor.lastrowid, stock)
+    return ids
+
+
+def cleanup(db):
+    """删除测试商品以及它们的订单、明细、库存日志和库存快照"""
+    with db.transaction() as cursor:
+        cursor.execute("SELECT id FROM products WHERE name LIKE %s", (f"{BENCH_PREFIX}%",))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT DISTINCT order_id FROM sales_order_items WHERE product_id IN ({placeholders})", ids
+        )
+        order_ids = [row['order_id'] for row in cursor.fetchall()]
+        cursor.execute(f"DELETE FROM inventory_logs WHERE product_id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM inventory_snapshots WHERE product_id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM inventory_daily_snapshots WHERE product_id IN ({placeholders})", ids)
+        if order_ids:
+            order_placeholders = ", ".join(["%s"] * len(order_ids))
+            cursor.execute(f"DELETE FROM sales_order_items WHERE order_id IN ({order_placeholders})", order_ids)
+            cursor.execute(f"DELETE FROM sales_orders WHERE id IN ({order_placeholders})", order_ids)
+        cursor.execute(f"DELETE FROM products WHERE id IN ({placeholders})", ids)
+
+
+def run_till(db, product_ids, orders, stats, lock):
+    """一个收银台：连续下 orders 单，每单随机 1-3 种商品"""
+    completed = rejected = failed = 0
+    for _ in range(orders):
+        lines = [
+            (product_id, random.randint(1, 2), Decimal("1.00"))
+            for product_id in random.sample(product_ids, random.randint(1, min(3, len(product_ids))))
+        ]
+        total = sum(price * quantity for _, quantity, price in lines)
+        try:
+            checkout(db, None, lines, total, Decimal("0"), total, "cash")
+            completed += 1
+        except InsufficientStockError:
+            rejected += 1
+        except Exception as e:
+            failed += 1
+            print(f"  下单失败: {e}", file=sys.stderr)
+    with lock:
+        stats['completed'] += completed
+        stats['rejected'] += rejected
+        stats['failed'] += failed
+
+
+def verify(db, product_ids, stock):
+    """检查库存没有变成负数，且每个商品卖出的数量等于库存减少的数量"""
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    rows = db.query(f"""
+        SELECT i.product_id, i.quantity, p.stock, IFNULL(SUM(soi.quantity), 0) AS sold
+        FROM inventory i
+        JOIN products p ON p.id = i.product_id
+        LEFT JOIN sales_order_items soi ON soi.product_id = i.product_id
+        WHERE i.product_id IN ({placeholders})
+        GROUP BY i.product_id, i.quantity, p.stock
+    """, product_ids)
+    problems = []
+    for row in rows:
+        if row['quantity'] < 0:
+            problems.append(f"商品 {row['product_id']} 库存为负数: {row['quantity']}")
+        if stock - row['sold'] != row['quantity']:
+            problems.append(f"商品 {row['product_id']} 卖出 {row['sold']}，库存 {stock} -> {row['quantity']}")
+        if row['stock'] != row['quantity']:
+            problems.append(f"商品 {row['product_id']} products.stock={row['stock']} 与库存 {row['quantity']} 不一致")
+    return problems
+
+
+def bench(db_config, tills, products, stock, orders):
+    """用 tills 个并发收银台测试一轮，返回是否没有超卖和失败"""
+    db = Database(db_config, pool_size=tills + 1)
+    try:
+        cleanup(db)
+        product_ids = create_products(db, products, stock)
+        stats = {'completed': 0, 'rejected': 0, 'failed': 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=run_till, args=(db, product_ids, orders, stats, lock))
+            for _ in range(tills)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        problems = verify(db, product_ids, stock)
+        print(f"{tills:>3} 个收银台: 成功 {stats['completed']:>5} 单，库存不足 {stats['rejected']:>5} 单，"
+              f"失败 {stats['failed']} 单，用时 {elapsed:.2f} 秒，{stats['completed'] / elapsed:.1f} 单/秒")
+        for problem in problems:
+            print(f"  错误: {problem}")
+        return not problems and not stats['failed']
+    finally:
+        cleanup(db)
+        db.close()
+
+
+def main(argv):
+    from retail_management import DB_CONFIG
+
+    parser = argparse.ArgumentParser(description="并发下单压力测试")
+    parser.add_argument("tills", nargs="*", type=int, default=[1, 2, 4, 8], help="收银台数量")
+    parser.add_argument("--products", type=int, default=5, help="热门商品数量")
+    parser.add_argument("--stock", type=int, default=100, help="每个商品的初始库存")
+    parser.add_argument("--orders", type=int, default=100, help="每个收银台的下单次数")
+    args = parser.parse_args(argv[1:])
+
+    ok = True
+    for tills in args.tills:
+        ok = bench(DB_CONFIG, tills, args.products, args.stock, args.orders) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
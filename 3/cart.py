@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+
+class CartLine:
+    """购物车中的一个商品行"""
+
+    __slots__ = ("product_id", "name", "price", "quantity")
+
+    def __init__(self, product_id, name, price, quantity):
+        self.product_id = product_id
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    """下单对话框的商品行，按商品ID保存
+
+    同一商品再次加入时合并数量；合计金额随每次增删改增量更新，不需要遍历所有行，
+    几百行的大订单也不会变慢。表格只负责显示，数据以这里为准。
+    """
+
+    def __init__(self):
+        self._lines = {}
+        self.total = Decimal("0")
+
+    def __len__(self):
+        return len(self._lines)
+
+    def get(self, product_id):
+        return self._lines.get(int(product_id))
+
+    def quantity(self, product_id):
+        """返回商品在购物车中的数量，不在购物车中时返回0"""
+        line = self._lines.get(int(product_id))
+        return line.quantity if line else 0
+
+    def add(self, product_id, name, price, quantity):
+        """加入商品，已在购物车中时数量相加，返回该商品行"""
+        product_id = int(product_id)
+        line = self._lines.get(product_id)
+        if line is None:
+            line = CartLine(product_id, name, Decimal(str(price)), 0)
+            self._lines[product_id] = line
+        line.quantity += quantity
+        self.total += line.price * quantity
+        return line
+
+    def set_quantity(self, product_id, quantity):
+        """修改商品数量，数量不大于0时移除该行，返回该商品行（已移除时返回None）"""
+        line = self._lines.get(int(product_id))
+        if line is None:
+            return None
+        if quantity <= 0:
+            self.remove(product_id)
+            return None
+        self.total += line.price * (quantity - line.quantity)
+        line.quantity = quantity
+        return line
+
+    def remove(self, product_id):
+        """移除商品行，返回被移除的行，不存在时返回None"""
+        line = self._lines.pop(int(product_id), None)
+        if line is not None:
+            self.total -= line.subtotal
+        return line
+
+    def final_total(self, discount):
+        """扣除折扣后的应付金额"""
+        return self.total - Decimal(str(discount))
+
+    def lines(self):
+        """返回下单用的 [(商品ID, 数量, 单价)]"""
+        return [(line.product_id, line.quantity, line.price) for line in self._lines.values()]
+
+    def names(self):
+        """返回 {商品ID: 商品名称}"""
+        return {line.product_id: line.name for line in self._lines.values()}
@@ -0,0 +1,120 @@
+class InsufficientStockError(Exception):
+    """下单时库存不足，shortages 为 [(商品ID, 需要数量, 当前库存或None)]"""
+
+    def __init__(self, shortages):
+        super().__init__("库存不足")
+        self.shortages = shortages
+
+
+def merge_lines(lines):
+    """合并同一商品的多行，lines 为 [(商品ID, 数量, 单价)]，返回按商品ID排序的列表"""
+    merged = {}
+    for product_id, quantity, price in lines:
+        product_id = int(product_id)
+        if product_id in merged:
+            merged[product_id] = (merged[product_id][0] + quantity, price)
+        else:
+            merged[product_id] = (quantity, price)
+    return [(product_id, quantity, price) for product_id, (quantity, price) in sorted(merged.items())]
+
+
+def checkout(db, customer_id, lines, total, discount, final_total, payment_method):
+    """在一个事务中创建已完成的销售订单，返回订单号
+
+    语句条数与商品行数无关：按商品ID顺序锁定库存行、订单头、一条多行 INSERT 写入明细、
+    一条带条件的 UPDATE ... JOIN 扣减库存、一条 INSERT ... SELECT 写库存日志、一条 UPDATE
+    同步 products.stock。库存只在这里扣减一次（迁移 0009 删除了明细表上的扣减触发器）。
+    任何商品库存不足时整个事务回滚并抛出 InsufficientStockError。
+
+    多个收银台同时下单时，库存检查和扣减在同一条语句中完成，不会超卖；所有事务都按
+    商品ID升序加锁，避免互相等待形成死锁，仍然发生死锁或锁等待超时时整个事务自动重试。
+    """
+    lines = merge_lines(lines)
+
+    def work(cursor):
+        return write_order(cursor, customer_id, lines, total, discount, final_total, payment_method)
+
+    try:
+        return db.run_transaction(work)
+    except InsufficientStockError:
+        # 事务已回滚，重新查询当前库存找出不足的商品
+        raise InsufficientStockError(find_shortages(db, lines))
+
+
+def write_order(cursor, customer_id, lines, total, discount, final_total, payment_method,
+                client_uuid=None, created_at=None):
+    """在调用方的事务中写入一个订单，返回订单号；lines 必须已经由 merge_lines 合并
+
+    client_uuid 和 created_at 用于同步离线订单：前者是唯一的幂等键，后者为离线下单的时间
+    """
+    # 先按商品ID顺序锁定本单涉及的库存行，之后的扣减不会再以其他顺序加锁
+    cursor.execute(
+        f"SELECT product_id FROM inventory WHERE product_id IN ({', '.join(['%s'] * len(lines))}) "
+        "ORDER BY product_id FOR UPDATE",
+        [product_id for product_id, _, _ in lines]
+    )
+    cursor.fetchall()
+
+    cursor.execute("""
+        INSERT INTO sales_orders (
+            customer_id, total_amount, discount, final_amount, payment_method, status, client_uuid, created_at
+        )
+        VALUES (%s, %s, %s, %s, %s, 'completed', %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    """, (customer_id, total, discount, final_total, payment_method, client_uuid, created_at))
+    order_id = cursor.lastrowid
+
+    params = []
+    for product_id, quantity, price in lines:
+        params.extend((order_id, product_id, quantity, price, price * quantity))
+    cursor.execute(
+        "INSERT INTO sales_order_items (order_id, product_id, quantity, price, subtotal) VALUES "
+        + ", ".join(["(%s, %s, %s, %s, %s)"] * len(lines)),
+        params
+    )
+
+    # 检查和扣减在同一条语句中完成，库存不足的行不会被更新
+    cursor.execute("""
+        UPDATE inventory i
+        JOIN sales_order_items soi ON soi.product_id = i.product_id
+        SET i.quantity = i.quantity - soi.quantity
+        WHERE soi.order_id = %s AND i.quantity >= soi.quantity
+    """, (order_id,))
+    if cursor.rowcount != len(lines):
+        raise InsufficientStockError([])
+
+    cursor.execute("""
+        INSERT INTO inventory_logs (
+            product_id, change_type, quantity, quantity_change, reference_id,
+            reference_type, before_quantity, after_quantity, notes
+        )
+        SELECT
+            soi.product_id, 'sale', soi.quantity, -soi.quantity, soi.order_id,
+            'sales_order', i.quantity + soi.quantity, i.quantity, CONCAT('销售订单 #', soi.order_id)
+        FROM sales_order_items soi
+        JOIN inventory i ON i.product_id = soi.product_id
+        WHERE soi.order_id = %s
+    """, (order_id,))
+
+    cursor.execute("""
+        UPDATE products p
+        JOIN sales_order_items soi ON soi.product_id = p.id
+        JOIN inventory i ON i.product_id = p.id
+        SET p.stock = i.quantity
+        WHERE soi.order_id = %s
+    """, (order_id,))
+    return order_id
+
+
+def find_shortages(db, lines):
+    """查询哪些商品行库存不足，返回 [(商品ID, 需要数量, 当前库存或None)]"""
+    lines = merge_lines(lines)
+    rows = db.query(
+        f"SELECT product_id, quantity FROM inventory WHERE product_id IN ({', '.join(['%s'] * len(lines))})",
+        [product_id for product_id, _, _ in lines]
+    )
+    stock = {row['product_id']: row['quantity'] for row in rows}
+    return [
+        (product_id, quantity, stock.get(product_id))
+        for product_id, quantity, _ in lines
+        if stock.get(product_id) is None or stock[product_id] < quantity
+    ]
@@ -0,0 +1,49 @@
+import re
+
+from pinyin_index import is_pinyin_query, pinyin_condition
+
+# 完整手机号的位数，达到这个长度时按号码精确查找
+PHONE_LENGTH = 11
+
+# 号码中允许的分隔符
+_PHONE_SEPARATORS = re.compile(r"[\s\-+]")
+_DIGITS = re.compile(r"^[0-9]+$")
+
+
+def phone_digits(text):
+    """输入是电话号码（或其中一段）时返回去掉分隔符后的数字，否则返回None"""
+    digits = _PHONE_SEPARATORS.sub("", text)
+    return digits if _DIGITS.match(digits) else None
+
+
+def customer_search_condition(text):
+    """根据输入选择检索方式，返回 (检索方式, 条件SQL, 参数)
+
+    - phone: 完整号码，使用 phone 上的唯一索引精确查找
+    - suffix: 号码后几位，使用反转列 phone_reversed 的前缀匹配（见迁移 0006_phone_suffix）
+    - pinyin: 只有字母，按拼音或首字母前缀检索
+    - name: 其他输入按名称模糊匹配
+    """
+    digits = phone_digits(text)
+    if digits is not None:
+        if len(digits) >= PHONE_LENGTH:
+            return "phone", "phone = %s", (digits,)
+        return "suffix", "phone_reversed LIKE %s", (f"{digits[::-1]}%",)
+    if is_pinyin_query(text):
+        condition, params = pinyin_condition(text)
+        return "pinyin", condition, params
+    return "name", "LOWER(name) LIKE %s", (f"%{text.lower()}%",)
+
+
+def customer_matcher(kind, text):
+    """与 customer_search_condition 条件一致的内存匹配函数，参数为客户行
+
+    号码检索在继续输入时条件不再是上一次的子集（后缀变了），返回None
+    """
+    text = text.lower()
+    if kind == "pinyin":
+        return lambda row: ((row.get('name_initials') or "").startswith(text)
+                            or (row.get('name_pinyin') or "").startswith(text))
+    if kind == "name":
+        return lambda row: text in (row.get('name') or "").lower()
+    return None
@@ -0,0 +1,286 @@
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors
+
+# 连接断开类错误码：无法连接服务器 / 服务器已断开 / 查询期间丢失连接 / 连接中断
+RECONNECT_ERRNOS = {2003, 2006, 2013, 2055}
+# 锁冲突错误码：死锁 / 等待行锁超时，整个事务重新执行即可
+LOCK_CONFLICT_ERRNOS = {1213, 1205}
+
+
+def is_connection_error(e):
+    """判断异常是否由连接断开引起（可以重连后重试）"""
+    if isinstance(e, (errors.InterfaceError, errors.OperationalError)):
+        return e.errno in RECONNECT_ERRNOS or e.errno is None or e.errno == -1
+    return False
+
+
+def is_lock_conflict(e):
+    """判断异常是否由死锁或锁等待超时引起（可以重新执行事务）"""
+    return isinstance(e, errors.Error) and e.errno in LOCK_CONFLICT_ERRNOS
+
+
+class ConnectionPool:
+    """有界的MySQL连接池
+
+    - 连接数量不超过 size，取不到空闲连接时最多等待 timeout 秒
+    - 借出前检查连接健康状态，失效的连接会被重建
+    - 同一线程内嵌套借用时复用同一个连接，保证每个工作线程拥有自己的连接
+    """
+
+    def __init__(self, db_config, size=5, timeout=10, health_check_interval=30):
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _create(self):
+        conn = mysql.connector.connect(**self.db_config)
+        # 读操作不开启隐式事务，写操作通过 start_transaction 显式开启
+        conn.autocommit = True
+        conn.last_checked = time.monotonic()
+        return conn
+
+    def _is_healthy(self, conn):
+        """借出前的健康检查，近期检查过的连接跳过ping以减少往返"""
+        if time.monotonic() - getattr(conn, 'last_checked', 0) < self.health_check_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            conn.last_checked = time.monotonic()
+            return True
+        except errors.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except errors.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        """借出一个健康的连接"""
+        if self._closed:
+            raise errors.PoolError("连接池已关闭")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._create()
+                    except errors.Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise errors.PoolError(f"等待数据库连接超时（连接池大小 {self.size}）")
+                try:
+                    conn = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if self._is_healthy(conn):
+                return conn
+            # 失效连接：丢弃后重建
+            self._discard(conn)
+
+    def release(self, conn, broken=False):
+        """归还连接，未结束的事务会被回滚"""
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except errors.Error:
+            self._discard(conn)
+            return
+        conn.last_checked = time.monotonic()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """获取当前线程的连接，同一线程内嵌套调用复用同一连接"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        broken = False
+        try:
+            yield conn
+        except errors.Error as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self.release(conn, broken=broken)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+class Database:
+    """数据访问层：所有查询和增删改都通过连接池执行
+
+    读操作（query/query_one）在连接断开时会自动重连并透明重试；
+    写操作不重试，避免重复提交。
+    """
+
+    def __init__(self, db_config, pool_size=5, read_retries=2):
+        self.db_config = db_config
+        self.pool = ConnectionPool(db_config, size=pool_size)
+        self.read_retries = read_retries
+        # 执行读操作前的回调 on_execute(conn)，用于记录正在执行查询的连接；读完后以 None 调用
+        self.on_execute = None
+
+    def check(self):
+        """检查数据库是否可用"""
+        with self.pool.connection() as conn:
+            return conn.is_connected()
+
+    def _read(self, sql, params, fetch):
+        attempt = 0
+        while True:
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor(dictionary=True, buffered=True)
+                    try:
+                        if self.on_execute:
+                            self.on_execute(conn)
+                        cursor.execute(sql, params)
+                        return fetch(cursor)
+                    finally:
+                        # 连接归还连接池之前清空记录，避免终止到之后借用该连接的其他查询
+                        if self.on_execute:
+                            self.on_execute(None)
+                        cursor.close()
+            except errors.Error as e:
+                # 只有最外层借用才能换连接重试，事务内部的读交给上层处理
+                in_outer_call = getattr(self.pool._local, 'conn', None) is None
+                if attempt < self.read_retries and is_connection_error(e) and in_outer_call:
+                    attempt += 1
+                    time.sleep(0.1 * attempt)
+                    continue
+                raise
+
+    def query(self, sql, params=None):
+        """执行查询并返回所有行（字典形式）"""
+        return self._read(sql, params, lambda cursor: cursor.fetchall())
+
+    def query_one(self, sql, params=None):
+        """执行查询并返回第一行，没有结果时返回None"""
+        return self._read(sql, params, lambda cursor: cursor.fetchone())
+
+    def execute(self, sql, params=None):
+        """执行单条写操作并提交，返回 (影响行数, 自增ID)"""
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+
+    def executemany(self, sql, seq_params):
+        """批量执行写操作并提交，返回影响行数"""
+        with self.transaction() as cursor:
+            cursor.executemany(sql, seq_params)
+            return cursor.rowcount
+
+    @contextmanager
+    def transaction(self):
+        """在一个事务中执行多条语句，正常结束时提交，异常时回滚"""
+        with self.pool.connection() as conn:
+            if conn.in_transaction:
+                # 嵌套调用：并入外层事务
+                cursor = conn.cursor(dictionary=True, buffered=True)
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except errors.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    def run_transaction(self, work, attempts=5, base_delay=0.02):
+        """在事务中执行 work(cursor) 并返回其结果，遇到死锁或锁等待超时时回滚后重试
+
+        重试间隔按指数退避并加入随机抖动，避免多个客户端同时重试再次冲突。
+        work 可能被执行多次，其中不能有事务之外的副作用。
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.transaction() as cursor:
+                    return work(cursor)
+            except errors.Error as e:
+                # 嵌套在外层事务中时不能单独重试，交给外层处理
+                in_outer_call = getattr(self.pool._local, 'conn', None) is None
+                attempt += 1
+                if attempt >= attempts or not is_lock_conflict(e) or not in_outer_call:
+                    raise
+                time.sleep(base_delay * (2 ** (attempt - 1)) * (1 + random.random()))
+
+    @contextmanager
+    def cursor(self):
+        """获取自动提交模式下的游标，用于DDL等无需显式事务的语句"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                yield cursor
+                if conn.in_transaction:
+                    conn.commit()
+            finally:
+                cursor.close()
+
+    def kill_query(self, connection_id):
+        """在另一个连接上终止指定连接正在执行的语句，连接本身保留可继续使用"""
+        with self.cursor() as cursor:
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+
+    def close(self):
+        self.pool.close_all()
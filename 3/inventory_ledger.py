@@ -0,0 +1,284 @@
+"""库存账本
+
+inventory_logs 是只追加的库存变动表，inventory_snapshots 保存每个商品在某条变动之后的库存
+（log_id 为快照包含的最后一条变动）。账本库存 = 快照数量 + 快照之后的变动之和，
+只需按 inventory_logs 的 product_id 索引扫描快照之后的少量记录。
+
+inventory.quantity 仍然是下单时加锁、按条件扣减的当前库存，读取库存时以它为准，products.stock 是它的副本；
+两者都与变动记录在同一个事务中写入。账本库存只用于核对（find_drift）和补记差额（reconcile）。所有写变动的代码都必须先锁定商品的 inventory 行
+再写 inventory_logs，快照依赖这一点：持有共享锁时，该商品不会有未提交的变动。
+
+另外每天生成一次日终库存快照（inventory_daily_snapshots），用于查询任意时间点的库存。
+"""
+import datetime
+
+
+# 变动记录的字段顺序，与 record_movements 的参数一致
+MOVEMENT_COLUMNS = (
+    "product_id", "change_type", "quantity", "quantity_change", "reference_id",
+    "reference_type", "before_quantity", "after_quantity", "notes"
+)
+
+# 账本库存：快照 + 快照之后的变动，WHERE 条件由调用处追加
+LEDGER_QUERY = """
+    SELECT i.product_id, i.quantity,
+           IFNULL(s.quantity, 0) + IFNULL(SUM(l.quantity_change), 0) AS ledger_quantity
+    FROM inventory i
+    LEFT JOIN inventory_snapshots s ON s.product_id = i.product_id
+    LEFT JOIN inventory_logs l ON l.product_id = i.product_id AND l.id > IFNULL(s.log_id, 0)
+"""
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def record_movements(cursor, movements):
+    """在调用方的事务中用一条多行 INSERT 追加库存变动
+
+    movements 为 [(商品ID, 变动类型, 数量, 变动数量, 关联单号, 关联类型, 变动前, 变动后, 备注)]
+    """
+    if not movements:
+        return
+    params = []
+    for movement in movements:
+        params.extend(movement)
+    row = f"({_placeholders(MOVEMENT_COLUMNS)})"
+    cursor.execute(
+        f"INSERT INTO inventory_logs ({', '.join(MOVEMENT_COLUMNS)}) VALUES " + ", ".join([row] * len(movements)),
+        params
+    )
+
+
+def open_stock(cursor, product_id, quantity, notes="新商品初始库存"):
+    """在调用方的事务中为新商品建立库存行，初始库存记为一条入库变动"""
+    cursor.execute(
+        "INSERT INTO inventory (product_id, quantity) VALUES (%s, %s)",
+        (product_id, quantity)
+    )
+    if quantity:
+        record_movements(cursor, [(product_id, 'in', quantity, quantity, None, 'adjustment', 0, quantity, notes)])
+
+
+def set_stock(cursor, product_id, quantity, notes):
+    """在调用方的事务中把商品库存设为 quantity，同步 products.stock 并记一条调整变动，返回变动数量"""
+    cursor.execute("SELECT quantity FROM inventory WHERE product_id = %s FOR UPDATE", (product_id,))
+    row = cursor.fetchone()
+    before = row['quantity'] if row else 0
+    change = quantity - before
+    cursor.execute("""
+        INSERT INTO inventory (product_id, quantity) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+    """, (product_id, quantity))
+    cursor.execute("UPDATE products SET stock = %s WHERE id = %s", (quantity, product_id))
+    if change:
+        record_movements(cursor, [(product_id, 'adjustment', quantity, change, None, 'adjustment', before, quantity, notes)])
+    return change
+
+
+def take_snapshots(db, batch_size=500):
+    """把有新变动的商品的快照推进到当前最后一条变动，在后台线程中执行，返回更新的商品数
+
+    每批商品在一个事务中按商品ID顺序加共享锁（与下单的加锁顺序一致），等正在写入这些商品的
+    事务提交后，把快照之后、水位线之前的变动累加进快照。水位线之后的变动留给下一次。
+    """
+    watermark = db.query_one("SELECT IFNULL(MAX(id), 0) AS id FROM inventory_logs")['id']
+    previous = db.query_one("SELECT IFNULL(MAX(log_id), 0) AS id FROM inventory_snapshots")['id']
+    if watermark <= previous:
+        # 没有新变动，只为还没有快照的商品建立快照
+        rows = db.query("""
+            SELECT i.product_id FROM inventory i
+            LEFT JOIN inventory_snapshots s ON s.product_id = i.product_id
+            WHERE s.product_id IS NULL
+        """)
+    else:
+        # 按主键范围找出有新变动的商品，加上还没有快照的商品
+        rows = db.query("""
+            SELECT DISTINCT product_id FROM inventory_logs WHERE id > %s AND id <= %s
+            UNION
+            SELECT i.product_id FROM inventory i
+            LEFT JOIN inventory_snapshots s ON s.product_id = i.product_id
+            WHERE s.product_id IS NULL
+        """, (previous, watermark))
+    product_ids = sorted(row['product_id'] for row in rows)
+
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+
+        def work(cursor):
+            cursor.execute(
+                f"SELECT product_id FROM inventory WHERE product_id IN ({_placeholders(batch)}) "
+                "ORDER BY product_id LOCK IN SHARE MODE",
+                batch
+            )
+            cursor.fetchall()
+            cursor.execute(f"""
+                INSERT INTO inventory_snapshots (product_id, quantity, log_id, taken_at)
+                SELECT i.product_id, IFNULL(s.quantity, 0) + IFNULL(SUM(l.quantity_change), 0),
+                       GREATEST(IFNULL(s.log_id, 0), %s), CURRENT_TIMESTAMP
+                FROM inventory i
+                LEFT JOIN inventory_snapshots s ON s.product_id = i.product_id
+                LEFT JOIN inventory_logs l
+                    ON l.product_id = i.product_id AND l.id > IFNULL(s.log_id, 0) AND l.id <= %s
+                WHERE i.product_id IN ({_placeholders(batch)})
+                GROUP BY i.product_id, s.quantity, s.log_id
+                ON DUPLICATE KEY UPDATE
+                    quantity = VALUES(quantity), log_id = VALUES(log_id), taken_at = VALUES(taken_at)
+            """, [watermark, watermark] + batch)
+
+        db.run_transaction(work)
+    return len(product_ids)
+
+
+def find_drift(db):
+    """找出三处库存不一致的商品，返回 [{product_id, quantity, ledger_quantity, stock}]
+
+    quantity 为 inventory.quantity，ledger_quantity 为账本库存，stock 为 products.stock
+    """
+    return db.query(f"""
+        SELECT d.product_id, d.quantity, d.ledger_quantity, p.stock
+        FROM ({LEDGER_QUERY} GROUP BY i.product_id, i.quantity, s.quantity) d
+        JOIN products p ON p.id = d.product_id
+        WHERE d.ledger_quantity <> d.quantity OR NOT (p.stock <=> d.quantity)
+        ORDER BY d.product_id
+    """)
+
+
+def reconcile(db, product_ids, notes="账本核对补记"):
+    """以 inventory.quantity 为准修复不一致：账本差额补记一条调整变动，products.stock 同步为当前库存
+
+    不修改已有的变动记录。返回补记的变动数。
+    """
+    product_ids = sorted(int(product_id) for product_id in product_ids)
+    if not product_ids:
+        return 0
+
+    def work(cursor):
+        placeholders = _placeholders(product_ids)
+        cursor.execute(
+            f"SELECT product_id FROM inventory WHERE product_id IN ({placeholders}) ORDER BY product_id FOR UPDATE",
+            product_ids
+        )
+        cursor.fetchall()
+        cursor.execute(f"""
+            INSERT INTO inventory_logs ({', '.join(MOVEMENT_COLUMNS)})
+            SELECT d.product_id, 'adjustment', d.quantity, d.quantity - d.ledger_quantity, NULL,
+                   'adjustment', d.ledger_quantity, d.quantity, %s
+            FROM ({LEDGER_QUERY} WHERE i.product_id IN ({placeholders})
+                  GROUP BY i.product_id, i.quantity, s.quantity) d
+            WHERE d.ledger_quantity <> d.quantity
+        """, [notes] + product_ids)
+        added = cursor.rowcount
+        cursor.execute(f"""
+            UPDATE products p
+            JOIN inventory i ON i.product_id = p.id
+            SET p.stock = i.quantity
+            WHERE p.id IN ({placeholders}) AND NOT (p.stock <=> i.quantity)
+        """, product_ids)
+        return added
+
+    return db.run_transaction(work)
+
+
+def _insert_daily_rows(db, snapshot_date, rows, batch_size=1000):
+    for start in range(0, len(rows), batch_size):
+        db.executemany(
+            "INSERT IGNORE INTO inventory_daily_snapshots (snapshot_date, product_id, quantity) VALUES (%s, %s, %s)",
+            [(snapshot_date, row['product_id'], int(row['quantity'])) for row in rows[start:start + batch_size]]
+        )
+
+
+def take_daily_snapshots(db, backfill_days=90):
+    """为昨天以及之前缺少的日期（最多 backfill_days 天）生成日终库存快照，返回生成的日期
+
+    日终库存按创建时间计算：某天的快照为次日零点时各商品的库存，只保存不为0的商品。
+    从昨天开始往前逐日推算：昨天 = 当前库存 - 今天的变动，前一天 = 后一天 - 后一天的变动，
+    每一步只读取一天的日志。每次读取都是一条语句的一致性快照，不加锁、不影响下单。
+    在后台线程中执行，已经生成过时只需要一条查询。
+    """
+    row = db.query_one("""
+        SELECT CURRENT_DATE AS today, (SELECT MAX(snapshot_date) FROM inventory_daily_snapshots) AS latest
+    """)
+    yesterday = row['today'] - datetime.timedelta(days=1)
+    latest = row['latest']
+    if latest is not None and latest >= yesterday:
+        return []
+    first = yesterday - datetime.timedelta(days=backfill_days - 1)
+    if latest is not None:
+        first = max(first, latest + datetime.timedelta(days=1))
+
+    rows = db.query("""
+        SELECT product_id, SUM(quantity) AS quantity
+        FROM (
+            SELECT product_id, quantity FROM inventory
+            UNION ALL
+            SELECT product_id, -quantity_change FROM inventory_logs WHERE created_at >= %s
+        ) x
+        GROUP BY product_id
+        HAVING SUM(quantity) <> 0
+    """, (row['today'],))
+    _insert_daily_rows(db, yesterday, rows)
+    created = [yesterday]
+
+    day = yesterday
+    while day > first:
+        previous = day - datetime.timedelta(days=1)
+        rows = db.query("""
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM (
+                SELECT product_id, quantity FROM inventory_daily_snapshots WHERE snapshot_date = %s
+                UNION ALL
+                SELECT product_id, -quantity_change FROM inventory_logs WHERE created_at >= %s AND created_at < %s
+            ) x
+            GROUP BY product_id
+            HAVING SUM(quantity) <> 0
+        """, (day, day, day + datetime.timedelta(days=1)))
+        _insert_daily_rows(db, previous, rows)
+        created.append(previous)
+        day = previous
+    return created
+
+
+def stock_as_of_query(db, at):
+    """所有商品在时间 at 的库存查询，返回 (SQL, 参数, 说明)
+
+    从离 at 最近的基准出发重放日志：日终快照（时间为次日零点）或当前库存，
+    基准在 at 之前时加上 [基准, at) 的变动，在 at 之后时减去 [at, 基准) 的变动。
+    每天都有快照时最多重放半天的日志，按 (created_at, id) 索引和月份分区只读取这一段。
+    """
+    row = db.query_one("""
+        SELECT NOW() AS now,
+               (SELECT MAX(snapshot_date) FROM inventory_daily_snapshots WHERE snapshot_date < DATE(%s)) AS before_date,
+               (SELECT MIN(snapshot_date) FROM inventory_daily_snapshots WHERE snapshot_date >= DATE(%s)) AS after_date
+    """, (at, at))
+    # 候选基准 [(基准时间, 基准查询, 参数, 说明)]
+    bases = [(row['now'], "SELECT product_id, quantity FROM inventory", (), "当前库存")]
+    for snapshot_date in (row['before_date'], row['after_date']):
+        if snapshot_date is not None:
+            bases.append((
+                datetime.datetime.combine(snapshot_date + datetime.timedelta(days=1), datetime.time.min),
+                "SELECT product_id, quantity FROM inventory_daily_snapshots WHERE snapshot_date = %s",
+                (snapshot_date,), f"{snapshot_date} 日终快照"
+            ))
+    base_time, base_sql, base_params, description = min(bases, key=lambda base: abs(base[0] - at))
+
+    if base_time <= at:
+        replay = "SELECT product_id, quantity_change FROM inventory_logs WHERE created_at >= %s AND created_at < %s"
+        replay_params = (base_time, at)
+    else:
+        replay = "SELECT product_id, -quantity_change FROM inventory_logs WHERE created_at >= %s AND created_at < %s"
+        replay_params = (at, base_time)
+
+    # 先按商品汇总基准和变动，再与商品表按主键关联
+    sql = f"""
+        SELECT p.id AS product_id, p.name AS product_name, p.category, IFNULL(x.quantity, 0) AS quantity
+        FROM products p
+        LEFT JOIN (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM ({base_sql} UNION ALL {replay}) u
+            GROUP BY product_id
+        ) x ON x.product_id = p.id
+        ORDER BY p.id
+    """
+    hours = abs(base_time - at).total_seconds() / 3600
+    return sql, list(base_params) + list(replay_params), f"基于{description}，重放 {hours:.1f} 小时的变动"
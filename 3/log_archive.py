@@ -0,0 +1,181 @@
+"""库存日志的分区维护和归档
+
+inventory_logs 按 created_at 每月一个分区（迁移 0012），分区名为 pYYYYMM，
+最后的 p_future 存放还没有建立分区的月份。maintain_partitions 会执行 ALTER TABLE，
+由管理员从“系统”菜单手动执行，或用下面的命令由计划任务定期执行，不在启动时自动执行：
+
+- 提前为之后几个月建立分区：从 p_future 中拆出，p_future 通常是空的，不需要移动数据
+- 超过保留期的分区用 EXCHANGE PARTITION 换出为独立的归档表 inventory_logs_archive_YYYYMM，
+  只交换元数据，不复制数据，也不影响正在写入的当月分区；之后压缩归档表并删除空分区
+
+分区中的变动都已经计入库存快照后才会归档，账本库存不受影响。归档表可以直接查询：
+
+    python log_archive.py            # 查看分区和归档表
+    python log_archive.py archive    # 建立分区并归档
+"""
+import datetime
+import re
+import sys
+
+from inventory_ledger import take_snapshots
+
+# 多个客户端同时维护分区时用于互斥的命名锁
+PARTITION_LOCK = "retail_log_partitions"
+ARCHIVE_PREFIX = "inventory_logs_archive_"
+PARTITION_NAME_RE = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+def add_months(month, months):
+    """month 为某月1日，返回之后（months 为负数时为之前）第 months 个月的1日"""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name):
+    """分区 pYYYYMM 对应月份的1日，不是按月分区时返回None"""
+    match = PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def list_partitions(db):
+    """返回 inventory_logs 的分区 [(分区名, 估算行数)]，表未分区时返回空列表"""
+    rows = db.query("""
+        SELECT PARTITION_NAME AS name, TABLE_ROWS AS row_count
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'inventory_logs' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [(row['name'], row['row_count']) for row in rows]
+
+
+def list_archives(db):
+    """返回归档表 [(表名, 估算行数)]，按月份排序"""
+    rows = db.query("""
+        SELECT TABLE_NAME AS name, TABLE_ROWS AS row_count
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE %s
+        ORDER BY TABLE_NAME
+    """, (ARCHIVE_PREFIX + "%",))
+    return [(row['name'], row['row_count']) for row in rows]
+
+
+def ensure_partitions(cursor, partitions, months_ahead=3, today=None):
+    """为当前月之后 months_ahead 个月内还没有的月份建立分区，返回新建的分区名"""
+    if "p_future" not in partitions:
+        return []
+    this_month = (today or datetime.date.today()).replace(day=1)
+    months = [month for month in map(partition_month, partitions) if month]
+    month = add_months(max(months), 1) if months else this_month
+    last = add_months(this_month, months_ahead)
+    new = []
+    while month <= last:
+        new.append(month)
+        month = add_months(month, 1)
+    if not new:
+        return []
+    definitions = ", ".join(
+        f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d}'))"
+        for month in new
+    )
+    cursor.execute(
+        f"ALTER TABLE inventory_logs REORGANIZE PARTITION p_future INTO "
+        f"({definitions}, PARTITION p_future VALUES LESS THAN MAXVALUE)"
+    )
+    return [f"p{month:%Y%m}" for month in new]
+
+
+def archive_partitions(cursor, partitions, keep_months=12, today=None):
+    """把整月都早于保留期的分区换出为压缩的归档表，返回归档的表名"""
+    cutoff = add_months((today or datetime.date.today()).replace(day=1), -keep_months)
+    archived = []
+    for name in partitions:
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+
+        # 分区中还有没计入快照的变动时暂不归档，否则账本库存会少算这些变动
+        cursor.execute(f"""
+            SELECT 1 FROM inventory_logs PARTITION ({name}) l
+            JOIN inventory i ON i.product_id = l.product_id
+            LEFT JOIN inventory_snapshots s ON s.product_id = l.product_id
+            WHERE l.id > IFNULL(s.log_id, 0)
+            LIMIT 1
+        """)
+        if cursor.fetchall():
+            continue
+
+        table = f"{ARCHIVE_PREFIX}{month:%Y%m}"
+        cursor.execute(f"SELECT 1 FROM inventory_logs PARTITION ({name}) LIMIT 1")
+        if not cursor.fetchall():
+            # 没有日志的月份不需要归档表
+            cursor.execute(f"ALTER TABLE inventory_logs DROP PARTITION {name}")
+            continue
+        cursor.execute(
+            "SELECT COUNT(*) AS count FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (table,)
+        )
+        if not cursor.fetchone()['count']:
+            # 结构与日志表相同的空表，用于和分区交换
+            cursor.execute(f"CREATE TABLE {table} LIKE inventory_logs")
+            cursor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+        cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        if not cursor.fetchall():
+            cursor.execute(f"ALTER TABLE inventory_logs EXCHANGE PARTITION {name} WITH TABLE {table}")
+        # 上次中途失败时归档表中已经有数据，分区已经是空的，直接删除即可
+        cursor.execute(f"ALTER TABLE inventory_logs DROP PARTITION {name}")
+        cursor.execute(f"ALTER TABLE {table} ROW_FORMAT = COMPRESSED KEY_BLOCK_SIZE = 8")
+        archived.append(table)
+    return archived
+
+
+def maintain_partitions(db, keep_months=12, months_ahead=3):
+    """建立新分区并归档旧分区，在后台线程中执行，返回 (新建的分区, 归档表)
+
+    其他客户端正在维护时直接返回。
+    """
+    partitions = [name for name, _ in list_partitions(db)]
+    if not partitions:
+        return [], []
+    # 先推进快照，让待归档分区中的变动都计入快照
+    take_snapshots(db)
+    with db.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (PARTITION_LOCK,))
+        if not cursor.fetchone()['locked']:
+            return [], []
+        try:
+            created = ensure_partitions(cursor, partitions, months_ahead)
+            archived = archive_partitions(cursor, partitions, keep_months)
+            return created, archived
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (PARTITION_LOCK,))
+            cursor.fetchall()
+
+
+def main(argv):
+    from db_pool import Database
+    from retail_management import DB_CONFIG
+
+    command = argv[1] if len(argv) > 1 else "status"
+    db = Database(DB_CONFIG, pool_size=1)
+    try:
+        if command == "archive":
+            created, archived = maintain_partitions(db)
+            print(f"新建分区: {', '.join(created) or '无'}")
+            print(f"归档: {', '.join(archived) or '无'}")
+        elif command == "status":
+            for name, row_count in list_partitions(db):
+                print(f"  分区 {name}: 约 {row_count} 行")
+            for name, row_count in list_archives(db):
+                print(f"  归档 {name}: 约 {row_count} 行")
+        else:
+            print(__doc__)
+            return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
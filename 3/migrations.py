@@ -0,0 +1,215 @@
+"""数据库结构版本管理
+
+迁移脚本放在 migrations 目录下，文件名形如 0001_baseline.sql，按版本号顺序执行。
+已执行的版本记录在 schema_version 表中。程序启动时只用一条查询检查版本，
+需要升级时由用户显式执行迁移：
+
+    python migrations.py status
+    python migrations.py migrate
+"""
+import os
+import re
+import sys
+
+from mysql.connector import Error, errorcode
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d+)_(\w+)\.sql$")
+# 多个客户端同时迁移时用于互斥的命名锁
+MIGRATION_LOCK = "retail_schema_migration"
+# 只改变会话状态的语句，中断后重新执行迁移时总是重新执行（后面的语句依赖它们设置的变量）
+SESSION_STATEMENT_RE = re.compile(r"^(SET|PREPARE|DEALLOCATE|DO)\b", re.IGNORECASE)
+TRIGGER_STATEMENT_RE = re.compile(r"^(CREATE|DROP)\s+TRIGGER\s+(?:IF\s+EXISTS\s+)?`?(\w+)`?", re.IGNORECASE)
+
+
+def split_sql(script):
+    """把迁移脚本拆分成单条语句，支持 DELIMITER 切换（用于存储过程和触发器）"""
+    statements = []
+    buffer = []
+    delimiter = ";"
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith("DELIMITER "):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not buffer and (not stripped or stripped.startswith("--")):
+            continue
+        buffer.append(line)
+        if stripped.endswith(delimiter):
+            statement = "\n".join(buffer).rstrip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            buffer = []
+    tail = "\n".join(buffer).strip()
+    if tail:
+        statements.append(tail)
+    return statements
+
+
+def list_migrations():
+    """返回按版本排序的迁移脚本列表 [(版本, 名称, 路径)]"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    return migrations
+
+
+def latest_version():
+    migrations = list_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(db):
+    """当前数据库的结构版本，只需要一条查询；没有 schema_version 表时为0"""
+    try:
+        row = db.query_one("SELECT MAX(version) AS version FROM schema_version")
+    except Error as e:
+        if e.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    return row['version'] or 0
+
+
+def pending_migrations(db):
+    version = current_version(db)
+    return [m for m in list_migrations() if m[0] > version]
+
+
+def migrate(db, log=print):
+    """依次执行尚未执行的迁移脚本，返回执行的迁移数量
+
+    MySQL 的DDL会隐式提交，迁移不能整体回滚。每条语句执行成功后记入 schema_migration_steps，
+    中途失败时修正问题再次执行，已经完成的语句会被跳过，从失败的语句继续；
+    SET、PREPARE 等只改变会话状态的语句每次都重新执行。整个迁移完成后删除步骤记录。
+
+    如果失败的语句本身只执行了一部分（例如多个子句的 ALTER TABLE 被中断），需要先按
+    information_schema 手工把它补完或撤销，再重新执行迁移。
+    """
+    with db.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 60) AS locked", (MIGRATION_LOCK,))
+        if not cursor.fetchone()['locked']:
+            raise RuntimeError("其他客户端正在执行数据库迁移，请稍后再试")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT NOT NULL PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migration_steps (
+                    version INT NOT NULL,
+                    step INT NOT NULL,
+                    PRIMARY KEY (version, step)
+                )
+            """)
+            cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+            version = cursor.fetchone()['version'] or 0
+
+            applied = 0
+            for number, name, path in list_migrations():
+                if number <= version:
+                    continue
+                log(f"执行迁移 {number:04d}_{name} ...")
+                with open(path, encoding="utf-8") as f:
+                    statements = split_sql(f.read())
+                cursor.execute("SELECT step FROM schema_migration_steps WHERE version = %s", (number,))
+                done = {row['step'] for row in cursor.fetchall()}
+                if done:
+                    log(f"  上次执行到一半，跳过已完成的 {len(done)} 条语句")
+                for step, statement in enumerate(statements, 1):
+                    session_only = SESSION_STATEMENT_RE.match(statement)
+                    if step in done and not session_only:
+                        continue
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                    if not session_only:
+                        cursor.execute(
+                            "INSERT IGNORE INTO schema_migration_steps (version, step) VALUES (%s, %s)",
+                            (number, step)
+                        )
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                    (number, name)
+                )
+                cursor.execute("DELETE FROM schema_migration_steps WHERE version = %s", (number,))
+                applied += 1
+            return applied
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+
+
+def trigger_definitions(version):
+    """按顺序读取版本 version 及之前的迁移脚本，返回 {触发器名: 最终的 CREATE TRIGGER 语句}
+
+    被后面的迁移删除、没有重新创建的触发器对应 None
+    """
+    triggers = {}
+    for number, _, path in list_migrations():
+        if number > version:
+            break
+        with open(path, encoding="utf-8") as f:
+            for statement in split_sql(f.read()):
+                match = TRIGGER_STATEMENT_RE.match(statement)
+                if match:
+                    triggers[match.group(2)] = statement if match.group(1).upper() == "CREATE" else None
+    return triggers
+
+
+def reinstall_triggers(db):
+    """按已执行的迁移重新安装触发器，返回 (重新创建的触发器, 删除的触发器)
+
+    迁移中删除过的触发器（例如下单时会重复扣减库存的旧触发器）被删除，其余的按迁移中最终的定义重新创建
+    """
+    triggers = trigger_definitions(current_version(db))
+    created = []
+    dropped = []
+    with db.cursor() as cursor:
+        cursor.execute("SELECT GET_LOCK(%s, 60) AS locked", (MIGRATION_LOCK,))
+        if not cursor.fetchone()['locked']:
+            raise RuntimeError("其他客户端正在执行数据库迁移，请稍后再试")
+        try:
+            for name, statement in triggers.items():
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                if statement is None:
+                    dropped.append(name)
+                else:
+                    cursor.execute(statement)
+                    created.append(name)
+            return created, dropped
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+
+
+def main(argv):
+    from db_pool import Database
+    from retail_management import DB_CONFIG
+
+    command = argv[1] if len(argv) > 1 else "status"
+    db = Database(DB_CONFIG, pool_size=1)
+    try:
+        if command == "migrate":
+            applied = migrate(db)
+            print(f"完成，共执行 {applied} 个迁移，当前版本 {current_version(db)}")
+        elif command == "status":
+            version = current_version(db)
+            print(f"当前版本 {version}，最新版本 {latest_version()}")
+            for number, name, _ in pending_migrations(db):
+                print(f"  待执行: {number:04d}_{name}")
+        else:
+            print(__doc__)
+            return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
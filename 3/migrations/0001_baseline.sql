@@ -0,0 +1,220 @@
+-- 基线结构：整理自 aa.sql、inventory_management.sql 以及原来启动时执行的 init_database_structure / fix_triggers
+-- 所有语句都可以重复执行，已有数据库迁移到此版本时不会丢失数据
+
+-- 客户表
+CREATE TABLE IF NOT EXISTS customers (
+    id INT NOT NULL AUTO_INCREMENT,
+    name VARCHAR(50) NOT NULL,
+    phone VARCHAR(20) NULL DEFAULT NULL,
+    email VARCHAR(50) NULL DEFAULT NULL,
+    address TEXT NULL,
+    points INT NULL DEFAULT 0,
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE INDEX phone (phone)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 商品表
+CREATE TABLE IF NOT EXISTS products (
+    id INT NOT NULL AUTO_INCREMENT,
+    name VARCHAR(50) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    cost DECIMAL(10, 2) NULL DEFAULT NULL,
+    stock INT NULL DEFAULT 0,
+    category VARCHAR(30) NULL DEFAULT NULL,
+    barcode VARCHAR(50) NULL DEFAULT NULL,
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE INDEX barcode (barcode)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 供应商表
+CREATE TABLE IF NOT EXISTS suppliers (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    contact_person VARCHAR(100),
+    phone VARCHAR(20),
+    email VARCHAR(100),
+    address VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 库存表
+CREATE TABLE IF NOT EXISTS inventory (
+    product_id INT NOT NULL PRIMARY KEY,
+    quantity INT NOT NULL DEFAULT 0,
+    min_stock_level INT DEFAULT 10,
+    max_stock_level INT DEFAULT 100,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 库存日志表（记录所有库存变动）
+CREATE TABLE IF NOT EXISTS inventory_logs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL,
+    change_type ENUM('in', 'out', 'adjustment', 'sale') NOT NULL,
+    quantity INT NOT NULL,
+    quantity_change INT NOT NULL,
+    reference_id INT,
+    reference_type ENUM('stock_in', 'stock_out', 'adjustment', 'sales_order') NOT NULL,
+    before_quantity INT NOT NULL,
+    after_quantity INT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX product_id (product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 销售订单表
+CREATE TABLE IF NOT EXISTS sales_orders (
+    id INT NOT NULL AUTO_INCREMENT,
+    customer_id INT NULL DEFAULT NULL,
+    total_amount DECIMAL(10, 2) NOT NULL,
+    discount DECIMAL(10, 2) NULL DEFAULT NULL,
+    final_amount DECIMAL(10, 2) NOT NULL,
+    payment_method ENUM('cash', 'card', 'online') NULL DEFAULT NULL,
+    status ENUM('pending', 'completed', 'cancelled') NULL DEFAULT 'pending',
+    created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    INDEX customer_id (customer_id),
+    FOREIGN KEY (customer_id) REFERENCES customers(id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 销售订单明细表
+CREATE TABLE IF NOT EXISTS sales_order_items (
+    id INT NOT NULL AUTO_INCREMENT,
+    order_id INT NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    subtotal DECIMAL(10, 2) NOT NULL,
+    PRIMARY KEY (id),
+    INDEX order_id (order_id),
+    INDEX product_id (product_id),
+    FOREIGN KEY (order_id) REFERENCES sales_orders(id),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 为没有库存记录的商品补齐库存行（已有的库存数量保持不变）
+INSERT IGNORE INTO inventory (product_id, quantity, min_stock_level, max_stock_level)
+SELECT id, IFNULL(stock, 0), 10, 100 FROM products;
+
+-- 库存状态视图 - 与程序中使用的列名保持一致
+CREATE OR REPLACE VIEW product_inventory_status AS
+SELECT 
+    p.id AS product_id,
+    p.name AS product_name,
+    p.price AS price,
+    p.category AS category,
+    IFNULL(i.quantity, 0) AS current_stock,
+    CASE 
+        WHEN IFNULL(i.quantity, 0) <= IFNULL(i.min_stock_level, 10) THEN '不足'
+        WHEN IFNULL(i.quantity, 0) >= IFNULL(i.max_stock_level, 100) THEN '过多'
+        ELSE '充足'
+    END AS stock_status
+FROM 
+    products p
+LEFT JOIN 
+    inventory i ON p.id = i.product_id;
+
+-- 存储过程：库存调整
+DROP PROCEDURE IF EXISTS adjust_inventory;
+DELIMITER //
+CREATE PROCEDURE adjust_inventory(
+    IN p_product_id INT,
+    IN p_quantity INT,
+    IN p_notes TEXT
+)
+BEGIN
+    DECLARE current_qty INT;
+    DECLARE qty_change INT;
+    
+    SELECT IFNULL(quantity, 0) INTO current_qty 
+    FROM inventory 
+    WHERE product_id = p_product_id;
+    
+    SET qty_change = p_quantity - current_qty;
+    
+    -- 更新库存表
+    INSERT INTO inventory (product_id, quantity)
+    VALUES (p_product_id, p_quantity)
+    ON DUPLICATE KEY UPDATE 
+        quantity = p_quantity;
+    
+    -- 同步更新商品表中的库存字段
+    UPDATE products 
+    SET stock = p_quantity 
+    WHERE id = p_product_id;
+    
+    -- 记录库存日志
+    INSERT INTO inventory_logs (
+        product_id, 
+        change_type, 
+        quantity,
+        quantity_change,
+        reference_type,
+        before_quantity,
+        after_quantity,
+        notes
+    )
+    VALUES (
+        p_product_id,
+        'adjustment',
+        p_quantity,
+        qty_change,
+        'adjustment',
+        current_qty,
+        p_quantity,
+        p_notes
+    );
+END //
+DELIMITER ;
+
+-- 销售订单触发器（与 fix_triggers 修复后的状态一致）
+DROP TRIGGER IF EXISTS sales_reduce_inventory_step;
+DROP TRIGGER IF EXISTS after_sales_order_item_insert;
+DROP TRIGGER IF EXISTS sales_reduce_inventory;
+DELIMITER //
+CREATE TRIGGER sales_reduce_inventory
+AFTER INSERT ON sales_order_items
+FOR EACH ROW
+BEGIN
+    UPDATE inventory 
+    SET quantity = quantity - NEW.quantity
+    WHERE product_id = NEW.product_id;
+END //
+DELIMITER ;
+
+DROP TRIGGER IF EXISTS after_sales_order_item_insert_log;
+DELIMITER //
+CREATE TRIGGER after_sales_order_item_insert_log
+AFTER INSERT ON sales_order_items
+FOR EACH ROW
+BEGIN
+    INSERT INTO inventory_logs (
+        product_id, 
+        change_type, 
+        quantity, 
+        quantity_change,
+        reference_id, 
+        reference_type,
+        before_quantity,
+        after_quantity,
+        notes
+    )
+    SELECT 
+        NEW.product_id,
+        'sale',
+        NEW.quantity,
+        -NEW.quantity,
+        NEW.order_id,
+        'sales_order',
+        quantity + NEW.quantity,
+        quantity,
+        CONCAT('销售订单 #', NEW.order_id)
+    FROM inventory
+    WHERE product_id = NEW.product_id;
+END //
+DELIMITER ;
@@ -0,0 +1,16 @@
+-- 为增量刷新添加修改时间水位线：表格刷新时只查询 updated_at 不早于上次刷新时间的行
+
+ALTER TABLE products
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_products_updated_at (updated_at);
+
+ALTER TABLE customers
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_customers_updated_at (updated_at);
+
+ALTER TABLE sales_orders
+    ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_sales_orders_updated_at (updated_at);
+
+ALTER TABLE suppliers
+    ADD INDEX idx_suppliers_updated_at (updated_at);
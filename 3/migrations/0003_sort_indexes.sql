@@ -0,0 +1,19 @@
+-- 表头排序使用的二级索引：(排序列, id) 与表格的键集分页条件一致，
+-- 按任意一列排序翻页时都只需要扫描索引的一段
+
+ALTER TABLE products
+    ADD INDEX idx_products_name (name, id),
+    ADD INDEX idx_products_price (price, id),
+    ADD INDEX idx_products_stock (stock, id),
+    ADD INDEX idx_products_category (category, id),
+    ADD INDEX idx_products_created_at (created_at, id);
+
+ALTER TABLE customers
+    ADD INDEX idx_customers_name (name, id),
+    ADD INDEX idx_customers_points (points, id),
+    ADD INDEX idx_customers_created_at (created_at, id);
+
+ALTER TABLE sales_orders
+    ADD INDEX idx_sales_orders_created_at (created_at, id),
+    ADD INDEX idx_sales_orders_final_amount (final_amount, id),
+    ADD INDEX idx_sales_orders_total_amount (total_amount, id);
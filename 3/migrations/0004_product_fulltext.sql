@@ -0,0 +1,5 @@
+-- 商品名称和分类的全文索引，使用 ngram 分词以支持中文检索（分词长度由 ngram_token_size 决定，默认2）
+-- 替代 LIKE '%关键字%' 的全表扫描，检索结果可以按相关度排序
+
+ALTER TABLE products
+    ADD FULLTEXT INDEX ft_products_name_category (name, category) WITH PARSER ngram;
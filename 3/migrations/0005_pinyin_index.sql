@@ -0,0 +1,15 @@
+-- 拼音和首字母检索列：收银员输入 "kqs" 或 "kuangquanshui" 可以找到 "矿泉水D"
+-- 列值由程序计算（pinyin_index.py），新增和编辑时写入，已有数据由程序启动后在后台补齐
+-- 检索使用前缀匹配 LIKE 'kqs%'，可以走索引
+
+ALTER TABLE products
+    ADD COLUMN name_pinyin VARCHAR(320) NULL DEFAULT NULL,
+    ADD COLUMN name_initials VARCHAR(64) NULL DEFAULT NULL,
+    ADD INDEX idx_products_name_pinyin (name_pinyin),
+    ADD INDEX idx_products_name_initials (name_initials);
+
+ALTER TABLE customers
+    ADD COLUMN name_pinyin VARCHAR(320) NULL DEFAULT NULL,
+    ADD COLUMN name_initials VARCHAR(64) NULL DEFAULT NULL,
+    ADD INDEX idx_customers_name_pinyin (name_pinyin),
+    ADD INDEX idx_customers_name_initials (name_initials);
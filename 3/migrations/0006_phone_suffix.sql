@@ -0,0 +1,7 @@
+-- 电话号码反转列：收银台通常只输入手机号后几位，LIKE '%1234' 无法使用索引
+-- 反转后后缀匹配变成前缀匹配 phone_reversed LIKE '4321%'，可以走索引
+-- 完整号码仍然使用 phone 上的唯一索引精确查找
+
+ALTER TABLE customers
+    ADD COLUMN phone_reversed VARCHAR(20) GENERATED ALWAYS AS (REVERSE(phone)) STORED,
+    ADD INDEX idx_customers_phone_reversed (phone_reversed);
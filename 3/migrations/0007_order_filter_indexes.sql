@@ -0,0 +1,9 @@
+-- 订单筛选使用的组合索引：等值条件列在前，下单时间在后，
+-- 按状态/客户/支付方式筛选并按时间范围过滤、按时间倒序分页时只扫描索引的一段
+-- (customer_id, created_at) 可以替代原来的 customer_id 索引用于外键
+
+ALTER TABLE sales_orders
+    ADD INDEX idx_sales_orders_status_created_at (status, created_at),
+    ADD INDEX idx_sales_orders_customer_created_at (customer_id, created_at),
+    ADD INDEX idx_sales_orders_payment_created_at (payment_method, created_at),
+    DROP INDEX customer_id;
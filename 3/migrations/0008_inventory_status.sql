@@ -0,0 +1,112 @@
+-- 库存状态汇总表：替代每次查询都要关联 products 和 inventory 并逐行计算 CASE 的视图
+-- stock_status 是存储的生成列，带索引，按状态筛选只扫描匹配的行
+-- 表中数据由 products 和 inventory 上的触发器维护，与库存变动在同一个事务中更新，
+-- 所以触发器、存储过程和程序中的所有库存修改都会同步到这里
+
+CREATE TABLE IF NOT EXISTS inventory_status (
+    product_id INT NOT NULL PRIMARY KEY,
+    product_name VARCHAR(50) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    category VARCHAR(30) NULL DEFAULT NULL,
+    current_stock INT NOT NULL DEFAULT 0,
+    min_stock_level INT NULL DEFAULT NULL,
+    max_stock_level INT NULL DEFAULT NULL,
+    -- 与原视图的计算规则一致
+    stock_status VARCHAR(10) GENERATED ALWAYS AS (
+        CASE
+            WHEN current_stock <= IFNULL(min_stock_level, 10) THEN '不足'
+            WHEN current_stock >= IFNULL(max_stock_level, 100) THEN '过多'
+            ELSE '充足'
+        END
+    ) STORED,
+    INDEX idx_inventory_status_stock_status (stock_status, product_id),
+    INDEX idx_inventory_status_product_name (product_name, product_id),
+    INDEX idx_inventory_status_category (category, product_id),
+    INDEX idx_inventory_status_current_stock (current_stock, product_id),
+    INDEX idx_inventory_status_price (price, product_id),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+INSERT INTO inventory_status (product_id, product_name, price, category, current_stock, min_stock_level, max_stock_level)
+SELECT p.id, p.name, p.price, p.category, IFNULL(i.quantity, 0), i.min_stock_level, i.max_stock_level
+FROM products p
+LEFT JOIN inventory i ON p.id = i.product_id
+ON DUPLICATE KEY UPDATE
+    product_name = VALUES(product_name),
+    price = VALUES(price),
+    category = VALUES(category),
+    current_stock = VALUES(current_stock),
+    min_stock_level = VALUES(min_stock_level),
+    max_stock_level = VALUES(max_stock_level);
+
+-- 商品新增和修改：同步名称、价格和分类（删除由外键级联）
+DROP TRIGGER IF EXISTS after_product_insert_status;
+DELIMITER //
+CREATE TRIGGER after_product_insert_status
+AFTER INSERT ON products
+FOR EACH ROW
+BEGIN
+    INSERT IGNORE INTO inventory_status (product_id, product_name, price, category)
+    VALUES (NEW.id, NEW.name, NEW.price, NEW.category);
+END //
+DELIMITER ;
+
+DROP TRIGGER IF EXISTS after_product_update_status;
+DELIMITER //
+CREATE TRIGGER after_product_update_status
+AFTER UPDATE ON products
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.name <=> OLD.name AND NEW.price <=> OLD.price AND NEW.category <=> OLD.category) THEN
+        UPDATE inventory_status
+        SET product_name = NEW.name, price = NEW.price, category = NEW.category
+        WHERE product_id = NEW.id;
+    END IF;
+END //
+DELIMITER ;
+
+-- 库存变动：同步库存数量和上下限
+DROP TRIGGER IF EXISTS after_inventory_insert_status;
+DELIMITER //
+CREATE TRIGGER after_inventory_insert_status
+AFTER INSERT ON inventory
+FOR EACH ROW
+BEGIN
+    UPDATE inventory_status
+    SET current_stock = NEW.quantity,
+        min_stock_level = NEW.min_stock_level,
+        max_stock_level = NEW.max_stock_level
+    WHERE product_id = NEW.product_id;
+END //
+DELIMITER ;
+
+DROP TRIGGER IF EXISTS after_inventory_update_status;
+DELIMITER //
+CREATE TRIGGER after_inventory_update_status
+AFTER UPDATE ON inventory
+FOR EACH ROW
+BEGIN
+    UPDATE inventory_status
+    SET current_stock = NEW.quantity,
+        min_stock_level = NEW.min_stock_level,
+        max_stock_level = NEW.max_stock_level
+    WHERE product_id = NEW.product_id;
+END //
+DELIMITER ;
+
+DROP TRIGGER IF EXISTS after_inventory_delete_status;
+DELIMITER //
+CREATE TRIGGER after_inventory_delete_status
+AFTER DELETE ON inventory
+FOR EACH ROW
+BEGIN
+    UPDATE inventory_status
+    SET current_stock = 0, min_stock_level = NULL, max_stock_level = NULL
+    WHERE product_id = OLD.product_id;
+END //
+DELIMITER ;
+
+-- 保留原视图名供外部报表使用，改为直接读取汇总表
+CREATE OR REPLACE VIEW product_inventory_status AS
+SELECT product_id, product_name, price, category, current_stock, stock_status
+FROM inventory_status;
@@ -0,0 +1,7 @@
+-- 下单改为批量写入（checkout.py）：一条带条件的 UPDATE ... JOIN 扣减库存，一条 INSERT ... SELECT 写库存日志
+-- 删除明细表上逐行扣减库存和写日志的触发器，否则库存会被扣减两次、日志重复
+
+DROP TRIGGER IF EXISTS sales_reduce_inventory;
+DROP TRIGGER IF EXISTS sales_reduce_inventory_step;
+DROP TRIGGER IF EXISTS after_sales_order_item_insert;
+DROP TRIGGER IF EXISTS after_sales_order_item_insert_log;
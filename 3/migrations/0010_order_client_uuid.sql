@@ -0,0 +1,6 @@
+-- 离线订单的幂等键：收银台离线时在本地生成 UUID，恢复连接后同步到服务器
+-- 唯一索引保证同一个离线订单重复同步时不会生成两张订单
+
+ALTER TABLE sales_orders
+    ADD COLUMN client_uuid CHAR(36) NULL DEFAULT NULL,
+    ADD UNIQUE INDEX uq_sales_orders_client_uuid (client_uuid);
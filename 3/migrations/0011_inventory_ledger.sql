@@ -0,0 +1,23 @@
+-- 库存账本（inventory_ledger.py）：inventory_logs 作为只追加的变动表，定期为每个商品保存快照
+-- 账本库存 = 快照数量 + 快照之后的变动之和；log_id 为快照包含的最后一条变动
+-- inventory_logs 上已有的 product_id 索引（隐含主键 id）即可按 (product_id, id) 范围扫描快照之后的变动
+
+CREATE TABLE IF NOT EXISTS inventory_snapshots (
+    product_id INT NOT NULL PRIMARY KEY,
+    quantity INT NOT NULL,
+    log_id INT NOT NULL DEFAULT 0,
+    taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 以当前库存作为账本的期初快照，之前的日志只作为历史记录
+INSERT IGNORE INTO inventory_snapshots (product_id, quantity, log_id)
+SELECT i.product_id, i.quantity, (SELECT IFNULL(MAX(id), 0) FROM inventory_logs)
+FROM inventory i;
+
+-- 删除剩余的逐行触发器：每插入一行都要单独查询 inventory 再写日志
+-- 库存变动改为由程序在同一个事务中批量写入 inventory、products.stock 和 inventory_logs
+DROP TRIGGER IF EXISTS after_stock_in_complete;
+DROP TRIGGER IF EXISTS after_stock_in_complete_log;
+DROP TRIGGER IF EXISTS after_stock_out_item_insert;
+DROP TRIGGER IF EXISTS after_stock_out_item_insert_log;
@@ -0,0 +1,47 @@
+-- 库存日志按月分区（log_archive.py 负责建立新分区和归档旧分区）
+-- 分区名为 pYYYYMM，存放该月的日志；p_future 存放尚未建立分区的月份
+-- 分区表不支持外键，且主键必须包含分区列：删除 product_id 外键，主键改为 (id, created_at)
+-- (created_at, id) 索引与日志表格按时间倒序的键集分页一致，按日期范围筛选时只扫描相关分区
+
+-- 外键名由服务器生成，从 information_schema 中查出后删除
+SET @fk = (
+    SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'inventory_logs' AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    LIMIT 1
+);
+SET @sql = IF(@fk IS NULL, 'DO 0', CONCAT('ALTER TABLE inventory_logs DROP FOREIGN KEY `', @fk, '`'));
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+UPDATE inventory_logs SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE inventory_logs
+    MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at),
+    ADD INDEX idx_inventory_logs_created_at (created_at, id);
+
+-- 从最早的日志所在月份到三个月之后，每月一个分区
+SET SESSION group_concat_max_len = 1000000;
+SET @partitions = (
+    WITH RECURSIVE months (m) AS (
+        SELECT CAST(DATE_FORMAT(IFNULL(MIN(created_at), CURRENT_DATE), '%Y-%m-01') AS DATE) FROM inventory_logs
+        UNION ALL
+        SELECT m + INTERVAL 1 MONTH FROM months
+        WHERE m < CAST(DATE_FORMAT(CURRENT_DATE, '%Y-%m-01') AS DATE) + INTERVAL 3 MONTH
+    )
+    SELECT GROUP_CONCAT(
+        CONCAT('PARTITION p', DATE_FORMAT(m, '%Y%m'),
+               ' VALUES LESS THAN (UNIX_TIMESTAMP(''', m + INTERVAL 1 MONTH, '''))')
+        ORDER BY m SEPARATOR ', '
+    )
+    FROM months
+);
+SET @sql = CONCAT(
+    'ALTER TABLE inventory_logs PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (',
+    @partitions, ', PARTITION p_future VALUES LESS THAN MAXVALUE)'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,10 @@
+-- 日终库存快照（inventory_ledger.take_daily_snapshots 每天生成一次）：某天的快照为次日零点时的库存
+-- 查询任意时间点的库存时从最近的快照出发，只重放不超过半天的库存日志
+-- 只保存库存不为0的商品，没有记录的商品当时库存为0
+
+CREATE TABLE IF NOT EXISTS inventory_daily_snapshots (
+    snapshot_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity INT NOT NULL,
+    PRIMARY KEY (snapshot_date, product_id)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
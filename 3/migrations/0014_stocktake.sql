@@ -0,0 +1,23 @@
+-- 库存盘点（stocktake.py）：导入的盘点数量先写入暂存表，差异和库存更新都用关联语句批量完成
+-- book_quantity 为应用盘点时在锁内记下的账面数量，用于计算差异和写库存日志
+
+CREATE TABLE IF NOT EXISTS stocktakes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    status ENUM('draft', 'applied', 'cancelled') NOT NULL DEFAULT 'draft',
+    notes TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    applied_at TIMESTAMP NULL
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS stocktake_counts (
+    stocktake_id INT NOT NULL,
+    product_id INT NOT NULL,
+    counted INT NOT NULL,
+    book_quantity INT NULL,
+    PRIMARY KEY (stocktake_id, product_id),
+    FOREIGN KEY (stocktake_id) REFERENCES stocktakes(id) ON DELETE CASCADE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4;
+
+-- 在末尾追加枚举值只修改表定义，不重建分区表
+ALTER TABLE inventory_logs
+    MODIFY reference_type ENUM('stock_in', 'stock_out', 'adjustment', 'sales_order', 'stocktake') NOT NULL;
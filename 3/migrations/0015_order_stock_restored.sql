@@ -0,0 +1,12 @@
+-- 批量取消订单（order_status.py）：取消时由程序批量恢复库存，stock_restored_at 记录库存已经恢复，避免重复恢复
+-- 删除 sales_orders 上的取消触发器：它引用了日志表中不存在的列，并且会与程序重复恢复库存
+
+DROP TRIGGER IF EXISTS after_sales_order_cancel;
+
+ALTER TABLE sales_orders
+    ADD COLUMN stock_restored_at TIMESTAMP NULL DEFAULT NULL;
+
+-- 已经取消的订单在取消时已经恢复过库存（保持 updated_at 不变）
+UPDATE sales_orders
+SET stock_restored_at = updated_at, updated_at = updated_at
+WHERE status = 'cancelled';
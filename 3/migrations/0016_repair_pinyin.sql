@@ -0,0 +1,14 @@
+-- 没有安装 pypinyin 时写入的拼音列只包含名称中的字母和数字，汉字部分缺失，拼音检索永远匹配不到
+-- 首字母列比名称中的汉字、字母和数字少的行清空拼音列，由 pinyin_index.backfill 重新计算（保持 updated_at 不变）
+
+UPDATE products
+SET name_pinyin = NULL, name_initials = NULL, updated_at = updated_at
+WHERE name_initials IS NOT NULL
+  AND name REGEXP '[\\x{3400}-\\x{9fff}]'
+  AND CHAR_LENGTH(name_initials) < LEAST(CHAR_LENGTH(REGEXP_REPLACE(name, '[^0-9A-Za-z\\x{3400}-\\x{9fff}]', '')), 64);
+
+UPDATE customers
+SET name_pinyin = NULL, name_initials = NULL, updated_at = updated_at
+WHERE name_initials IS NOT NULL
+  AND name REGEXP '[\\x{3400}-\\x{9fff}]'
+  AND CHAR_LENGTH(name_initials) < LEAST(CHAR_LENGTH(REGEXP_REPLACE(name, '[^0-9A-Za-z\\x{3400}-\\x{9fff}]', '')), 64);
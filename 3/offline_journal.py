@@ -0,0 +1,202 @@
+import datetime
+import json
+import os
+import sqlite3
+import uuid
+from decimal import Decimal
+
+from mysql.connector import Error
+
+from checkout import InsufficientStockError, find_shortages, merge_lines, write_order
+from db_pool import is_connection_error, is_lock_conflict
+
+# 本地订单日志文件，与程序放在同一目录
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_orders.db")
+
+
+class OfflineJournal:
+    """数据库不可用时保存订单的本地SQLite日志
+
+    每个离线订单有一个本地生成的 UUID，同步时写入 sales_orders.client_uuid（唯一索引），
+    同一订单无论同步多少次服务器上都只有一张。订单状态：
+    pending 待同步 / synced 已同步 / conflict 同步时库存不足或写入出错，等待处理。
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS offline_orders (
+                    uuid TEXT PRIMARY KEY,
+                    customer_id INTEGER,
+                    lines TEXT NOT NULL,
+                    total TEXT NOT NULL,
+                    discount TEXT NOT NULL,
+                    final_total TEXT NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    server_order_id INTEGER,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_offline_orders_status ON offline_orders (status, created_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """创建数据库连接，每次操作使用独立连接，可以在任意线程中调用"""
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, customer_id, lines, total, discount, final_total, payment_method):
+        """保存一个离线订单，lines 为 [(商品ID, 数量, 单价)]，返回订单的 UUID"""
+        order_uuid = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO offline_orders (uuid, customer_id, lines, total, discount, final_total, "
+                "payment_method, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    order_uuid, customer_id,
+                    json.dumps([[int(product_id), int(quantity), str(price)] for product_id, quantity, price in lines]),
+                    str(total), str(discount), str(final_total), payment_method,
+                    datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                )
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return order_uuid
+
+    def pending(self, limit):
+        """按下单时间返回最早的 limit 个待同步订单"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT uuid, customer_id, lines, total, discount, final_total, payment_method, created_at "
+                "FROM offline_orders WHERE status = 'pending' ORDER BY created_at, rowid LIMIT ?",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                'uuid': row[0],
+                'customer_id': row[1],
+                'lines': [(product_id, quantity, Decimal(price)) for product_id, quantity, price in json.loads(row[2])],
+                'total': Decimal(row[3]),
+                'discount': Decimal(row[4]),
+                'final_total': Decimal(row[5]),
+                'payment_method': row[6],
+                'created_at': row[7]
+            }
+            for row in rows
+        ]
+
+    def counts(self):
+        """返回各状态的订单数 {状态: 数量}"""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM offline_orders GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    def conflicts(self):
+        """返回同步时库存不足的订单 [(uuid, 下单时间, 原因)]"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT uuid, created_at, error FROM offline_orders WHERE status = 'conflict' ORDER BY created_at"
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def retry_conflicts(self):
+        """把库存冲突的订单重新标记为待同步（例如补货之后），返回订单数"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("UPDATE offline_orders SET status = 'pending', error = NULL WHERE status = 'conflict'")
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def record(self, synced, conflicts):
+        """记录一批同步结果，synced 为 [(uuid, 服务器订单号)]，conflicts 为 [(uuid, 原因)]"""
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "UPDATE offline_orders SET status = 'synced', server_order_id = ?, error = NULL WHERE uuid = ?",
+                [(order_id, order_uuid) for order_uuid, order_id in synced]
+            )
+            conn.executemany(
+                "UPDATE offline_orders SET status = 'conflict', error = ? WHERE uuid = ?",
+                [(error, order_uuid) for order_uuid, error in conflicts]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def sync_journal(db, journal, batch_size=50):
+    """把待同步的离线订单批量写入MySQL，返回 (同步数, 冲突数)
+
+    每批订单在一个事务中写入，每个订单使用一个保存点：库存不足或写入出错（例如商品、客户
+    在离线期间被删除）的订单只回滚自己，记为冲突，其余订单照常提交。连接断开、死锁等
+    影响整个事务的错误仍然回滚整批，下次重试。已经同步过的 UUID（例如上次提交后没来得及记录）直接标记为已同步。
+    在后台线程中执行。
+    """
+    synced_total = conflict_total = 0
+    while True:
+        entries = journal.pending(batch_size)
+        if not entries:
+            return synced_total, conflict_total
+
+        placeholders = ", ".join(["%s"] * len(entries))
+        existing = {
+            row['client_uuid']: row['id']
+            for row in db.query(
+                f"SELECT id, client_uuid FROM sales_orders WHERE client_uuid IN ({placeholders})",
+                [entry['uuid'] for entry in entries]
+            )
+        }
+
+        def work(cursor):
+            synced = []
+            conflicts = []
+            for entry in entries:
+                if entry['uuid'] in existing:
+                    synced.append((entry['uuid'], existing[entry['uuid']]))
+                    continue
+                lines = merge_lines(entry['lines'])
+                cursor.execute("SAVEPOINT offline_order")
+                try:
+                    order_id = write_order(
+                        cursor, entry['customer_id'], lines, entry['total'], entry['discount'],
+                        entry['final_total'], entry['payment_method'],
+                        client_uuid=entry['uuid'], created_at=entry['created_at']
+                    )
+                except InsufficientStockError:
+                    cursor.execute("ROLLBACK TO SAVEPOINT offline_order")
+                    shortages = find_shortages(db, lines)
+                    conflicts.append((entry['uuid'], "; ".join(
+                        f"商品 {product_id} 需要 {quantity}，库存 {'无' if stock is None else stock}"
+                        for product_id, quantity, stock in shortages
+                    )))
+                except (Error, ValueError) as e:
+                    if isinstance(e, Error) and (is_connection_error(e) or is_lock_conflict(e)):
+                        raise
+                    cursor.execute("ROLLBACK TO SAVEPOINT offline_order")
+                    conflicts.append((entry['uuid'], f"写入订单失败: {e}"))
+                else:
+                    cursor.execute("RELEASE SAVEPOINT offline_order")
+                    synced.append((entry['uuid'], order_id))
+            return synced, conflicts
+
+        synced, conflicts = db.run_transaction(work)
+        # 事务提交后再记录结果；记录失败时下次同步会按 UUID 识别出已同步的订单
+        journal.record(synced, conflicts)
+        synced_total += len(synced)
+        conflict_total += len(conflicts)
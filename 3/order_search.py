@@ -0,0 +1,68 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from customer_search import customer_search_condition
+
+ORDER_STATUSES = ("pending", "completed", "cancelled")
+PAYMENT_METHODS = ("cash", "card", "online")
+
+
+def parse_date(text):
+    """解析 YYYY-MM-DD 格式的日期，空字符串返回None，格式错误时抛出 ValueError"""
+    text = text.strip()
+    if not text:
+        return None
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def parse_amount(text):
+    """解析金额，空字符串返回None，格式错误时抛出 ValueError"""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"无效的金额: {text}")
+
+
+def order_filter_condition(order_id=None, customer=None, status=None, payment_method=None,
+                           date_from=None, date_to=None, min_amount=None, max_amount=None):
+    """把订单筛选条件组合成 (条件SQL, 参数)，没有任何条件时返回 (None, ())
+
+    条件之间用 AND 连接，并且都直接比较索引列，不对列做函数运算：
+    订单号走主键，状态/客户/支付方式分别对应 (列, created_at) 组合索引（见迁移
+    0007_order_filter_indexes），日期范围是 created_at 上的范围条件，与表格按下单时间的键集分页一致。
+    客户按 customer_search_condition 的规则先在 customers 上用各自的索引查出ID。
+    """
+    conditions = []
+    params = []
+    if order_id is not None:
+        conditions.append("so.id = %s")
+        params.append(order_id)
+    if customer:
+        _, condition, customer_params = customer_search_condition(customer)
+        conditions.append(f"so.customer_id IN (SELECT id FROM customers WHERE {condition})")
+        params.extend(customer_params)
+    if status:
+        conditions.append("so.status = %s")
+        params.append(status)
+    if payment_method:
+        conditions.append("so.payment_method = %s")
+        params.append(payment_method)
+    if date_from is not None:
+        conditions.append("so.created_at >= %s")
+        params.append(datetime.datetime.combine(date_from, datetime.time.min))
+    if date_to is not None:
+        # 包含结束日期当天
+        conditions.append("so.created_at < %s")
+        params.append(datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min))
+    if min_amount is not None:
+        conditions.append("so.final_amount >= %s")
+        params.append(min_amount)
+    if max_amount is not None:
+        conditions.append("so.final_amount <= %s")
+        params.append(max_amount)
+    if not conditions:
+        return None, ()
+    return " AND ".join(conditions), tuple(params)
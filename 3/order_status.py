@@ -0,0 +1,114 @@
+"""批量更新订单状态
+
+取消订单时恢复库存：按批次用一条 INSERT ... SELECT 写库存日志、一条 UPDATE ... JOIN 恢复库存、
+一条 UPDATE 同步 products.stock，语句条数与订单数和商品行数无关。
+sales_orders.stock_restored_at（迁移 0015）记录库存已经恢复，同一订单的库存只会恢复一次。
+"""
+from order_search import ORDER_STATUSES
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def update_order_statuses(db, order_ids, new_status):
+    """在一个事务中把订单改为 new_status，返回 (状态有变化的订单ID, 恢复了库存的商品ID)
+
+    已取消的订单不能再更新，状态相同的订单跳过。订单和库存行都按ID顺序加锁，
+    与下单的加锁顺序一致；发生死锁时整个事务重试。
+    """
+    if new_status not in ORDER_STATUSES:
+        raise ValueError(f"无效的订单状态: {new_status}")
+    order_ids = sorted({int(order_id) for order_id in order_ids})
+    if not order_ids:
+        return [], []
+
+    def work(cursor):
+        cursor.execute(
+            f"SELECT id, status, stock_restored_at FROM sales_orders WHERE id IN ({_placeholders(order_ids)}) "
+            "ORDER BY id FOR UPDATE",
+            order_ids
+        )
+        orders = [row for row in cursor.fetchall() if row['status'] not in ('cancelled', new_status)]
+        changed = [row['id'] for row in orders]
+        if not changed:
+            return [], []
+
+        restored_products = []
+        if new_status == 'cancelled':
+            # 订单行已加锁，stock_restored_at 为空的订单库存还没有恢复过
+            restore = [row['id'] for row in orders if row['stock_restored_at'] is None]
+            if restore:
+                restored_products = restore_stock(cursor, restore)
+            cursor.execute(
+                f"UPDATE sales_orders SET status = 'cancelled', "
+                f"stock_restored_at = IFNULL(stock_restored_at, CURRENT_TIMESTAMP) WHERE id IN ({_placeholders(changed)})",
+                changed
+            )
+        else:
+            cursor.execute(
+                f"UPDATE sales_orders SET status = %s WHERE id IN ({_placeholders(changed)})",
+                [new_status] + changed
+            )
+        return changed, restored_products
+
+    return db.run_transaction(work)
+
+
+def restore_stock(cursor, order_ids):
+    """在调用方的事务中把订单的商品数量加回库存，返回涉及的商品ID
+
+    调用方负责锁定订单并保证这些订单的库存没有恢复过。
+    """
+    ids = _placeholders(order_ids)
+    cursor.execute(
+        f"SELECT DISTINCT product_id FROM sales_order_items WHERE order_id IN ({ids}) ORDER BY product_id",
+        order_ids
+    )
+    product_ids = [row['product_id'] for row in cursor.fetchall()]
+    if not product_ids:
+        return []
+    cursor.execute(
+        f"SELECT product_id FROM inventory WHERE product_id IN ({_placeholders(product_ids)}) "
+        "ORDER BY product_id FOR UPDATE",
+        product_ids
+    )
+    cursor.fetchall()
+
+    # 先写日志：同一商品出现在多个订单中时，按订单顺序累加得到每条日志的前后数量
+    cursor.execute(f"""
+        INSERT INTO inventory_logs (
+            product_id, change_type, quantity, quantity_change, reference_id,
+            reference_type, before_quantity, after_quantity, notes
+        )
+        SELECT
+            product_id, 'adjustment', quantity, quantity, order_id,
+            'sales_order', base + restored - quantity, base + restored, CONCAT('订单 #', order_id, ' 已取消')
+        FROM (
+            SELECT
+                soi.product_id, soi.order_id, soi.quantity, i.quantity AS base,
+                SUM(soi.quantity) OVER (
+                    PARTITION BY soi.product_id ORDER BY soi.order_id, soi.id ROWS UNBOUNDED PRECEDING
+                ) AS restored
+            FROM sales_order_items soi
+            JOIN inventory i ON i.product_id = soi.product_id
+            WHERE soi.order_id IN ({ids})
+        ) restored_lines
+    """, order_ids)
+    cursor.execute(f"""
+        UPDATE inventory i
+        JOIN (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM sales_order_items
+            WHERE order_id IN ({ids})
+            GROUP BY product_id
+        ) r ON r.product_id = i.product_id
+        SET i.quantity = i.quantity + r.quantity
+    """, order_ids)
+    cursor.execute(f"""
+        UPDATE products p
+        JOIN inventory i ON i.product_id = p.id
+        SET p.stock = i.quantity
+        WHERE p.id IN ({_placeholders(product_ids)})
+    """, product_ids)
+    return product_ids
@@ -0,0 +1,188 @@
+from collections import OrderedDict
+from tkinter import ttk
+
+from customer_search import customer_search_condition, phone_digits
+from pinyin_index import is_pinyin_query, pinyin_condition
+
+# 下拉列表末尾用于加载下一页的选项
+MORE_ITEM = "更多..."
+# 不触发查询的按键
+_NAVIGATION_KEYS = {"Up", "Down", "Return", "KP_Enter", "Escape", "Tab", "Left", "Right", "Home", "End"}
+
+
+class LRUCache:
+    """最近使用的条目，超出 maxsize 时淘汰最久未使用的"""
+
+    def __init__(self, maxsize=50):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+    def values(self):
+        """按最近使用在前的顺序返回所有条目"""
+        return list(reversed(self._items.values()))
+
+
+def _prefix_keyset(condition, params, after, limit, table, columns):
+    """在 condition 的结果中按 (name, id) 的键集分页，after 为上一页最后一行"""
+    conditions = [f"({condition})"]
+    params = list(params)
+    if after is not None:
+        conditions.append("(name > %s OR (name = %s AND id > %s))")
+        params.extend((after['name'], after['name'], after['id']))
+    params.append(limit)
+    return f"""
+        SELECT {columns} FROM {table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY name, id
+        LIMIT %s
+    """, params
+
+
+def customer_picker_query(text, after=None, limit=20):
+    """客户选择框的分页查询，返回 (SQL, 参数)
+
+    数字按完整号码或号码后几位、字母按拼音/首字母、其他输入按名称前缀检索，都使用索引
+    """
+    digits = phone_digits(text)
+    if digits:
+        _, condition, params = customer_search_condition(digits)
+    elif is_pinyin_query(text):
+        condition, params = pinyin_condition(text)
+    else:
+        condition, params = "name LIKE %s", (f"{text}%",)
+    return _prefix_keyset(condition, params, after, limit, "customers", "id, name, phone")
+
+
+def product_picker_query(text, after=None, limit=20):
+    """商品选择框的分页查询，返回 (SQL, 参数)
+
+    数字先按条码精确匹配，字母按拼音/首字母、其他输入按名称前缀检索，都使用索引
+    """
+    if text.isdigit():
+        condition, params = "barcode = %s OR name LIKE %s", (text, f"{text}%")
+    elif is_pinyin_query(text):
+        condition, params = pinyin_condition(text)
+    else:
+        condition, params = "name LIKE %s", (f"{text}%",)
+    return _prefix_keyset(condition, params, after, limit, "products", "id, name, price")
+
+
+class AutocompletePicker:
+    """输入时按前缀分页查询数据库的下拉选择框
+
+    打开时只显示最近使用的条目（recent，多个对话框共享），不查询数据库；
+    输入停止 delay 毫秒后在后台查询第一页，选择末尾的“更多...”时按键集加载下一页。
+    选中的条目加入 recent。数据库不可用时用 fallback(文本) 返回的条目代替。
+    """
+
+    def __init__(self, parent, runner, db, make_query, format_item, recent,
+                 width=30, page_size=20, delay=250, fallback=None):
+        self.runner = runner
+        self.db = db
+        self.make_query = make_query
+        self.format_item = format_item
+        self.recent = recent
+        self.page_size = page_size
+        self.delay = delay
+        self.fallback = fallback
+        # 每个选择框使用自己的查询 key，新的输入会取消尚未完成的旧查询
+        self.key = f"picker.{id(self)}"
+
+        self.combo = ttk.Combobox(parent, width=width)
+        self.combo.bind("<KeyRelease>", self._on_key)
+        self.combo.bind("<<ComboboxSelected>>", self._on_selected)
+        self.combo.bind("<Destroy>", self._on_destroy)
+
+        # 下拉列表中显示的文本 -> 条目
+        self._items = {}
+        self._text = ""
+        self._last = None
+        self._has_more = False
+        self._pending = None
+        self._show(self.recent.values(), more=False)
+
+    def pack(self, **kwargs):
+        self.combo.pack(**kwargs)
+
+    def selected(self):
+        """返回当前选中的条目，输入框中的文本不是列表中的条目时返回None"""
+        return self._items.get(self.combo.get())
+
+    def remember(self, item):
+        """把条目记为最近使用"""
+        self.recent.put(item['id'], item)
+
+    def _show(self, items, more, append=False):
+        if not append:
+            self._items = {}
+        for item in items:
+            self._items[self.format_item(item)] = item
+        self._has_more = more
+        values = list(self._items)
+        self.combo['values'] = values + [MORE_ITEM] if more else values
+
+    def _on_key(self, event):
+        if event.keysym in _NAVIGATION_KEYS:
+            return
+        if self._pending is not None:
+            self.combo.after_cancel(self._pending)
+        self._pending = self.combo.after(self.delay, self._search)
+
+    def _search(self):
+        self._pending = None
+        text = self.combo.get().strip()
+        self._text = text
+        if not text:
+            self.runner.cancel(self.key)
+            self._show(self.recent.values(), more=False)
+            return
+        self._fetch(text, None)
+
+    def _fetch(self, text, after):
+        sql, params = self.make_query(text, after, self.page_size + 1)
+
+        def on_result(rows):
+            more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            if rows:
+                self._last = rows[-1]
+            self._show(rows, more, append=after is not None)
+
+        def on_error(e):
+            if self.fallback is not None:
+                self._show(self.fallback(text), more=False)
+
+        self.runner.submit(self.key, lambda: self.db.query(sql, params), on_error=on_error, on_result=on_result)
+
+    def _on_destroy(self, event):
+        # 对话框关闭时停止等待中的输入和尚未完成的查询，避免结果写入已销毁的选择框
+        if self._pending is not None:
+            self.combo.after_cancel(self._pending)
+            self._pending = None
+        self.runner.cancel(self.key)
+
+    def _on_selected(self, event):
+        if self.combo.get() == MORE_ITEM:
+            # 恢复输入的文本并加载下一页
+            self.combo.set(self._text)
+            if self._has_more and self._last is not None:
+                self._fetch(self._text, self._last)
+            return
+        item = self.selected()
+        if item is not None:
+            self.remember(item)
@@ -0,0 +1,90 @@
+import re
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    # 没有安装 pypinyin（见 requirements.txt）时只索引不含汉字的名称，
+    # 含汉字的名称不写拼音列，安装后由 backfill 补齐
+    lazy_pinyin = None
+
+# 与迁移 0005_pinyin_index 中的列长度一致
+PINYIN_MAX_LENGTH = 320
+INITIALS_MAX_LENGTH = 64
+
+# 需要维护拼音索引的表
+PINYIN_TABLES = ("products", "customers")
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_CJK = re.compile(r"[\u3400-\u9fff]")
+_PINYIN_QUERY = re.compile(r"^[a-z]+$")
+# 非汉字片段的标记，用于区分 lazy_pinyin 返回的拼音和原样保留的文字
+_RAW = "\x00"
+
+
+def _normalize(text):
+    return _NON_ALNUM.sub("", text.lower())
+
+
+def to_pinyin(name):
+    """返回名称的 (全拼, 首字母)，例如 "矿泉水D" -> ("kuangquanshuid", "kqsd")
+
+    名称中的字母和数字原样保留在两列中，所以英文名称同样可以按前缀检索。
+    没有安装 pypinyin 时含汉字的名称返回 (None, None)，不写入只有字母部分的不完整拼音
+    """
+    name = name or ""
+    if lazy_pinyin is None:
+        if _CJK.search(name):
+            return None, None
+        text = _normalize(name)
+        return text[:PINYIN_MAX_LENGTH], text[:INITIALS_MAX_LENGTH]
+
+    full = []
+    initials = []
+    for part in lazy_pinyin(name, style=Style.NORMAL, errors=lambda s: [_RAW + s]):
+        if part.startswith(_RAW):
+            text = _normalize(part[1:])
+            full.append(text)
+            initials.append(text)
+        else:
+            full.append(part)
+            initials.append(part[:1])
+    return "".join(full)[:PINYIN_MAX_LENGTH], "".join(initials)[:INITIALS_MAX_LENGTH]
+
+
+def is_pinyin_query(text):
+    """输入只包含字母时按拼音/首字母检索"""
+    return bool(_PINYIN_QUERY.match(text))
+
+
+def pinyin_condition(text, alias=""):
+    """拼音或首字母前缀匹配的条件，返回 (SQL, 参数)，两列上都有索引"""
+    prefix = f"{alias}." if alias else ""
+    pattern = f"{text.lower()}%"
+    return f"({prefix}name_initials LIKE %s OR {prefix}name_pinyin LIKE %s)", (pattern, pattern)
+
+
+def backfill(db, table, batch_size=500):
+    """为还没有拼音索引的行补充拼音，返回处理的行数
+
+    每批在一个事务中更新，可以在后台反复执行，已经有拼音的行不会被重复处理；
+    没有安装 pypinyin 时跳过含汉字的名称，安装后再次执行时补齐
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(
+            f"SELECT id, name FROM {table} WHERE name_pinyin IS NULL AND id > %s ORDER BY id LIMIT %s",
+            (last_id, batch_size)
+        )
+        if not rows:
+            return total
+        updates = [to_pinyin(row['name']) + (row['id'],) for row in rows]
+        updates = [update for update in updates if update[0] is not None]
+        if updates:
+            with db.transaction() as cursor:
+                cursor.executemany(
+                    f"UPDATE {table} SET name_pinyin = %s, name_initials = %s WHERE id = %s",
+                    updates
+                )
+        total += len(updates)
+        last_id = rows[-1]['id']
@@ -0,0 +1,109 @@
+import re
+
+from pinyin_index import is_pinyin_query
+
+# 与服务器的 ngram_token_size 一致（MySQL 默认为2）
+NGRAM_TOKEN_SIZE = 2
+
+# 布尔模式中有特殊含义的字符
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+
+# 商品名称和分类上的 ngram 全文索引（见迁移 0004_product_fulltext）
+MATCH_EXPR = "MATCH(p.name, p.category) AGAINST (%s IN BOOLEAN MODE)"
+
+# 拼音/首字母前缀命中的相关度，排在全文检索结果之前
+PINYIN_RELEVANCE = 1000
+
+
+def fulltext_query(text):
+    """把用户输入转换成布尔模式的全文检索条件，每个词都必须出现
+
+    比分词长度短的词（如单个汉字）无法组成完整的 ngram，改用前缀匹配。
+    输入中没有可检索的词时返回None。
+    """
+    terms = _BOOLEAN_OPERATORS.sub(" ", text).split()
+    if not terms:
+        return None
+    parts = []
+    for term in terms:
+        if len(term) < NGRAM_TOKEN_SIZE:
+            parts.append(f"+{term}*")
+        else:
+            parts.append(f"+{term}")
+    return " ".join(parts)
+
+
+def product_search_select(text):
+    """按相关度检索商品的查询，返回 (SQL, 参数)
+
+    结果包含 products 的所有列和相关度 relevance，作为派生表供表格继续筛选、排序和分页。
+    只有字母的输入同时按拼音和首字母前缀检索，各个分支分别使用自己的索引
+    """
+    query = fulltext_query(text)
+    if query is None:
+        return None
+    if is_pinyin_query(text):
+        pattern = f"{text.lower()}%"
+        sql = f"""
+            SELECT * FROM (
+                SELECT p.*, hits.relevance
+                FROM products p
+                JOIN (
+                    SELECT id, MAX(relevance) AS relevance FROM (
+                        SELECT id, {PINYIN_RELEVANCE} AS relevance FROM products WHERE name_initials LIKE %s
+                        UNION ALL
+                        SELECT id, {PINYIN_RELEVANCE} AS relevance FROM products WHERE name_pinyin LIKE %s
+                        UNION ALL
+                        SELECT p.id, {MATCH_EXPR} AS relevance FROM products p WHERE {MATCH_EXPR}
+                    ) AS matches
+                    GROUP BY id
+                ) AS hits ON hits.id = p.id
+            ) AS matched
+        """
+        return sql, (pattern, pattern, query, query)
+    sql = f"""
+        SELECT * FROM (
+            SELECT p.*, {MATCH_EXPR} AS relevance
+            FROM products p
+            WHERE {MATCH_EXPR}
+        ) AS matched
+    """
+    return sql, (query, query)
+
+
+def product_matcher(text):
+    """与 product_search_select 条件一致的内存匹配函数，参数为商品行
+
+    用于关键字在上一次的基础上继续输入时，直接在已加载的结果中缩小范围
+    """
+    terms = _BOOLEAN_OPERATORS.sub(" ", text).lower().split()
+    prefix = text.lower() if is_pinyin_query(text) else None
+
+    def matches(row):
+        if prefix and ((row.get('name_initials') or "").startswith(prefix)
+                       or (row.get('name_pinyin') or "").startswith(prefix)):
+            return True
+        haystack = f"{row.get('name') or ''} {row.get('category') or ''}".lower()
+        return all(term in haystack for term in terms)
+
+    return matches
+
+
+def inventory_search_select(text):
+    """按相关度检索库存状态的查询，返回 (SQL, 参数)
+
+    全文索引在 products 上，先在 products 上检索再按主键关联库存状态汇总表 inventory_status。
+    与 product_search_select 一样作为派生表，供表格继续筛选、排序和分页
+    """
+    query = fulltext_query(text)
+    if query is None:
+        return None
+    sql = f"""
+        SELECT * FROM (
+            SELECT s.*, {MATCH_EXPR} AS relevance
+            FROM products p
+            JOIN inventory_status s ON s.product_id = p.id
+            WHERE {MATCH_EXPR}
+        ) AS matched
+    """
+    return sql, (query, query)
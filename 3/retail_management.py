@@ -1,23 +1,75 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import mysql.connector
 from mysql.connector import Error
 import datetime
+from decimal import Decimal
 import os
+import time
+
+import migrations
+from async_query import QueryRunner
+from barcode_cache import BarcodeCache
+from cart import Cart
+from checkout import InsufficientStockError, checkout
+from customer_search import PHONE_LENGTH, customer_matcher, customer_search_condition
+from db_pool import Database, is_connection_error
+from inventory_ledger import (
+    find_drift, open_stock, reconcile, set_stock, stock_as_of_query, take_daily_snapshots, take_snapshots
+)
+from log_archive import maintain_partitions
+from offline_journal import OfflineJournal, sync_journal
+from order_search import (
+    ORDER_STATUSES, PAYMENT_METHODS, order_filter_condition, parse_amount, parse_date
+)
+from order_status import update_order_statuses
+from pickers import AutocompletePicker, LRUCache, customer_picker_query, product_picker_query
+from pinyin_index import PINYIN_TABLES, backfill, is_pinyin_query, to_pinyin
+from product_search import inventory_search_select, product_matcher, product_search_select
+from stocktake import apply_stocktake, create_stocktake, differences, discard_stocktake, read_counts, resolve_counts
+from virtual_grid import VirtualGrid
+
+# 数据库连接配置
+DB_CONFIG = {
+    'host': 'localhost',
+    'database': 'aa',
+    'user': 'root',
+    'password': '123123'
+}
 
 class RetailManagementSystem:
     def __init__(self, root):
+        # 启动计时，用于统计可交互时间
+        self.start_time = time.perf_counter()
         self.root = root
         self.root.title("商品零售管理系统")
         self.root.geometry("1000x600")
         
         # 数据库连接配置
-        self.db_config = {
-            'host': 'localhost',
-            'database': 'aa',
-            'user': 'root',
-            'password': '123123'
-        }
+        self.db_config = dict(DB_CONFIG)
+        # 连接池大小：界面线程和后台工作线程各自使用独立连接
+        self.db_pool_size = 5
+        # 数据访问层：创建时不连接数据库，首次使用时才建立连接
+        self.db = Database(self.db_config, pool_size=self.db_pool_size)
+        self.db_ready = False
+        
+        # 后台查询执行器：查询在工作线程中执行，结果分批交回界面线程
+        # 被新查询取代的旧查询通过 KILL QUERY 在服务器上终止
+        self.query_runner = QueryRunner(self.root, max_workers=self.db_pool_size - 1, on_cancel=self.kill_query)
+        self.db.on_execute = QueryRunner.attach_connection
+        # 扫码收银使用的条码缓存，启动完成后在后台加载
+        self.barcode_cache = BarcodeCache(self.db)
+        # 下单对话框中最近使用的客户和商品，多次打开对话框之间共享
+        self.recent_customers = LRUCache(50)
+        self.recent_products = LRUCache(50)
+        # 各表格上一次搜索的 (关键字, 检索方式)，用于判断新的关键字是否只会缩小结果
+        self.search_terms = {}
+        # 离线模式：数据库不可用时订单保存在本地日志中，恢复连接后在后台批量同步
+        self.journal = OfflineJournal()
+        self.offline = False
+        # 检查连接和同步离线订单的间隔（毫秒）
+        self.sync_interval = 30000
+        # 推进库存账本快照的间隔（毫秒）
+        self.snapshot_interval = 600000
         
         # 创建主框架
         self.main_frame = ttk.Frame(root)
@@ -30,7 +82,17 @@ class RetailManagementSystem:
         # 创建状态栏
         self.status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
-
+        
+        # 系统菜单
+        menu_bar = tk.Menu(self.root)
+        system_menu = tk.Menu(menu_bar, tearoff=0)
+        system_menu.add_command(label="数据库迁移", command=self.run_migrations)
+        system_menu.add_command(label="数据库调试", command=self.debug_database)
+        system_menu.add_command(label="离线订单", command=self.show_offline_orders)
+        system_menu.add_command(label="库存核对", command=self.check_inventory_ledger)
+        system_menu.add_command(label="库存日志分区维护", command=self.maintain_log_partitions)
+        menu_bar.add_cascade(label="系统", menu=system_menu)
+        self.root.config(menu=menu_bar)
         
         # 创建标签页
         self.tab_control = ttk.Notebook(self.main_frame)
@@ -64,500 +126,263 @@ class RetailManagementSystem:
         self.init_inventory_tab()
         self.init_supplier_tab()
         
+        # 各标签页的数据加载函数 (查询key, 加载函数)，首次切换到标签页时才加载
+        self.tab_loaders = {
+            str(self.product_tab): [("products", self.load_products)],
+            str(self.customer_tab): [("customers", self.load_customers)],
+            str(self.order_tab): [("orders", self.load_orders)],
+            str(self.inventory_tab): [
+                ("inventory", self.load_inventory_status),
+                ("inventory_logs", self.load_inventory_logs)
+            ],
+            str(self.supplier_tab): [("suppliers", self.load_suppliers)]
+        }
+        self.loaded_tabs = set()
+        self.startup_pending = set()
+        self.tab_control.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # 连接数据库
         self.connect_to_database()
+        # 定期检查连接并同步离线订单（包括上次运行时留下的）
+        self.root.after(1000, self.sync_offline_orders)
+    
+    def on_close(self):
+        """关闭窗口时停止后台查询并释放数据库连接"""
+        self.query_runner.shutdown()
+        self.db.close()
+        self.root.destroy()
     
     def connect_to_database(self):
         """连接到数据库"""
         try:
-            self.connection = mysql.connector.connect(**self.db_config)
-            self.cursor = self.connection.cursor(dictionary=True)
-            
-            if self.connection.is_connected():
+            if self.db.check():
                 self.status_var.set("数据库连接成功")
                 
-                # 初始化数据库结构
-                self.init_database_structure()
+                # 检查数据库结构版本（只需一条查询），不在启动时执行DDL
+                if not self.check_schema_version():
+                    return False
                 
-                # 修复触发器
-                self.fix_triggers()
-                
-                # 加载初始数据
-                self.load_products()
-                self.load_customers()
-                self.load_orders()
-                self.load_inventory_status()
-                self.load_suppliers()
+                self.db_ready = True
+                # 先加载当前标签页，其余标签页在界面可交互后并行预加载
+                self.start_tab_loading()
                 
                 return True
             else:
                 self.status_var.set("数据库连接失败")
                 return False
         except Error as e:
+            if is_connection_error(e):
+                # 网络或服务器暂时不可用：进入离线模式继续收银，恢复后自动同步
+                self.offline = True
+                self.status_var.set("数据库不可用，已进入离线模式：订单将保存在本地，恢复连接后自动同步")
+                return False
             self.status_var.set(f"数据库连接错误: {e}")
             messagebox.showerror("数据库连接错误", str(e))
             return False
     
-    def init_database_structure(self):
-        """初始化数据库结构，确保所有必要的表和视图都存在"""
-        try:
-            # 检查suppliers表是否存在
-            self.cursor.execute("SHOW TABLES LIKE 'suppliers'")
-            if not self.cursor.fetchone():
-                # 创建suppliers表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS suppliers (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        contact_person VARCHAR(100),
-                        phone VARCHAR(20),
-                        email VARCHAR(100),
-                        address VARCHAR(255),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-                    )
-                """)
-            
-            # 检查products表是否有必要的字段
-            self.cursor.execute("DESCRIBE products")
-            fields = self.cursor.fetchall()
-            field_names = [field['Field'] for field in fields]
-            
-            # 如果没有cost、stock等字段，则添加
-            if 'cost' not in field_names or 'stock' not in field_names or 'category' not in field_names or 'barcode' not in field_names:
-                self.cursor.execute("""
-                    ALTER TABLE products
-                    ADD COLUMN IF NOT EXISTS cost DECIMAL(10,2) DEFAULT 0.00,
-                    ADD COLUMN IF NOT EXISTS stock INT DEFAULT 0,
-                    ADD COLUMN IF NOT EXISTS category VARCHAR(50) DEFAULT '',
-                    ADD COLUMN IF NOT EXISTS barcode VARCHAR(50) DEFAULT '',
-                    ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                """)
-            
-            # 检查inventory表是否存在
-            self.cursor.execute("SHOW TABLES LIKE 'inventory'")
-            if not self.cursor.fetchone():
-                # 创建inventory表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS inventory (
-                        product_id INT NOT NULL PRIMARY KEY,
-                        quantity INT NOT NULL DEFAULT 0,
-                        min_stock_level INT DEFAULT 10,
-                        max_stock_level INT DEFAULT 100,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-                    )
-                """)
-                
-                # 初始化库存数据
-                self.cursor.execute("""
-                    INSERT INTO inventory (product_id, quantity, min_stock_level, max_stock_level)
-                    SELECT id, stock, 10, 100 FROM products
-                    ON DUPLICATE KEY UPDATE 
-                        quantity = products.stock,
-                        min_stock_level = 10,
-                        max_stock_level = 100
-                """)
-            
-            # 检查inventory_logs表是否存在
-            self.cursor.execute("SHOW TABLES LIKE 'inventory_logs'")
-            if not self.cursor.fetchone():
-                # 创建inventory_logs表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS inventory_logs (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        product_id INT NOT NULL,
-                        change_type ENUM('in', 'out', 'adjustment', 'sale') NOT NULL,
-                        quantity INT NOT NULL,
-                        quantity_change INT NOT NULL,
-                        reference_id INT,
-                        reference_type ENUM('stock_in', 'stock_out', 'adjustment', 'sales_order') NOT NULL,
-                        before_quantity INT NOT NULL,
-                        after_quantity INT NOT NULL,
-                        notes TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES products(id)
-                    )
-                """)
-            
-            # 检查inventory_logs表是否有quantity_change字段
-            self.cursor.execute("DESCRIBE inventory_logs")
-            fields = self.cursor.fetchall()
-            field_names = [field['Field'] for field in fields]
-            
-            # 如果没有quantity_change字段，则添加
-            if 'quantity_change' not in field_names:
-                self.cursor.execute("""
-                    ALTER TABLE inventory_logs
-                    ADD COLUMN quantity_change INT NOT NULL AFTER quantity
-                """)
-            
-            # 检查product_inventory_status视图是否存在
-            self.cursor.execute("SHOW TABLES LIKE 'product_inventory_status'")
-            if not self.cursor.fetchone():
-                # 创建product_inventory_status视图 - 使用与现有视图相同的列名
-                self.cursor.execute("""
-                    CREATE OR REPLACE VIEW product_inventory_status AS
-                    SELECT 
-                        p.id AS product_id,
-                        p.name AS product_name,
-                        p.price AS price,
-                        p.category AS category,
-                        IFNULL(i.quantity, 0) AS current_stock,
-                        CASE 
-                            WHEN IFNULL(i.quantity, 0) <= IFNULL(i.min_stock_level, 10) THEN '不足'
-                            WHEN IFNULL(i.quantity, 0) >= IFNULL(i.max_stock_level, 100) THEN '过多'
-                            ELSE '充足'
-                        END AS stock_status
-                    FROM 
-                        products p
-                    LEFT JOIN 
-                        inventory i ON p.id = i.product_id
-                """)
-            
-            # 检查sales_order_items表是否存在
-            self.cursor.execute("SHOW TABLES LIKE 'sales_order_items'")
-            if not self.cursor.fetchone():
-                # 创建sales_order_items表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sales_order_items (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        order_id INT NOT NULL,
-                        product_id INT NOT NULL,
-                        quantity INT NOT NULL,
-                        price DECIMAL(10, 2) NOT NULL,
-                        subtotal DECIMAL(10, 2) NOT NULL,
-                        FOREIGN KEY (product_id) REFERENCES products(id)
-                    )
-                """)
-            
-            # 创建触发器：销售订单创建后自动减少库存
-            self.cursor.execute("SHOW TRIGGERS LIKE 'after_sales_order_item_insert'")
-            if not self.cursor.fetchone():
-                try:
-                    # 使用单独的语句执行触发器创建
-                    self.cursor.execute("""
-                        CREATE TRIGGER after_sales_order_item_insert
-                        AFTER INSERT ON sales_order_items
-                        FOR EACH ROW
-                        BEGIN
-                            UPDATE inventory 
-                            SET quantity = quantity - NEW.quantity
-                            WHERE product_id = NEW.product_id;
-                            
-                            INSERT INTO inventory_logs (
-                                product_id, 
-                                change_type, 
-                                quantity, 
-                                reference_id, 
-                                reference_type,
-                                before_quantity,
-                                after_quantity,
-                                notes
-                            )
-                            SELECT 
-                                NEW.product_id,
-                                'sale',
-                                NEW.quantity,
-                                NEW.order_id,
-                                'sales_order',
-                                quantity + NEW.quantity,
-                                quantity,
-                                CONCAT('销售订单 #', NEW.order_id)
-                            FROM inventory
-                            WHERE product_id = NEW.product_id;
-                        END
-                    """)
-                except Error as e:
-                    # 尝试使用另一种方式创建触发器
-                    try:
-                        # 使用多条语句创建触发器
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_sales_order_item_insert
-                            AFTER INSERT ON sales_order_items
-                            FOR EACH ROW
-                            BEGIN
-                                UPDATE inventory 
-                                SET quantity = quantity - NEW.quantity
-                                WHERE product_id = NEW.product_id;
-                            END
-                        """)
-                        
-                        # 创建一个辅助触发器来记录日志
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_sales_order_item_insert_log
-                            AFTER INSERT ON sales_order_items
-                            FOR EACH ROW
-                            BEGIN
-                                INSERT INTO inventory_logs (
-                                    product_id, 
-                                    change_type, 
-                                    quantity, 
-                                    quantity_change,
-                                    reference_id, 
-                                    reference_type,
-                                    before_quantity,
-                                    after_quantity,
-                                    notes
-                                )
-                                SELECT 
-                                    NEW.product_id,
-                                    'sale',
-                                    NEW.quantity,
-                                    -NEW.quantity,
-                                    NEW.order_id,
-                                    'sales_order',
-                                    quantity + NEW.quantity,
-                                    quantity,
-                                    CONCAT('销售订单 #', NEW.order_id)
-                                FROM inventory
-                                WHERE product_id = NEW.product_id;
-                            END
-                        """)
-                    except Error as e2:
-                        pass
-            
-            # 创建触发器：入库完成后自动增加库存
-            self.cursor.execute("SHOW TRIGGERS LIKE 'after_stock_in_complete'")
-            if not self.cursor.fetchone():
-                try:
-                    self.cursor.execute("""
-                        CREATE TRIGGER after_stock_in_complete
-                        AFTER UPDATE ON stock_in
-                        FOR EACH ROW
-                        BEGIN
-                            IF NEW.status = 'completed' AND OLD.status != 'completed' THEN
-                                INSERT INTO inventory_logs (
-                                    product_id, 
-                                    change_type, 
-                                    quantity, 
-                                    reference_id, 
-                                    reference_type,
-                                    before_quantity,
-                                    after_quantity,
-                                    notes
-                                )
-                                SELECT 
-                                    sii.product_id,
-                                    'in',
-                                    sii.quantity,
-                                    NEW.id,
-                                    'stock_in',
-                                    IFNULL(i.quantity, 0),
-                                    IFNULL(i.quantity, 0) + sii.quantity,
-                                    CONCAT('入库单 #', NEW.id)
-                                FROM stock_in_items sii
-                                LEFT JOIN inventory i ON i.product_id = sii.product_id
-                                WHERE sii.stock_in_id = NEW.id;
-                                
-                                INSERT INTO inventory (product_id, quantity)
-                                SELECT sii.product_id, sii.quantity
-                                FROM stock_in_items sii
-                                WHERE sii.stock_in_id = NEW.id
-                                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
-                            END IF;
-                        END
-                    """)
-                except Error as e:
-                    # 尝试使用另一种方式创建触发器
-                    try:
-                        # 使用多条语句创建触发器
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_stock_in_complete
-                            AFTER UPDATE ON stock_in
-                            FOR EACH ROW
-                            BEGIN
-                                IF NEW.status = 'completed' AND OLD.status != 'completed' THEN
-                                    INSERT INTO inventory (product_id, quantity)
-                                    SELECT sii.product_id, sii.quantity
-                                    FROM stock_in_items sii
-                                    WHERE sii.stock_in_id = NEW.id
-                                    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
-                                END IF;
-                            END
-                        """)
-                        
-                        # 创建一个辅助触发器来记录日志
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_stock_in_complete_log
-                            AFTER UPDATE ON stock_in
-                            FOR EACH ROW
-                            BEGIN
-                                IF NEW.status = 'completed' AND OLD.status != 'completed' THEN
-                                    INSERT INTO inventory_logs (
-                                        product_id, 
-                                        change_type, 
-                                        quantity, 
-                                        reference_id, 
-                                        reference_type,
-                                        before_quantity,
-                                        after_quantity,
-                                        notes
-                                    )
-                                    SELECT 
-                                        sii.product_id,
-                                        'in',
-                                        sii.quantity,
-                                        NEW.id,
-                                        'stock_in',
-                                        IFNULL(i.quantity, 0),
-                                        IFNULL(i.quantity, 0) + sii.quantity,
-                                        CONCAT('入库单 #', NEW.id)
-                                    FROM stock_in_items sii
-                                    LEFT JOIN inventory i ON i.product_id = sii.product_id
-                                    WHERE sii.stock_in_id = NEW.id;
-                                END IF;
-                            END
-                        """)
-                    except Error as e2:
-                        pass
-            
-            # 创建触发器：出库后自动减少库存
-            self.cursor.execute("SHOW TRIGGERS LIKE 'after_stock_out_item_insert'")
-            if not self.cursor.fetchone():
-                try:
-                    self.cursor.execute("""
-                        CREATE TRIGGER after_stock_out_item_insert
-                        AFTER INSERT ON stock_out_items
-                        FOR EACH ROW
-                        BEGIN
-                            UPDATE inventory 
-                            SET quantity = quantity - NEW.quantity
-                            WHERE product_id = NEW.product_id;
-                            
-                            INSERT INTO inventory_logs (
-                                product_id, 
-                                change_type, 
-                                quantity, 
-                                reference_id, 
-                                reference_type,
-                                before_quantity,
-                                after_quantity,
-                                notes
-                            )
-                            SELECT 
-                                NEW.product_id,
-                                'out',
-                                NEW.quantity,
-                                NEW.stock_out_id,
-                                'stock_out',
-                                quantity + NEW.quantity,
-                                quantity,
-                                CONCAT('出库单 #', NEW.stock_out_id)
-                            FROM inventory
-                            WHERE product_id = NEW.product_id;
-                        END
-                    """)
-                except Error as e:
-                    # 尝试使用另一种方式创建触发器
-                    try:
-                        # 使用多条语句创建触发器
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_stock_out_item_insert
-                            AFTER INSERT ON stock_out_items
-                            FOR EACH ROW
-                            BEGIN
-                                UPDATE inventory 
-                                SET quantity = quantity - NEW.quantity
-                                WHERE product_id = NEW.product_id;
-                            END
-                        """)
-                        
-                        # 创建一个辅助触发器来记录日志
-                        self.cursor.execute("""
-                            CREATE TRIGGER after_stock_out_item_insert_log
-                            AFTER INSERT ON stock_out_items
-                            FOR EACH ROW
-                            BEGIN
-                                INSERT INTO inventory_logs (
-                                    product_id, 
-                                    change_type, 
-                                    quantity, 
-                                    reference_id, 
-                                    reference_type,
-                                    before_quantity,
-                                    after_quantity,
-                                    notes
-                                )
-                                SELECT 
-                                    NEW.product_id,
-                                    'out',
-                                    NEW.quantity,
-                                    NEW.stock_out_id,
-                                    'stock_out',
-                                    quantity + NEW.quantity,
-                                    quantity,
-                                    CONCAT('出库单 #', NEW.stock_out_id)
-                                FROM inventory
-                                WHERE product_id = NEW.product_id;
-                            END
-                        """)
-                    except Error as e2:
-                        pass
-            
-            # 创建存储过程：库存调整
+    def sync_offline_orders(self):
+        """在后台检查连接并同步离线订单，完成后安排下一次"""
+        counts = self.journal.counts()
+        if not self.offline and not counts.get('pending'):
+            self.root.after(self.sync_interval, self.sync_offline_orders)
+            return
+        
+        def task():
+            self.db.check()
+            return sync_journal(self.db, self.journal)
+        
+        def on_result(result):
+            synced, conflicts = result
+            was_offline = self.offline
+            self.offline = False
+            if was_offline and not self.db_ready:
+                # 启动时数据库不可用，恢复后完成正常的启动流程
+                self.connect_to_database()
+            if synced or conflicts:
+                message = f"已同步 {synced} 个离线订单"
+                if conflicts:
+                    message += f"，{conflicts} 个订单库存不足，请在 系统 -> 离线订单 中处理"
+                self.status_var.set(message)
+                # 订单表格还没有加载过时不需要刷新，打开标签页时会加载第一页
+                if self.db_ready and self.order_grid.watermark is not None:
+                    self.order_grid.refresh_changed()
+            elif was_offline:
+                self.status_var.set("数据库连接已恢复")
+            self.root.after(self.sync_interval, self.sync_offline_orders)
+        
+        def on_error(e):
+            if isinstance(e, Error) and is_connection_error(e):
+                self.offline = True
+                self.status_var.set(f"离线模式：{self.journal.counts().get('pending', 0)} 个订单等待同步")
+            else:
+                self.status_var.set(f"同步离线订单失败: {e}")
+            self.root.after(self.sync_interval, self.sync_offline_orders)
+        
+        self.query_runner.submit("offline_sync", task, on_error=on_error, on_result=on_result)
+    
+    def show_offline_orders(self):
+        """查看离线订单的同步状态和库存冲突"""
+        counts = self.journal.counts()
+        conflicts = self.journal.conflicts()
+        text = (f"待同步: {counts.get('pending', 0)}  已同步: {counts.get('synced', 0)}  "
+                f"库存冲突: {counts.get('conflict', 0)}")
+        if conflicts:
+            text += "\n\n" + "\n".join(f"{created_at}  {order_uuid[:8]}  {error}" for order_uuid, created_at, error in conflicts)
+            if messagebox.askyesno("离线订单", text + "\n\n补货后是否重新同步库存冲突的订单？"):
+                self.journal.retry_conflicts()
+                self.sync_offline_orders()
+        else:
+            messagebox.showinfo("离线订单", text)
+    
+    def take_inventory_snapshots(self):
+        """在后台推进库存账本快照并补齐日终快照，完成后安排下一次"""
+        def done(*args):
+            self.root.after(self.snapshot_interval, self.take_inventory_snapshots)
+        
+        def on_error(e):
+            if not (isinstance(e, Error) and is_connection_error(e)):
+                self.status_var.set(f"更新库存快照失败: {e}")
+            done()
+        
+        if self.offline:
+            done()
+            return
+        def task():
+            take_snapshots(self.db)
+            # 每天第一次执行时生成前一天的日终快照，其余时候只有一条查询
+            take_daily_snapshots(self.db)
+        
+        self.query_runner.submit("inventory_snapshots", task, on_error=on_error, on_result=done)
+    
+    def check_inventory_ledger(self):
+        """核对库存表、商品表库存字段和库存账本是否一致"""
+        def on_result(rows):
+            if not rows:
+                messagebox.showinfo("库存核对", "库存表、商品库存和库存账本一致")
+                return
+            details = [
+                f"商品 {row['product_id']}: 库存 {row['quantity']}, 账本 {row['ledger_quantity']}, 商品表 {row['stock']}"
+                for row in rows[:20]
+            ]
+            if len(rows) > 20:
+                details.append(f"... 共 {len(rows)} 个商品")
+            if not messagebox.askyesno("库存核对", "以下商品库存不一致:\n\n" + "\n".join(details)
+                                       + "\n\n是否以库存表为准补记差额并同步商品表？"):
+                return
+            product_ids = [row['product_id'] for row in rows]
             try:
-                self.cursor.execute("DROP PROCEDURE IF EXISTS adjust_inventory")
-                self.cursor.execute("""
-                    CREATE PROCEDURE adjust_inventory(
-                        IN p_product_id INT,
-                        IN p_quantity INT,
-                        IN p_notes TEXT
-                    )
-                    BEGIN
-                        DECLARE current_qty INT;
-                        DECLARE qty_change INT;
-                        
-                        SELECT IFNULL(quantity, 0) INTO current_qty 
-                        FROM inventory 
-                        WHERE product_id = p_product_id;
-                        
-                        SET qty_change = p_quantity - current_qty;
-                        
-                        -- 更新库存表
-                        INSERT INTO inventory (product_id, quantity)
-                        VALUES (p_product_id, p_quantity)
-                        ON DUPLICATE KEY UPDATE 
-                            quantity = p_quantity;
-                        
-                        -- 同步更新商品表中的库存字段
-                        UPDATE products 
-                        SET stock = p_quantity 
-                        WHERE id = p_product_id;
-                        
-                        -- 记录库存日志
-                        INSERT INTO inventory_logs (
-                            product_id, 
-                            change_type, 
-                            quantity,
-                            quantity_change,
-                            reference_type,
-                            before_quantity,
-                            after_quantity,
-                            notes
-                        )
-                        VALUES (
-                            p_product_id,
-                            'adjustment',
-                            p_quantity,
-                            qty_change,
-                            'adjustment',
-                            current_qty,
-                            p_quantity,
-                            p_notes
-                        );
-                    END
-                """)
+                added = reconcile(self.db, product_ids)
             except Error as e:
-                pass
-            
-            self.connection.commit()
-            
-            # 更新状态栏而不是显示弹窗
-            self.status_var.set("数据库结构初始化完成")
-            
-        except Error as e:
-            messagebox.showerror("错误", f"初始化数据库结构失败: {e}")
+                messagebox.showerror("错误", f"修复库存失败: {e}")
+                return
+            self.status_var.set(f"库存核对完成，补记 {added} 条调整记录")
+            self.barcode_cache.invalidate(product_ids)
+            self.product_grid.refresh_rows(product_ids)
+            self.load_inventory_logs()
+        
+        self.status_var.set("正在核对库存...")
+        self.query_runner.submit(
+            "inventory_check", lambda: find_drift(self.db), on_result=on_result,
+            on_error=lambda e: messagebox.showerror("错误", f"核对库存失败: {e}")
+        )
+    
+    def maintain_log_partitions(self):
+        """为库存日志提前建立月份分区，并归档超过保留期的分区
+        
+        会执行 ALTER TABLE，由管理员手动执行（或用 python log_archive.py archive 定期执行），不在启动时自动执行
+        """
+        if not messagebox.askyesno("库存日志分区维护", "将为之后几个月建立分区，并归档超过保留期的库存日志，是否继续？"):
+            return
+        
+        def on_result(result):
+            created, archived = result
+            messagebox.showinfo(
+                "库存日志分区维护",
+                f"新建分区: {', '.join(created) or '无'}\n归档: {', '.join(archived) or '无'}"
+            )
+        
+        self.status_var.set("正在维护库存日志分区...")
+        self.query_runner.submit(
+            "log_partitions", lambda: maintain_partitions(self.db), on_result=on_result,
+            on_error=lambda e: messagebox.showerror("错误", f"维护库存日志分区失败: {e}")
+        )
+    
+    def start_tab_loading(self):
+        """启动时只加载当前标签页的数据"""
+        current = self.tab_control.select()
+        self.startup_pending = {key for key, _ in self.tab_loaders[current]}
+        self.load_tab(current)
+    
+    def load_tab(self, tab):
+        """加载标签页数据，每个标签页只自动加载一次"""
+        if tab in self.loaded_tabs or tab not in self.tab_loaders:
+            return
+        self.loaded_tabs.add(tab)
+        for _, loader in self.tab_loaders[tab]:
+            loader()
+    
+    def on_tab_changed(self, event):
+        """切换到尚未加载的标签页时加载数据"""
+        if self.db_ready:
+            self.load_tab(self.tab_control.select())
+    
+    def on_query_finished(self, key):
+        """启动时当前标签页的查询全部完成后，记录可交互时间并预加载其余标签页"""
+        if key not in self.startup_pending:
+            return
+        self.startup_pending.discard(key)
+        if self.startup_pending:
+            return
+        
+        elapsed = time.perf_counter() - self.start_time
+        self.status_var.set(f"启动完成，可交互用时 {elapsed:.2f} 秒")
+        
+        # 其余标签页在后台工作线程中并行加载，各自使用连接池中的独立连接
+        for tab in self.tab_control.tabs():
+            self.load_tab(tab)
+        
+        # 在后台加载条码缓存，扫码时不再访问数据库
+        self.query_runner.submit(
+            "barcode_cache", self.barcode_cache.warm,
+            on_error=lambda e: self.status_var.set(f"加载条码缓存失败: {e}")
+        )
+        
+        # 定期把库存账本的快照推进到最新的变动
+        self.take_inventory_snapshots()
+        
+        # 在后台为还没有拼音索引的商品和客户补充拼音
+        self.query_runner.submit(
+            "pinyin_backfill",
+            lambda: [backfill(self.db, table) for table in PINYIN_TABLES],
+            on_error=lambda e: self.status_var.set(f"拼音索引更新失败: {e}")
+        )
+    
+    def check_schema_version(self):
+        """检查数据库结构版本，落后时提示用户执行迁移"""
+        version = migrations.current_version(self.db)
+        latest = migrations.latest_version()
+        if version >= latest:
+            return True
+        
+        self.status_var.set(f"数据库结构版本 {version}，需要升级到 {latest}")
+        if messagebox.askyesno("数据库迁移", f"数据库结构版本为 {version}，程序需要版本 {latest}。\n是否立即执行数据库迁移？"):
+            return self.run_migrations()
+        return False
+    
+    def run_migrations(self):
+        """执行尚未执行的数据库迁移"""
+        try:
+            self.status_var.set("正在执行数据库迁移...")
+            self.root.update_idletasks()
+            applied = migrations.migrate(self.db, log=self.status_var.set)
+            self.status_var.set(f"数据库迁移完成，执行了 {applied} 个迁移，当前版本 {migrations.current_version(self.db)}")
+            return True
+        except (Error, RuntimeError) as e:
+            self.status_var.set("数据库迁移失败")
+            messagebox.showerror("错误", f"数据库迁移失败: {e}")
+            return False
     
     def init_product_tab(self):
         """初始化商品管理标签页"""
@@ -577,6 +402,7 @@ class RetailManagementSystem:
         ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
         self.product_search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=self.product_search_var, width=20).pack(side=tk.LEFT, padx=5)
+        self.bind_search(self.product_search_var, self.search_products)
         ttk.Button(search_frame, text="搜索", command=self.search_products).pack(side=tk.LEFT)
         
         # 商品表格
@@ -600,6 +426,24 @@ class RetailManagementSystem:
         # 状态栏
         self.product_status_var = tk.StringVar()
         ttk.Label(self.product_tab, textvariable=self.product_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按主键分页加载，表格中只保留有限的行
+        self.product_grid = VirtualGrid(
+            self.product_tree, self.query_runner, self.db, "products",
+            "SELECT * FROM products", self.product_values, self.product_status_var,
+            table="products", updated_column="updated_at", done_text="共约 {} 条商品数据", error_text="加载商品数据失败",
+            on_loaded=self.on_query_finished,
+            sort_columns={
+                "id": ("id", "id", "id"),
+                "name": ("name", "name", "name"),
+                "price": ("price", "price", "price"),
+                "cost": ("cost", "cost", "cost"),
+                "stock": ("stock", "stock", "stock"),
+                "category": ("category", "category", "category"),
+                "barcode": ("barcode", "barcode", "barcode"),
+                "created_at": ("created_at", "created_at", "created_at")
+            }
+        )
     
     def init_customer_tab(self):
         """初始化客户管理标签页"""
@@ -619,6 +463,7 @@ class RetailManagementSystem:
         ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
         self.customer_search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=self.customer_search_var, width=20).pack(side=tk.LEFT, padx=5)
+        self.bind_search(self.customer_search_var, self.search_customers)
         ttk.Button(search_frame, text="搜索", command=self.search_customers).pack(side=tk.LEFT)
         
         # 客户表格
@@ -642,6 +487,22 @@ class RetailManagementSystem:
         # 状态栏
         self.customer_status_var = tk.StringVar()
         ttk.Label(self.customer_tab, textvariable=self.customer_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按主键分页加载，表格中只保留有限的行
+        self.customer_grid = VirtualGrid(
+            self.customer_tree, self.query_runner, self.db, "customers",
+            "SELECT * FROM customers", self.customer_values, self.customer_status_var,
+            table="customers", updated_column="updated_at", done_text="共约 {} 条客户数据", error_text="加载客户数据失败",
+            on_loaded=self.on_query_finished,
+            sort_columns={
+                "id": ("id", "id", "id"),
+                "name": ("name", "name", "name"),
+                "phone": ("phone", "phone", "phone"),
+                "email": ("email", "email", "email"),
+                "points": ("points", "points", "points"),
+                "created_at": ("created_at", "created_at", "created_at")
+            }
+        )
     
     def init_order_tab(self):
         """初始化订单管理标签页"""
@@ -652,17 +513,61 @@ class RetailManagementSystem:
         ttk.Button(top_frame, text="创建订单", command=self.create_order).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_frame, text="查看订单详情", command=self.view_order_details).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_frame, text="更新订单状态", command=self.update_order_status).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="刷新", command=self.load_orders).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="刷新", command=self.search_orders).pack(side=tk.LEFT, padx=5)
         
-        # 搜索框
+        # 搜索框：订单号或客户（名称、拼音、电话）
         search_frame = ttk.Frame(top_frame)
         search_frame.pack(side=tk.RIGHT, padx=5)
         
-        ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
+        ttk.Label(search_frame, text="订单号/客户:").pack(side=tk.LEFT)
         self.order_search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=self.order_search_var, width=20).pack(side=tk.LEFT, padx=5)
+        self.bind_search(self.order_search_var, self.search_orders)
         ttk.Button(search_frame, text="搜索", command=self.search_orders).pack(side=tk.LEFT)
         
+        # 筛选条件
+        filter_frame = ttk.Frame(self.order_tab)
+        filter_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(filter_frame, text="日期:").pack(side=tk.LEFT, padx=(5, 0))
+        self.order_date_from_var = tk.StringVar()
+        date_from_entry = ttk.Entry(filter_frame, textvariable=self.order_date_from_var, width=11)
+        date_from_entry.pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="至").pack(side=tk.LEFT)
+        self.order_date_to_var = tk.StringVar()
+        date_to_entry = ttk.Entry(filter_frame, textvariable=self.order_date_to_var, width=11)
+        date_to_entry.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text="状态:").pack(side=tk.LEFT, padx=(10, 0))
+        self.order_status_filter_var = tk.StringVar(value="全部")
+        status_combo = ttk.Combobox(filter_frame, textvariable=self.order_status_filter_var,
+                                    values=("全部",) + ORDER_STATUSES, state="readonly", width=10)
+        status_combo.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text="支付方式:").pack(side=tk.LEFT, padx=(10, 0))
+        self.order_payment_filter_var = tk.StringVar(value="全部")
+        payment_combo = ttk.Combobox(filter_frame, textvariable=self.order_payment_filter_var,
+                                     values=("全部",) + PAYMENT_METHODS, state="readonly", width=8)
+        payment_combo.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Label(filter_frame, text="实付金额:").pack(side=tk.LEFT, padx=(10, 0))
+        self.order_min_amount_var = tk.StringVar()
+        min_amount_entry = ttk.Entry(filter_frame, textvariable=self.order_min_amount_var, width=8)
+        min_amount_entry.pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="至").pack(side=tk.LEFT)
+        self.order_max_amount_var = tk.StringVar()
+        max_amount_entry = ttk.Entry(filter_frame, textvariable=self.order_max_amount_var, width=8)
+        max_amount_entry.pack(side=tk.LEFT, padx=2)
+        
+        ttk.Button(filter_frame, text="筛选", command=self.search_orders).pack(side=tk.LEFT, padx=(10, 5))
+        ttk.Button(filter_frame, text="清除", command=self.clear_order_filters).pack(side=tk.LEFT)
+        
+        # 下拉框选择后立即筛选，日期和金额输入完整后按回车筛选
+        for combo in (status_combo, payment_combo):
+            combo.bind("<<ComboboxSelected>>", lambda event: self.search_orders())
+        for entry in (date_from_entry, date_to_entry, min_amount_entry, max_amount_entry):
+            entry.bind("<Return>", lambda event: self.search_orders())
+        
         # 订单表格
         columns = ("id", "customer_name", "total_amount", "discount", "final_amount", "payment_method", "status", "created_at")
         self.order_tree = ttk.Treeview(self.order_tab, columns=columns, show="headings")
@@ -684,6 +589,41 @@ class RetailManagementSystem:
         # 状态栏
         self.order_status_var = tk.StringVar()
         ttk.Label(self.order_tab, textvariable=self.order_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按主键分页加载，表格中只保留有限的行
+        self.order_grid = VirtualGrid(
+            self.order_tree, self.query_runner, self.db, "orders",
+            """
+            SELECT 
+                so.id,
+                c.name AS customer_name,
+                so.total_amount,
+                so.discount,
+                so.final_amount,
+                so.payment_method,
+                so.status,
+                so.created_at
+            FROM sales_orders so
+            LEFT JOIN customers c ON so.customer_id = c.id
+            """,
+            self.order_values, self.order_status_var,
+            table="sales_orders", pk_column="so.id", updated_column="so.updated_at",
+            done_text="共约 {} 条订单数据", error_text="加载订单数据失败",
+            on_loaded=self.on_query_finished,
+            # 默认按下单时间倒序，筛选条件的组合索引都以 created_at 结尾
+            default_sort=[("so.created_at", "created_at", True)],
+            sort_columns={
+                "id": ("so.id", "id", "id"),
+                # 客户名称来自关联表，无法使用 sales_orders 上的索引
+                "customer_name": ("c.name", "customer_name", None),
+                "total_amount": ("so.total_amount", "total_amount", "total_amount"),
+                "discount": ("so.discount", "discount", "discount"),
+                "final_amount": ("so.final_amount", "final_amount", "final_amount"),
+                "payment_method": ("so.payment_method", "payment_method", "payment_method"),
+                "status": ("so.status", "status", "status"),
+                "created_at": ("so.created_at", "created_at", "created_at")
+            }
+        )
     
     def init_inventory_tab(self):
         """初始化库存管理标签页"""
@@ -712,6 +652,13 @@ class RetailManagementSystem:
         ttk.Button(top_frame, text="刷新", command=self.load_inventory_status).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_frame, text="库存调整", command=self.adjust_inventory).pack(side=tk.LEFT, padx=5)
         ttk.Button(top_frame, text="导出库存报表", command=self.export_inventory_report).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="盘点导入", command=self.import_stocktake).pack(side=tk.LEFT, padx=5)
+        
+        # 历史库存：查询所有商品在某个时间点的库存
+        ttk.Label(top_frame, text="时间点:").pack(side=tk.LEFT, padx=(15, 0))
+        self.as_of_var = tk.StringVar()
+        ttk.Entry(top_frame, textvariable=self.as_of_var, width=16).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="历史库存", command=self.show_stock_as_of).pack(side=tk.LEFT, padx=5)
         
         # 搜索框
         search_frame = ttk.Frame(top_frame)
@@ -720,6 +667,7 @@ class RetailManagementSystem:
         ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
         self.inventory_search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=self.inventory_search_var, width=20).pack(side=tk.LEFT, padx=5)
+        self.bind_search(self.inventory_search_var, self.search_inventory)
         ttk.Button(search_frame, text="搜索", command=self.search_inventory).pack(side=tk.LEFT)
         
         # 库存状态表格
@@ -772,11 +720,28 @@ class RetailManagementSystem:
         # 添加滚动条
         scrollbar = ttk.Scrollbar(parent_tab, orient="vertical", command=self.inventory_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.inventory_tree.configure(yscrollcommand=scrollbar.set)
         
         # 状态栏
         self.inventory_status_var = tk.StringVar()
         ttk.Label(parent_tab, textvariable=self.inventory_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按键集分页加载，排序在数据库中完成；
+        # 可排序的列 {表格列名: (SQL表达式, 结果字段, inventory_status 的列名)}，每一列都有 (列, product_id) 索引
+        self.inventory_grid = VirtualGrid(
+            self.inventory_tree, self.query_runner, self.db, "inventory",
+            "SELECT * FROM inventory_status", self.inventory_values, self.inventory_status_var,
+            table="inventory_status", pk_column="product_id", pk_field="product_id", scrollbar=scrollbar,
+            done_text="共约 {} 条记录", error_text="加载库存状态失败",
+            on_loaded=self.on_query_finished, make_tags=self.inventory_tags,
+            sort_columns={
+                "id": ("product_id", "product_id", "product_id"),
+                "name": ("product_name", "product_name", "product_name"),
+                "category": ("category", "category", "category"),
+                "current_stock": ("current_stock", "current_stock", "current_stock"),
+                "stock_status": ("stock_status", "stock_status", "stock_status"),
+                "price": ("price", "price", "price")
+            }
+        )
     
     def init_inventory_log_tab(self, parent_tab):
         """初始化库存日志子标签页"""
@@ -785,6 +750,7 @@ class RetailManagementSystem:
         top_frame.pack(fill=tk.X, pady=5)
         
         ttk.Button(top_frame, text="刷新", command=self.load_inventory_logs).pack(side=tk.LEFT, padx=5)
+        ttk.Button(top_frame, text="加载更早", command=self.load_older_inventory_logs).pack(side=tk.LEFT, padx=5)
         
         # 日期过滤
         filter_frame = ttk.Frame(top_frame)
@@ -843,11 +809,26 @@ class RetailManagementSystem:
         # 添加滚动条
         scrollbar = ttk.Scrollbar(parent_tab, orient="vertical", command=self.inventory_log_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.inventory_log_tree.configure(yscrollcommand=scrollbar.set)
         
         # 状态栏
         self.inventory_log_status_var = tk.StringVar()
         ttk.Label(parent_tab, textvariable=self.inventory_log_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按 (created_at, id) 倒序键集分页，滚动到底部或点击“加载更早”时加载更早的一页，
+        # 与 idx_inventory_logs_created_at 索引的顺序一致，按日期筛选时只扫描相关的月份分区
+        self.inventory_log_grid = VirtualGrid(
+            self.inventory_log_tree, self.query_runner, self.db, "inventory_logs",
+            """
+            SELECT il.*, p.name AS product_name
+            FROM inventory_logs il
+            LEFT JOIN products p ON il.product_id = p.id
+            """,
+            self.inventory_log_values, self.inventory_log_status_var,
+            table="inventory_logs", pk_column="il.id", scrollbar=scrollbar,
+            done_text="共约 {} 条记录", error_text="加载库存日志失败",
+            on_loaded=self.on_query_finished,
+            default_sort=[("il.created_at", "created_at", True)]
+        )
     
     def init_supplier_tab(self):
         """初始化供应商管理标签页"""
@@ -867,6 +848,7 @@ class RetailManagementSystem:
         ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
         self.supplier_search_var = tk.StringVar()
         ttk.Entry(search_frame, textvariable=self.supplier_search_var, width=20).pack(side=tk.LEFT, padx=5)
+        self.bind_search(self.supplier_search_var, self.search_suppliers)
         ttk.Button(search_frame, text="搜索", command=self.search_suppliers).pack(side=tk.LEFT)
         
         # 供应商表格
@@ -905,234 +887,239 @@ class RetailManagementSystem:
         # 添加滚动条
         scrollbar = ttk.Scrollbar(self.supplier_tab, orient="vertical", command=self.supplier_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.supplier_tree.configure(yscrollcommand=scrollbar.set)
         
         # 状态栏
         self.supplier_status_var = tk.StringVar()
         ttk.Label(self.supplier_tab, textvariable=self.supplier_status_var).pack(side=tk.LEFT, pady=5)
+        
+        # 按主键分页加载，表格中只保留有限的行
+        self.supplier_grid = VirtualGrid(
+            self.supplier_tree, self.query_runner, self.db, "suppliers",
+            "SELECT * FROM suppliers", self.supplier_values, self.supplier_status_var,
+            table="suppliers", updated_column="updated_at", scrollbar=scrollbar,
+            done_text="共约 {} 条记录", error_text="加载供应商数据失败",
+            on_loaded=self.on_query_finished
+        )
     
-    def load_products(self):
-        """加载商品数据"""
-        # 清空现有数据
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
+    def run_tree_query(self, key, tree, status_var, task, make_values, done_text, error_text, make_tags=None, iid_field=None):
+        """在后台执行查询，并把结果分批填充到表格中
+        
+        同一个 key 上的新查询会取消旧查询，查询期间表格显示加载状态。
+        指定 iid_field 时以该字段作为行的 iid，只插入、更新、删除有变化的行，不清空表格
+        """
+        status_var.set("加载中...")
+        tree.configure(cursor="watch")
+        seen = set()
+        
+        def on_chunk(rows, offset):
+            if iid_field is not None:
+                for index, row in enumerate(rows, offset):
+                    iid = str(row[iid_field])
+                    seen.add(iid)
+                    tags = make_tags(row) if make_tags else ()
+                    self.upsert_tree_row(tree, iid, make_values(row), tags, index)
+                return
+            
+            # 第一批结果到达时才清空旧数据，避免加载期间表格空白
+            if offset == 0:
+                tree.delete(*tree.get_children())
+            for row in rows:
+                tags = make_tags(row) if make_tags else ()
+                tree.insert("", "end", values=make_values(row), tags=tags)
+        
+        def on_done(total):
+            if iid_field is not None:
+                # 删除结果中已经不存在的行
+                stale = [iid for iid in tree.get_children() if iid not in seen]
+                if stale:
+                    tree.delete(*stale)
+            tree.configure(cursor="")
+            status_var.set(done_text.format(total))
+            self.on_query_finished(key)
+        
+        def on_error(e):
+            tree.configure(cursor="")
+            status_var.set(error_text)
+            self.on_query_finished(key)
+            messagebox.showerror("错误", f"{error_text}: {e}")
+        
+        return self.query_runner.submit(key, task, on_chunk, on_done, on_error)
+    
+    def upsert_tree_row(self, tree, iid, values, tags=(), index="end"):
+        """按 iid 更新表格中的一行，值没有变化时不修改该行；行不存在时插入到 index 位置"""
+        if not tree.exists(iid):
+            tree.insert("", index, iid=iid, values=values, tags=tags)
+            return
+        item = tree.item(iid)
+        if [str(v) for v in item['values']] != [str(v) for v in values] or tuple(item['tags']) != tuple(tags):
+            tree.item(iid, values=values, tags=tags)
+        # 排序变化时把行移到结果中的位置
+        if index != "end" and tree.index(iid) != index:
+            tree.move(iid, "", index)
+    
+    def product_values(self, product):
+        """商品表格的一行"""
+        return (
+            product['id'], 
+            product['name'], 
+            product['price'],
+            product['cost'],
+            product['stock'],
+            product['category'],
+            product['barcode'],
+            product['created_at']
+        )
+    
+    def customer_values(self, customer):
+        """客户表格的一行"""
+        return (
+            customer['id'], 
+            customer['name'], 
+            customer['phone'],
+            customer['email'],
+            customer['address'],
+            customer['points'],
+            customer['created_at']
+        )
+    
+    def order_values(self, order):
+        """订单表格的一行"""
+        return (
+            order['id'], 
+            # 离线时下的订单可以没有客户
+            order['customer_name'] or "散客", 
+            order['total_amount'],
+            order['discount'],
+            order['final_amount'],
+            order['payment_method'],
+            order['status'],
+            order['created_at']
+        )
+    
+    def bind_search(self, var, search, delay=300):
+        """输入时自动搜索，停止输入 delay 毫秒后才执行，避免每次按键都查询数据库"""
+        pending = [None]
         
+        def run():
+            pending[0] = None
+            search()
+        
+        def on_write(*args):
+            if pending[0] is not None:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(delay, run)
+        
+        var.trace_add("write", on_write)
+    
+    def narrows_search(self, key, text, kind):
+        """记录本次搜索，并返回它是否只会缩小上一次的结果
+        
+        新关键字在上一次的基础上继续输入且检索方式相同时，结果一定是上一次结果的子集
+        """
+        previous = self.search_terms.get(key)
+        self.search_terms[key] = (text, kind)
+        return previous is not None and previous[1] == kind and text != previous[0] and text.startswith(previous[0])
+    
+    def kill_query(self, ticket):
+        """在服务器上终止已被取消的查询，在后台线程中执行"""
         try:
-            query = "SELECT * FROM products ORDER BY id DESC"
-            self.cursor.execute(query)
-            products = self.cursor.fetchall()
-            
-            for product in products:
-                self.product_tree.insert("", "end", values=(
-                    product['id'], 
-                    product['name'], 
-                    product['price'],
-                    product['cost'],
-                    product['stock'],
-                    product['category'],
-                    product['barcode'],
-                    product['created_at']
-                ))
-            
-            self.product_status_var.set(f"共加载 {len(products)} 条商品数据")
-        except Error as e:
-            messagebox.showerror("错误", f"加载商品数据失败: {e}")
+            self.db.kill_query(ticket.connection_id)
+        except Error:
+            # 查询可能已经执行完毕，终止失败不影响界面
+            pass
+    
+    def load_products(self):
+        """加载商品数据"""
+        self.product_grid.load()
     
     def load_customers(self):
         """加载客户数据"""
-        # 清空现有数据
-        for item in self.customer_tree.get_children():
-            self.customer_tree.delete(item)
-        
-        try:
-            query = "SELECT * FROM customers ORDER BY id DESC"
-            self.cursor.execute(query)
-            customers = self.cursor.fetchall()
-            
-            for customer in customers:
-                self.customer_tree.insert("", "end", values=(
-                    customer['id'], 
-                    customer['name'], 
-                    customer['phone'],
-                    customer['email'],
-                    customer['address'],
-                    customer['points'],
-                    customer['created_at']
-                ))
-            
-            self.customer_status_var.set(f"共加载 {len(customers)} 条客户数据")
-        except Error as e:
-            messagebox.showerror("错误", f"加载客户数据失败: {e}")
+        self.customer_grid.load()
     
     def load_orders(self):
         """加载订单数据"""
-        # 清空现有数据
-        for item in self.order_tree.get_children():
-            self.order_tree.delete(item)
-        
-        try:
-            query = """
-                SELECT 
-                    so.id,
-                    c.name AS customer_name,
-                    so.total_amount,
-                    so.discount,
-                    so.final_amount,
-                    so.payment_method,
-                    so.status,
-                    so.created_at
-                FROM sales_orders so
-                JOIN customers c ON so.customer_id = c.id
-                ORDER BY so.id DESC
-            """
-            self.cursor.execute(query)
-            orders = self.cursor.fetchall()
-            
-            for order in orders:
-                self.order_tree.insert("", "end", values=(
-                    order['id'], 
-                    order['customer_name'], 
-                    order['total_amount'],
-                    order['discount'],
-                    order['final_amount'],
-                    order['payment_method'],
-                    order['status'],
-                    order['created_at']
-                ))
-            
-            self.order_status_var.set(f"共加载 {len(orders)} 条订单数据")
-        except Error as e:
-            messagebox.showerror("错误", f"加载订单数据失败: {e}")
+        self.order_grid.load()
     
     def search_products(self):
         """搜索商品"""
         search_text = self.product_search_var.get().strip().lower()
-        if not search_text:
+        # 使用名称和分类上的全文索引，按相关度排序
+        select = product_search_select(search_text) if search_text else None
+        if select is None:
+            self.search_terms.pop("products", None)
             self.load_products()
             return
         
-        # 清空现有数据
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
-        
-        try:
-            query = """
-                SELECT * FROM products 
-                WHERE LOWER(name) LIKE %s OR LOWER(category) LIKE %s
-                ORDER BY id DESC
-            """
-            search_pattern = f"%{search_text}%"
-            self.cursor.execute(query, (search_pattern, search_pattern))
-            products = self.cursor.fetchall()
-            
-            for product in products:
-                self.product_tree.insert("", "end", values=(
-                    product['id'], 
-                    product['name'], 
-                    product['price'],
-                    product['cost'],
-                    product['stock'],
-                    product['category'],
-                    product['barcode'],
-                    product['created_at']
-                ))
-            
-            self.product_status_var.set(f"找到 {len(products)} 条匹配商品")
-        except Error as e:
-            messagebox.showerror("错误", f"搜索商品失败: {e}")
+        args = dict(done_text="找到 {} 条匹配商品", error_text="搜索商品失败",
+                    select=select, sort=[("relevance", "relevance", True)])
+        if self.narrows_search("products", search_text, is_pinyin_query(search_text)):
+            self.product_grid.narrow(product_matcher(search_text), **args)
+        else:
+            self.product_grid.load(**args)
     
     def search_customers(self):
         """搜索客户"""
         search_text = self.customer_search_var.get().strip().lower()
         if not search_text:
+            self.search_terms.pop("customers", None)
             self.load_customers()
             return
         
-        # 清空现有数据
-        for item in self.customer_tree.get_children():
-            self.customer_tree.delete(item)
-        
-        try:
-            query = """
-                SELECT * FROM customers 
-                WHERE LOWER(name) LIKE %s OR LOWER(phone) LIKE %s
-                ORDER BY id DESC
-            """
-            search_pattern = f"%{search_text}%"
-            self.cursor.execute(query, (search_pattern, search_pattern))
-            customers = self.cursor.fetchall()
-            
-            for customer in customers:
-                self.customer_tree.insert("", "end", values=(
-                    customer['id'], 
-                    customer['name'], 
-                    customer['phone'],
-                    customer['email'],
-                    customer['address'],
-                    customer['points'],
-                    customer['created_at']
-                ))
-            
-            self.customer_status_var.set(f"找到 {len(customers)} 条匹配客户")
-        except Error as e:
-            messagebox.showerror("错误", f"搜索客户失败: {e}")
+        # 完整号码、号码后几位、拼音和名称分别使用各自的索引
+        kind, condition, params = customer_search_condition(search_text)
+        matches = customer_matcher(kind, search_text)
+        if self.narrows_search("customers", search_text, kind) and matches is not None:
+            self.customer_grid.narrow(matches, condition, params, "找到 {} 条匹配客户", "搜索客户失败")
+        else:
+            self.customer_grid.load(condition, params, "找到 {} 条匹配客户", "搜索客户失败")
     
     def search_orders(self):
-        """搜索订单"""
+        """按搜索框和筛选条件搜索订单"""
         search_text = self.order_search_var.get().strip().lower()
-        if not search_text:
-            self.load_orders()
+        status = self.order_status_filter_var.get()
+        payment_method = self.order_payment_filter_var.get()
+        try:
+            date_from = parse_date(self.order_date_from_var.get())
+            date_to = parse_date(self.order_date_to_var.get())
+            min_amount = parse_amount(self.order_min_amount_var.get())
+            max_amount = parse_amount(self.order_max_amount_var.get())
+        except ValueError:
+            self.order_status_var.set("日期格式应为 YYYY-MM-DD，金额应为数字")
             return
         
-        # 清空现有数据
-        for item in self.order_tree.get_children():
-            self.order_tree.delete(item)
+        # 较短的纯数字按订单号查找，完整手机号和其他输入按客户查找
+        order_id = int(search_text) if search_text.isdigit() and len(search_text) < PHONE_LENGTH else None
+        filters = (
+            None if status == "全部" else status,
+            None if payment_method == "全部" else payment_method,
+            date_from, date_to, min_amount, max_amount
+        )
+        condition, params = order_filter_condition(
+            order_id, None if order_id is not None else search_text, *filters
+        )
+        if condition is None:
+            self.search_terms.pop("orders", None)
+            self.load_orders()
+            return
         
-        try:
-            query = """
-                SELECT 
-                    so.id,
-                    c.name AS customer_name,
-                    so.total_amount,
-                    so.discount,
-                    so.final_amount,
-                    so.payment_method,
-                    so.status,
-                    so.created_at
-                FROM sales_orders so
-                JOIN customers c ON so.customer_id = c.id
-                WHERE LOWER(c.name) LIKE %s OR so.id = %s
-                ORDER BY so.id DESC
-            """
-            search_pattern = f"%{search_text}%"
-            # 尝试将搜索文本转换为整数（用于订单ID搜索）
-            try:
-                order_id = int(search_text)
-            except ValueError:
-                order_id = None
-            
-            if order_id:
-                self.cursor.execute(query, (search_pattern, order_id))
-            else:
-                self.cursor.execute(query, (search_pattern, None))
-            
-            orders = self.cursor.fetchall()
-            
-            for order in orders:
-                self.order_tree.insert("", "end", values=(
-                    order['id'], 
-                    order['customer_name'], 
-                    order['total_amount'],
-                    order['discount'],
-                    order['final_amount'],
-                    order['payment_method'],
-                    order['status'],
-                    order['created_at']
-                ))
-            
-            self.order_status_var.set(f"找到 {len(orders)} 条匹配订单")
-        except Error as e:
-            messagebox.showerror("错误", f"搜索订单失败: {e}")
+        args = (condition, params, "找到 {} 条匹配订单", "搜索订单失败")
+        # 其他筛选条件不变、只在客户名称后继续输入时，结果是上一次结果的子集
+        kind = customer_search_condition(search_text)[0] if order_id is None and search_text else None
+        if kind == "name" and self.narrows_search("orders", search_text, filters):
+            self.order_grid.narrow(lambda row: search_text in (row.get('customer_name') or "").lower(), *args)
+        else:
+            self.search_terms["orders"] = (search_text, filters)
+            self.order_grid.load(*args)
+    
+    def clear_order_filters(self):
+        """清除订单的搜索和筛选条件"""
+        for var in (self.order_date_from_var, self.order_date_to_var,
+                    self.order_min_amount_var, self.order_max_amount_var):
+            var.set("")
+        self.order_status_filter_var.set("全部")
+        self.order_payment_filter_var.set("全部")
+        # 搜索框的修改会触发一次搜索
+        self.order_search_var.set("")
     
     def add_product(self):
         """添加商品"""
@@ -1191,16 +1178,22 @@ class RetailManagementSystem:
                 messagebox.showerror("错误", "商品名称不能为空")
                 return
             
+            def work(cursor):
+                cursor.execute("""
+                    INSERT INTO products (name, price, cost, stock, category, barcode, name_pinyin, name_initials)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (name, price, cost, stock, category, barcode) + to_pinyin(name))
+                product_id = cursor.lastrowid
+                # 库存行和初始库存的变动记录与商品在同一个事务中写入
+                open_stock(cursor, product_id, stock)
+                return product_id
+            
             try:
-                query = """
-                    INSERT INTO products (name, price, cost, stock, category, barcode)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                self.cursor.execute(query, (name, price, cost, stock, category, barcode))
-                self.connection.commit()
+                product_id = self.db.run_transaction(work)
                 messagebox.showinfo("成功", "商品添加成功")
                 product_window.destroy()
-                self.load_products()
+                self.product_grid.refresh_rows([product_id])
+                self.refresh_inventory_rows([product_id])
             except Error as e:
                 messagebox.showerror("错误", f"添加商品失败: {e}")
         
@@ -1274,18 +1267,25 @@ class RetailManagementSystem:
                 messagebox.showerror("错误", "商品名称不能为空")
                 return
             
-            try:
-                query = """
+            def work(cursor):
+                cursor.execute("""
                     UPDATE products 
-                    SET name = %s, price = %s, cost = %s, stock = %s, 
-                        category = %s, barcode = %s 
+                    SET name = %s, price = %s, cost = %s, 
+                        category = %s, barcode = %s, name_pinyin = %s, name_initials = %s 
                     WHERE id = %s
-                """
-                self.cursor.execute(query, (name, price, cost, stock, category, barcode, product_id))
-                self.connection.commit()
+                """, (name, price, cost, category, barcode) + to_pinyin(name) + (product_id,))
+                # 只有修改了库存时才调整，按库存调整记账并同步库存表
+                if str(stock) != str(values[4]):
+                    set_stock(cursor, product_id, stock, "编辑商品时修改库存")
+            
+            try:
+                self.db.run_transaction(work)
                 messagebox.showinfo("成功", "商品更新成功")
                 product_window.destroy()
-                self.load_products()
+                self.barcode_cache.invalidate([product_id])
+                self.recent_products.discard(product_id)
+                self.product_grid.refresh_rows([product_id])
+                self.refresh_inventory_rows([product_id])
             except Error as e:
                 messagebox.showerror("错误", f"更新商品失败: {e}")
         
@@ -1312,18 +1312,19 @@ class RetailManagementSystem:
         try:
             # 检查是否有关联订单
             query = "SELECT COUNT(*) as count FROM sales_order_items WHERE product_id = %s"
-            self.cursor.execute(query, (product_id,))
-            result = self.cursor.fetchone()
+            result = self.db.query_one(query, (product_id,))
             
             if result['count'] > 0:
                 messagebox.showerror("错误", "该商品有关联订单，不能删除")
                 return
             
             query = "DELETE FROM products WHERE id = %s"
-            self.cursor.execute(query, (product_id,))
-            self.connection.commit()
+            self.db.execute(query, (product_id,))
             messagebox.showinfo("成功", "商品删除成功")
-            self.load_products()
+            self.barcode_cache.invalidate([product_id])
+            self.recent_products.discard(product_id)
+            self.product_grid.remove_rows([product_id])
+            self.inventory_grid.remove_rows([product_id])
         except Error as e:
             messagebox.showerror("错误", f"删除商品失败: {e}")
     
@@ -1384,14 +1385,13 @@ class RetailManagementSystem:
             
             try:
                 query = """
-                    INSERT INTO customers (name, phone, email, address, points)
-                    VALUES (%s, %s, %s, %s, %s)
+                    INSERT INTO customers (name, phone, email, address, points, name_pinyin, name_initials)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """
-                self.cursor.execute(query, (name, phone, email, address, points))
-                self.connection.commit()
+                _, customer_id = self.db.execute(query, (name, phone, email, address, points) + to_pinyin(name))
                 messagebox.showinfo("成功", "客户添加成功")
                 customer_window.destroy()
-                self.load_customers()
+                self.customer_grid.refresh_rows([customer_id])
             except Error as e:
                 messagebox.showerror("错误", f"添加客户失败: {e}")
         
@@ -1466,14 +1466,15 @@ class RetailManagementSystem:
             try:
                 query = """
                     UPDATE customers 
-                    SET name = %s, phone = %s, email = %s, address = %s, points = %s 
+                    SET name = %s, phone = %s, email = %s, address = %s, points = %s, 
+                        name_pinyin = %s, name_initials = %s 
                     WHERE id = %s
                 """
-                self.cursor.execute(query, (name, phone, email, address, points, customer_id))
-                self.connection.commit()
+                self.db.execute(query, (name, phone, email, address, points) + to_pinyin(name) + (customer_id,))
                 messagebox.showinfo("成功", "客户更新成功")
                 customer_window.destroy()
-                self.load_customers()
+                self.recent_customers.discard(customer_id)
+                self.customer_grid.refresh_rows([customer_id])
             except Error as e:
                 messagebox.showerror("错误", f"更新客户失败: {e}")
         
@@ -1500,18 +1501,17 @@ class RetailManagementSystem:
         try:
             # 检查是否有关联订单
             query = "SELECT COUNT(*) as count FROM sales_orders WHERE customer_id = %s"
-            self.cursor.execute(query, (customer_id,))
-            result = self.cursor.fetchone()
+            result = self.db.query_one(query, (customer_id,))
             
             if result['count'] > 0:
                 messagebox.showerror("错误", "该客户有关联订单，不能删除")
                 return
             
             query = "DELETE FROM customers WHERE id = %s"
-            self.cursor.execute(query, (customer_id,))
-            self.connection.commit()
+            self.db.execute(query, (customer_id,))
             messagebox.showinfo("成功", "客户删除成功")
-            self.load_customers()
+            self.recent_customers.discard(customer_id)
+            self.customer_grid.remove_rows([customer_id])
         except Error as e:
             messagebox.showerror("错误", f"删除客户失败: {e}")
     
@@ -1522,30 +1522,33 @@ class RetailManagementSystem:
         order_window.geometry("800x600")
         order_window.resizable(True, True)
         
+        # 订单商品行保存在购物车中，表格只负责显示
+        cart = Cart()
+        
         # 客户选择框架
         customer_frame = ttk.LabelFrame(order_window, text="选择客户", padding=10)
         customer_frame.pack(fill=tk.X, padx=10, pady=5)
         
         ttk.Label(customer_frame, text="客户:").pack(side=tk.LEFT, padx=5)
         
-        # 加载客户下拉框
-        customer_var = tk.StringVar()
-        customer_combo = ttk.Combobox(customer_frame, textvariable=customer_var, width=30)
-        customer_combo.pack(side=tk.LEFT, padx=5)
+        # 客户选择框：输入名称、拼音或电话后按索引分页查询，不再一次加载所有客户
+        customer_picker = AutocompletePicker(
+            customer_frame, self.query_runner, self.db, customer_picker_query,
+            lambda c: f"{c['name']} ({c['id']})", self.recent_customers, width=30,
+            fallback=lambda text: [c for c in self.recent_customers.values() if text in c['name']]
+        )
+        customer_picker.pack(side=tk.LEFT, padx=5)
         
-        # 加载客户数据
-        try:
-            query = "SELECT id, name FROM customers ORDER BY name"
-            self.cursor.execute(query)
-            customers = self.cursor.fetchall()
-            
-            customer_dict = {f"{c['name']} ({c['id']})": c['id'] for c in customers}
-            customer_combo['values'] = list(customer_dict.keys())
-            
-            if customers:
-                customer_combo.current(0)
-        except Error as e:
-            messagebox.showerror("错误", f"加载客户数据失败: {e}")
+        # 扫码框架：扫码枪输入条码后回车，每扫一次加入一件商品
+        scan_frame = ttk.LabelFrame(order_window, text="扫码", padding=10)
+        scan_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(scan_frame, text="条码:").pack(side=tk.LEFT, padx=5)
+        scan_var = tk.StringVar()
+        scan_entry = ttk.Entry(scan_frame, textvariable=scan_var, width=30)
+        scan_entry.pack(side=tk.LEFT, padx=5)
+        scan_status_var = tk.StringVar()
+        ttk.Label(scan_frame, textvariable=scan_status_var).pack(side=tk.LEFT, padx=5)
         
         # 商品选择框架
         product_frame = ttk.LabelFrame(order_window, text="添加商品", padding=10)
@@ -1553,34 +1556,27 @@ class RetailManagementSystem:
         
         ttk.Label(product_frame, text="商品:").pack(side=tk.LEFT, padx=5)
         
-        # 加载商品下拉框
-        product_var = tk.StringVar()
-        product_combo = ttk.Combobox(product_frame, textvariable=product_var, width=25)
-        product_combo.pack(side=tk.LEFT, padx=5)
+        # 商品选择框：输入名称、拼音或条码后按索引分页查询，离线时从条码缓存中查找
+        product_picker = AutocompletePicker(
+            product_frame, self.query_runner, self.db, product_picker_query,
+            lambda p: f"{p['name']} - ¥{p['price']} ({p['id']})", self.recent_products, width=25,
+            fallback=lambda text: [
+                {'id': product_id, 'name': name, 'price': price}
+                for product_id, name, price, _ in self.barcode_cache.items() if text in name
+            ][:20]
+        )
+        product_picker.pack(side=tk.LEFT, padx=5)
         
         ttk.Label(product_frame, text="数量:").pack(side=tk.LEFT, padx=5)
         
         quantity_var = tk.IntVar(value=1)
         ttk.Entry(product_frame, textvariable=quantity_var, width=5).pack(side=tk.LEFT, padx=5)
         
-        # 加载商品数据
-        try:
-            query = "SELECT id, name, price FROM products ORDER BY name"
-            self.cursor.execute(query)
-            products = self.cursor.fetchall()
-            
-            product_dict = {f"{p['name']} - ¥{p['price']} ({p['id']})": (p['id'], p['price']) for p in products}
-            product_combo['values'] = list(product_dict.keys())
-            
-            if products:
-                product_combo.current(0)
-        except Error as e:
-            messagebox.showerror("错误", f"加载商品数据失败: {e}")
-        
         # 添加商品按钮
         def add_product_to_order():
-            product_text = product_combo.get()
-            if not product_text:
+            product = product_picker.selected()
+            if product is None:
+                messagebox.showinfo("提示", "请先输入并从列表中选择商品")
                 return
                 
             quantity = quantity_var.get()
@@ -1588,49 +1584,105 @@ class RetailManagementSystem:
                 messagebox.showinfo("提示", "数量必须大于0")
                 return
                 
-            product_id, price = product_dict[product_text]
-            product_name = product_text.split(" - ")[0]
+            product_id, product_name, price = product['id'], product['name'], product['price']
+            product_picker.remember(product)
             
-            # 检查是否已添加该商品
-            for item in order_items_tree.get_children():
-                if order_items_tree.item(item)['values'][0] == product_id:
-                    messagebox.showinfo("提示", "该商品已添加到订单中")
-                    return
+            # 已添加的商品合并数量，按合并后的数量检查库存
+            needed = cart.quantity(product_id) + quantity
             
-            # 检查库存是否足够
-            try:
-                self.cursor.execute("""
-                    SELECT IFNULL(quantity, 0) AS current_stock 
-                    FROM inventory 
-                    WHERE product_id = %s
-                """, (product_id,))
-                
-                result = self.cursor.fetchone()
-                if not result:
-                    messagebox.showinfo("提示", f"商品 '{product_name}' 库存信息不存在")
-                    return
+            # 提前提示库存不足（仅作提示，下单时在事务中按条件扣减，并发下单也不会超卖）
+            # 离线时跳过，离线订单同步时再检查库存
+            if not self.offline:
+                try:
+                    result = self.db.query_one("""
+                        SELECT IFNULL(quantity, 0) AS current_stock 
+                        FROM inventory 
+                        WHERE product_id = %s
+                    """, (product_id,))
                     
-                current_stock = result['current_stock']
-                
-                if current_stock < quantity:
-                    messagebox.showinfo("库存不足", f"商品 '{product_name}' 库存不足\n需要: {quantity}, 当前库存: {current_stock}")
-                    return
-            except Error as e:
-                messagebox.showerror("错误", f"检查库存失败: {e}")
-                return
-            
-            order_items_tree.insert("", "end", values=(
-                product_id, 
-                product_name, 
-                price,
-                quantity,
-                price * quantity
-            ))
+                    if not result:
+                        messagebox.showinfo("提示", f"商品 '{product_name}' 库存信息不存在")
+                        return
+                        
+                    current_stock = result['current_stock']
+                    
+                    if current_stock < needed:
+                        messagebox.showinfo("库存不足", f"商品 '{product_name}' 库存不足\n需要: {needed}, 当前库存: {current_stock}")
+                        return
+                except Error as e:
+                    if not is_connection_error(e):
+                        messagebox.showerror("错误", f"检查库存失败: {e}")
+                        return
+                    self.offline = True
             
+            show_line(cart.add(product_id, product_name, price, quantity))
             update_order_total()
         
         ttk.Button(product_frame, text="添加", command=add_product_to_order).pack(side=tk.LEFT, padx=5)
         
+        # 正在后台查询的条码 -> 查询期间扫到的次数，同一条码只查询一次，结果返回后按次数加入
+        pending_scans = {}
+        
+        def add_scanned(barcode, item):
+            """把扫到的商品加入一件，返回是否加入成功"""
+            if item is None:
+                order_window.bell()
+                scan_status_var.set(f"未找到条码 {barcode}")
+                return False
+            product_id, product_name, price, stock = item
+            # 同一商品再次扫码时数量加一
+            if stock < cart.quantity(product_id) + 1:
+                order_window.bell()
+                scan_status_var.set(f"'{product_name}' 库存不足，当前库存: {stock}")
+                return False
+            line = cart.add(product_id, product_name, price, 1)
+            show_line(line)
+            order_items_tree.see(str(product_id))
+            scan_status_var.set(f"{product_name} x{line.quantity}")
+            update_order_total()
+            return True
+        
+        def scan_product(event=None):
+            barcode = scan_var.get().strip()
+            scan_var.set("")
+            if not barcode:
+                return
+            if barcode in pending_scans:
+                pending_scans[barcode] += 1
+                return
+            # 扫码时只查找内存中的缓存，不在界面线程中访问数据库
+            item = self.barcode_cache.lookup(barcode)
+            if item is not None and (self.offline or item[3] >= cart.quantity(item[0]) + 1):
+                add_scanned(barcode, item)
+                return
+            
+            # 缓存中没有这个条码，或者缓存的库存不足时在后台查询一次：缓存的库存只是提示，
+            # 其他收银台或库存页入库后不会失效；下单时的条件扣减会按实际库存检查
+            pending_scans[barcode] = 1
+            scan_status_var.set(f"正在查询条码 {barcode}...")
+            
+            def on_result(item):
+                count = pending_scans.pop(barcode, 0)
+                if not order_window.winfo_exists():
+                    return
+                for _ in range(count):
+                    if not add_scanned(barcode, item):
+                        break
+            
+            def on_error(e):
+                pending_scans.pop(barcode, None)
+                if order_window.winfo_exists():
+                    order_window.bell()
+                    scan_status_var.set(f"查询条码失败: {e}")
+            
+            self.query_runner.submit(
+                f"scan.{order_window}.{barcode}", lambda: self.barcode_cache.refresh(barcode),
+                on_error=on_error, on_result=on_result
+            )
+        
+        scan_entry.bind("<Return>", scan_product)
+        scan_entry.focus_set()
+        
         # 订单商品表格
         columns = ("product_id", "product_name", "price", "quantity", "subtotal")
         order_items_tree = ttk.Treeview(order_window, columns=columns, show="headings")
@@ -1654,16 +1706,52 @@ class RetailManagementSystem:
         
         order_items_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
+        def show_line(line):
+            """在表格中显示购物车的一行，只更新这一行"""
+            iid = str(line.product_id)
+            values = (line.product_id, line.name, line.price, line.quantity, line.subtotal)
+            if order_items_tree.exists(iid):
+                order_items_tree.item(iid, values=values)
+            else:
+                order_items_tree.insert("", "end", iid=iid, values=values)
+        
         # 删除选中商品
         def remove_selected_product():
             selected_item = order_items_tree.selection()
             if not selected_item:
                 return
                 
+            cart.remove(selected_item[0])
             order_items_tree.delete(selected_item[0])
             update_order_total()
         
-        ttk.Button(order_window, text="删除选中商品", command=remove_selected_product).pack(anchor=tk.W, padx=10, pady=5)
+        # 修改选中商品的数量，数量改为0时移除该行
+        def edit_selected_quantity(event=None):
+            selected_item = order_items_tree.selection()
+            if not selected_item:
+                return
+            line = cart.get(selected_item[0])
+            quantity = simpledialog.askinteger(
+                "修改数量", f"'{line.name}' 的数量:", parent=order_window,
+                initialvalue=line.quantity, minvalue=0
+            )
+            if quantity is None:
+                return
+            
+            # 库存不足时下单的条件扣减会失败并提示，这里不再单独查询库存
+            line = cart.set_quantity(line.product_id, quantity)
+            if line is None:
+                order_items_tree.delete(selected_item[0])
+            else:
+                show_line(line)
+            update_order_total()
+        
+        order_items_tree.bind("<Double-1>", edit_selected_quantity)
+        
+        item_buttons = ttk.Frame(order_window)
+        item_buttons.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(item_buttons, text="修改数量", command=edit_selected_quantity).pack(side=tk.LEFT)
+        ttk.Button(item_buttons, text="删除选中商品", command=remove_selected_product).pack(side=tk.LEFT, padx=5)
         
         # 订单总计框架
         total_frame = ttk.Frame(order_window)
@@ -1679,16 +1767,17 @@ class RetailManagementSystem:
         total_var = tk.StringVar(value="¥0.00")
         ttk.Label(total_frame, textvariable=total_var, font=("Arial", 12, "bold")).pack(side=tk.RIGHT, padx=5)
         
+        def get_discount():
+            try:
+                return Decimal(str(discount_var.get()))
+            except tk.TclError:
+                return Decimal("0")
+        
         def update_order_total():
-            total = 0
-            for item in order_items_tree.get_children():
-                subtotal = float(order_items_tree.item(item)['values'][4])
-                total += subtotal
-                
-            discount = discount_var.get()
-            final_total = total - discount
-            
-            total_var.set(f"¥{final_total:.2f}")
+            total_var.set(f"¥{cart.final_total(get_discount()):.2f}")
+        
+        # 合计只依赖购物车，修改折扣时直接重新计算
+        discount_var.trace_add("write", lambda *args: update_order_total())
         
         # 支付方式
         payment_frame = ttk.Frame(order_window)
@@ -1704,25 +1793,22 @@ class RetailManagementSystem:
         
         # 保存订单
         def save_order():
-            customer_text = customer_combo.get()
-            if not customer_text:
+            customer = customer_picker.selected()
+            if customer is None and not self.offline:
                 messagebox.showerror("错误", "请选择客户")
                 return
                 
-            customer_id = customer_dict[customer_text]
+            customer_id = customer['id'] if customer else None
+            if customer:
+                customer_picker.remember(customer)
             
-            items = order_items_tree.get_children()
-            if not items:
+            if not cart:
                 messagebox.showerror("错误", "订单不能为空")
                 return
                 
-            total = 0
-            for item in items:
-                subtotal = float(order_items_tree.item(item)['values'][4])
-                total += subtotal
-                
-            discount = discount_var.get()
-            final_total = total - discount
+            total = cart.total
+            discount = get_discount()
+            final_total = cart.final_total(discount)
             
             if final_total < 0:
                 messagebox.showerror("错误", "折扣不能大于商品总价")
@@ -1730,97 +1816,48 @@ class RetailManagementSystem:
                 
             payment_method = payment_var.get()
             
-            try:
-                # 在开始新事务前先回滚任何未完成的事务
-                try:
-                    self.connection.rollback()
-                except:
-                    pass
-                
-                # 开始事务
-                self.connection.start_transaction()
-                
-                # 检查库存是否足够
-                insufficient_stock = []
-                
-                for item in items:
-                    values = order_items_tree.item(item)['values']
-                    product_id = values[0]
-                    product_name = values[1]
-                    quantity = values[3]
-                    
-                    # 查询当前库存
-                    self.cursor.execute("""
-                        SELECT IFNULL(quantity, 0) AS current_stock 
-                        FROM inventory 
-                        WHERE product_id = %s
-                    """, (product_id,))
-                    
-                    result = self.cursor.fetchone()
-                    if not result:
-                        insufficient_stock.append(f"{product_name} - 库存信息不存在")
-                        continue
-                        
-                    current_stock = result['current_stock']
-                    
-                    if current_stock < quantity:
-                        insufficient_stock.append(f"{product_name} - 需要: {quantity}, 库存: {current_stock}")
-                
-                # 如果有库存不足的商品，显示错误并终止
-                if insufficient_stock:
-                    self.connection.rollback()
-                    error_message = "以下商品库存不足:\n\n" + "\n".join(insufficient_stock)
-                    messagebox.showerror("库存不足", error_message)
-                    return
-                
-                # 插入订单头
-                query = """
-                    INSERT INTO sales_orders (customer_id, total_amount, discount, final_amount, payment_method, status)
-                    VALUES (%s, %s, %s, %s, %s, 'completed')
-                """
-                self.cursor.execute(query, (customer_id, total, discount, final_total, payment_method))
-                
-                order_id = self.cursor.lastrowid
-                
-                # 插入订单明细
-                for item in items:
-                    values = order_items_tree.item(item)['values']
-                    product_id = values[0]
-                    quantity = values[3]
-                    price = values[2]
-                    subtotal = values[4]
-                    
-                    query = """
-                        INSERT INTO sales_order_items (order_id, product_id, quantity, price, subtotal)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """
-                    self.cursor.execute(query, (order_id, product_id, quantity, price, subtotal))
-                    
-                    # 更新商品库存
-                    self.cursor.execute("""
-                        UPDATE inventory 
-                        SET quantity = quantity - %s 
-                        WHERE product_id = %s
-                    """, (quantity, product_id))
-                    
-                    # 更新products表中的stock字段，保持一致性
-                    self.cursor.execute("""
-                        UPDATE products 
-                        SET stock = (SELECT quantity FROM inventory WHERE product_id = %s) 
-                        WHERE id = %s
-                    """, (product_id, product_id))
-                
-                # 提交事务
-                self.connection.commit()
-                messagebox.showinfo("成功", f"订单创建成功，订单号: {order_id}")
+            lines = cart.lines()
+            names = cart.names()
+            
+            def save_offline():
+                # 数据库不可用：订单写入本地日志，恢复连接后由后台同步
+                self.journal.add(customer_id, lines, total, discount, final_total, payment_method)
+                pending = self.journal.counts().get('pending', 0)
+                self.status_var.set(f"离线模式：{pending} 个订单等待同步")
+                messagebox.showinfo("离线下单", f"数据库暂时不可用，订单已保存在本地（{pending} 个待同步），恢复连接后自动同步")
                 order_window.destroy()
-                self.load_orders()
-                # 刷新库存状态
-                self.load_inventory_status()
+            
+            if self.offline:
+                save_offline()
+                return
+            
+            try:
+                # 明细、库存扣减、库存日志在一个事务中批量写入，语句条数与商品行数无关
+                order_id = checkout(self.db, customer_id, lines, total, discount, final_total, payment_method)
+            except InsufficientStockError as e:
+                details = [
+                    f"{names.get(product_id, product_id)} - 库存信息不存在" if stock is None
+                    else f"{names.get(product_id, product_id)} - 需要: {quantity}, 库存: {stock}"
+                    for product_id, quantity, stock in e.shortages
+                ]
+                messagebox.showerror("库存不足", "以下商品库存不足:\n\n" + "\n".join(details))
+                return
             except Error as e:
-                # 回滚事务
-                self.connection.rollback()
+                if is_connection_error(e):
+                    self.offline = True
+                    save_offline()
+                    return
                 messagebox.showerror("错误", f"创建订单失败: {e}")
+                return
+            
+            sold_ids = [product_id for product_id, _, _ in lines]
+            messagebox.showinfo("成功", f"订单创建成功，订单号: {order_id}")
+            order_window.destroy()
+            # 只刷新新订单和受影响商品所在的行
+            self.order_grid.refresh_rows([order_id])
+            self.barcode_cache.invalidate(sold_ids)
+            self.product_grid.refresh_rows(sold_ids)
+            self.refresh_inventory_rows(sold_ids)
         
         # 按钮框架
         button_frame = ttk.Frame(order_window)
@@ -1849,11 +1886,10 @@ class RetailManagementSystem:
                     c.name AS customer_name,
                     c.phone AS customer_phone
                 FROM sales_orders so
-                JOIN customers c ON so.customer_id = c.id
+                LEFT JOIN customers c ON so.customer_id = c.id
                 WHERE so.id = %s
             """
-            self.cursor.execute(query, (order_id,))
-            order = self.cursor.fetchone()
+            order = self.db.query_one(query, (order_id,))
             
             if not order:
                 messagebox.showinfo("提示", "订单不存在")
@@ -1868,8 +1904,7 @@ class RetailManagementSystem:
                 JOIN products p ON soi.product_id = p.id
                 WHERE soi.order_id = %s
             """
-            self.cursor.execute(query, (order_id,))
-            items = self.cursor.fetchall()
+            items = self.db.query(query, (order_id,))
             
             # 创建订单详情窗口
             detail_window = tk.Toplevel(self.root)
@@ -1882,7 +1917,7 @@ class RetailManagementSystem:
             info_frame.pack(fill=tk.X, padx=10, pady=5)
             
             ttk.Label(info_frame, text=f"订单号: {order['id']}").grid(row=0, column=0, sticky=tk.W, pady=2)
-            ttk.Label(info_frame, text=f"客户: {order['customer_name']} ({order['customer_phone']})").grid(row=0, column=1, sticky=tk.W, pady=2)
+            ttk.Label(info_frame, text=f"客户: {order['customer_name']} ({order['customer_phone']})" if order['customer_name'] else "客户: 散客").grid(row=0, column=1, sticky=tk.W, pady=2)
             ttk.Label(info_frame, text=f"创建时间: {order['created_at']}").grid(row=1, column=0, sticky=tk.W, pady=2)
             ttk.Label(info_frame, text=f"支付方式: {order['payment_method'].capitalize()}").grid(row=1, column=1, sticky=tk.W, pady=2)
             ttk.Label(info_frame, text=f"状态: {order['status'].capitalize()}").grid(row=2, column=0, sticky=tk.W, pady=2)
@@ -1930,25 +1965,22 @@ class RetailManagementSystem:
             messagebox.showerror("错误", f"获取订单详情失败: {e}")
     
     def update_order_status(self):
-        """更新订单状态"""
-        selected_item = self.order_tree.selection()
-        if not selected_item:
+        """更新选中订单的状态，可以多选批量更新"""
+        selected_items = self.order_tree.selection()
+        if not selected_items:
             messagebox.showinfo("提示", "请先选择要更新的订单")
             return
         
-        item = self.order_tree.item(selected_item[0])
-        values = item['values']
-        
-        order_id = values[0]
-        current_status = values[6]
-        
-        if current_status == "cancelled":
+        orders = [self.order_tree.item(item)['values'] for item in selected_items]
+        order_ids = [values[0] for values in orders if values[6] != "cancelled"]
+        if not order_ids:
             messagebox.showinfo("提示", "已取消的订单不能再更新状态")
             return
-            
+        current_status = orders[0][6] if len(orders) == 1 else ""
+        
         new_status = simpledialog.askstring(
             "更新订单状态", 
-            "请输入新状态 (pending/completed):",
+            f"已选择 {len(order_ids)} 个订单，请输入新状态 (pending/completed/cancelled):",
             initialvalue=current_status
         )
         
@@ -1956,244 +1988,108 @@ class RetailManagementSystem:
             return
             
         new_status = new_status.lower().strip()
-        if new_status not in ["pending", "completed", "cancelled"]:
+        if new_status not in ORDER_STATUSES:
             messagebox.showinfo("提示", "无效的订单状态")
             return
             
         if new_status == current_status:
             messagebox.showinfo("提示", "新状态与当前状态相同")
             return
-            
-        confirm = messagebox.askyesno("确认", f"确定要将订单状态从 '{current_status}' 更新为 '{new_status}' 吗？")
-        if not confirm:
+        
+        if len(order_ids) == 1:
+            message = f"确定要将订单状态从 '{current_status}' 更新为 '{new_status}' 吗？"
+        else:
+            message = f"确定要将 {len(order_ids)} 个订单的状态更新为 '{new_status}' 吗？"
+        if new_status == "cancelled":
+            message += "\n\n取消的订单会恢复库存"
+        if not messagebox.askyesno("确认", message):
             return
             
         try:
-            # 开始事务
-            self.connection.start_transaction()
-            
-            # 如果是取消订单，需要恢复库存
-            if new_status == "cancelled" and current_status != "cancelled":
-                # 获取订单项
-                self.cursor.execute("""
-                    SELECT product_id, quantity FROM sales_order_items
-                    WHERE order_id = %s
-                """, (order_id,))
-                order_items = self.cursor.fetchall()
-                
-                # 恢复库存
-                for item in order_items:
-                    product_id = item['product_id']
-                    quantity = item['quantity']
-                    
-                    # 更新库存
-                    self.cursor.execute("""
-                        UPDATE inventory SET quantity = quantity + %s
-                        WHERE product_id = %s
-                    """, (quantity, product_id))
-                    
-                    # 记录库存日志
-                    self.cursor.execute("""
-                        INSERT INTO inventory_logs (
-                            product_id, 
-                            change_type, 
-                            quantity, 
-                            quantity_change,
-                            reference_id, 
-                            reference_type,
-                            before_quantity,
-                            after_quantity,
-                            notes
-                        )
-                        SELECT 
-                            %s,
-                            'adjustment',
-                            quantity,
-                            %s,
-                            %s,
-                            'sales_order',
-                            quantity - %s,
-                            quantity,
-                            CONCAT('订单 #', %s, ' 已取消')
-                        FROM inventory
-                        WHERE product_id = %s
-                    """, (product_id, quantity, order_id, quantity, order_id, product_id))
-            
-            # 更新订单状态
-            self.cursor.execute("UPDATE sales_orders SET status = %s WHERE id = %s", (new_status, order_id))
-            
-            # 提交事务
-            self.connection.commit()
-            messagebox.showinfo("成功", "订单状态更新成功")
-            self.load_orders()
+            # 库存恢复和状态更新在一个事务中批量完成，同一订单的库存只恢复一次
+            changed, restored_ids = update_order_statuses(self.db, order_ids, new_status)
         except Error as e:
-            # 回滚事务
-            self.connection.rollback()
             messagebox.showerror("错误", f"更新订单状态失败: {e}")
-            
-            # 显示详细错误信息并尝试修复
-            error_msg = str(e)
-            if "remaining_quantity" in error_msg:
-                try:
-                    # 删除可能存在问题的触发器
-                    self.cursor.execute("SHOW TRIGGERS WHERE `Table` = 'sales_orders'")
-                    triggers = self.cursor.fetchall()
-                    for trigger in triggers:
-                        trigger_name = trigger.get('Trigger')
-                        if trigger_name:
-                            self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
-                    
-                    self.connection.commit()
-                    messagebox.showinfo("提示", "检测到问题触发器并已尝试移除，请再次尝试更新订单状态")
-                except Error as e2:
-                    messagebox.showerror("错误", f"尝试修复触发器失败: {e2}")
+            return
+        
+        messagebox.showinfo("成功", f"已更新 {len(changed)} 个订单的状态")
+        self.order_grid.refresh_rows(order_ids)
+        if restored_ids:
+            # 恢复了库存的商品，只刷新这些商品的行
+            self.barcode_cache.invalidate(restored_ids)
+            self.product_grid.refresh_rows(restored_ids)
+            self.refresh_inventory_rows(restored_ids)
+    
+    def inventory_values(self, item):
+        """库存状态表格的一行"""
+        # 使用正确的列名
+        return (
+            item['product_id'],
+            item['product_name'],
+            item['category'] if 'category' in item else '',
+            '',  # barcode列不存在，使用空字符串
+            item['current_stock'],
+            10,  # min_stock_level列不存在，使用默认值
+            100,  # max_stock_level列不存在，使用默认值
+            item['stock_status'],
+            item['price'],
+            0.0,  # cost列不存在，使用默认值
+            None  # last_updated列不存在，使用None
+        )
+    
+    def inventory_tags(self, item):
+        """根据库存状态设置行颜色"""
+        return (item['stock_status'],)
+    
+    def inventory_report_query(self, report_type):
+        """库存报表的查询，返回 (SQL, 参数)；按状态导出时使用 stock_status 索引"""
+        query = """
+            SELECT product_id, product_name, price, category, current_stock, stock_status
+            FROM inventory_status
+        """
+        if report_type == "all":
+            return query + " ORDER BY product_id", ()
+        return query + " WHERE stock_status = %s ORDER BY product_id", ("不足" if report_type == "low" else "过多",)
     
     def load_inventory_status(self):
         """加载库存状态数据"""
-        # 清空现有数据
-        try:
-            for item in self.inventory_tree.get_children():
-                self.inventory_tree.delete(item)
-            
-            # 检查数据库连接
-            if not self.connection.is_connected():
-                try:
-                    self.connection = mysql.connector.connect(**self.db_config)
-                    self.cursor = self.connection.cursor(dictionary=True)
-                except Error as e:
-                    messagebox.showerror("错误", f"数据库重新连接失败: {e}")
-                    return
-            
-            # 检查视图是否存在
-            try:
-                self.cursor.execute("SHOW TABLES LIKE 'product_inventory_status'")
-                if not self.cursor.fetchone():
-                    # 创建product_inventory_status视图 - 使用与现有视图相同的列名
-                    self.cursor.execute("""
-                        CREATE OR REPLACE VIEW product_inventory_status AS
-                        SELECT 
-                            p.id AS product_id,
-                            p.name AS product_name,
-                            p.price AS price,
-                            p.category AS category,
-                            IFNULL(i.quantity, 0) AS current_stock,
-                            CASE 
-                                WHEN IFNULL(i.quantity, 0) <= IFNULL(i.min_stock_level, 10) THEN '不足'
-                                WHEN IFNULL(i.quantity, 0) >= IFNULL(i.max_stock_level, 100) THEN '过多'
-                                ELSE '充足'
-                            END AS stock_status
-                        FROM 
-                            products p
-                        LEFT JOIN 
-                            inventory i ON p.id = i.product_id
-                    """)
-                    self.connection.commit()
-            except Error as e:
-                messagebox.showerror("错误", f"检查或创建视图失败: {e}")
-                return
-            
-            # 检查inventory表是否有数据
-            try:
-                self.cursor.execute("SELECT COUNT(*) as count FROM inventory")
-                count = self.cursor.fetchone()['count']
-                
-                if count == 0:
-                    # 初始化库存数据
-                    self.cursor.execute("""
-                        INSERT INTO inventory (product_id, quantity, min_stock_level, max_stock_level)
-                        SELECT id, stock, 10, 100 FROM products
-                        ON DUPLICATE KEY UPDATE 
-                            quantity = products.stock,
-                            min_stock_level = 10,
-                            max_stock_level = 100
-                    """)
-                    self.connection.commit()
-            except Error as e:
-                messagebox.showerror("错误", f"检查或初始化库存表失败: {e}")
-                return
-            
-            # 加载数据
-            try:
-                # 不使用ORDER BY子句
-                query = "SELECT * FROM product_inventory_status"
-                self.cursor.execute(query)
-                inventory_items = self.cursor.fetchall()
-                
-                if not inventory_items:
-                    self.inventory_status_var.set("没有库存数据")
-                    return
-                
-                for item in inventory_items:
-                    # 使用正确的列名
-                    values = (
-                        item['product_id'],
-                        item['product_name'],
-                        item['category'] if 'category' in item else '',
-                        '',  # barcode列不存在，使用空字符串
-                        item['current_stock'],
-                        10,  # min_stock_level列不存在，使用默认值
-                        100,  # max_stock_level列不存在，使用默认值
-                        item['stock_status'],
-                        item['price'],
-                        0.0,  # cost列不存在，使用默认值
-                        None  # last_updated列不存在，使用None
-                    )
-                    
-                    # 根据库存状态设置行颜色
-                    tag = item['stock_status']
-                    self.inventory_tree.insert("", "end", values=values, tags=(tag,))
-                
-                self.inventory_status_var.set(f"共 {len(inventory_items)} 条记录")
-            except Error as e:
-                messagebox.showerror("错误", f"查询库存数据失败: {e}")
-        except Exception as e:
-            messagebox.showerror("错误", f"加载库存状态时发生未知错误: {e}")
+        # 库存状态汇总表由数据库迁移创建并由触发器维护，这里只做查询
+        self.inventory_grid.load()
+    
+    def refresh_inventory_rows(self, product_ids):
+        """只刷新指定商品在库存状态表格中的行"""
+        self.inventory_grid.refresh_rows(product_ids)
     
     def search_inventory(self):
         """搜索库存"""
         search_term = self.inventory_search_var.get().strip()
         if not search_term:
+            self.search_terms.pop("inventory", None)
             self.load_inventory_status()
             return
         
-        # 清空现有数据
-        for item in self.inventory_tree.get_children():
-            self.inventory_tree.delete(item)
+        if search_term in ("不足", "过多", "充足"):
+            self.search_terms.pop("inventory", None)
+            # 按库存状态筛选，只扫描 stock_status 索引中匹配的行
+            self.inventory_grid.load("stock_status = %s", (search_term,), "找到 {} 条记录", "搜索库存失败")
+            return
         
-        try:
-            # 使用正确的列名进行查询
-            query = """
-                SELECT * FROM product_inventory_status 
-                WHERE product_name LIKE %s OR category LIKE %s OR stock_status LIKE %s
-                ORDER BY product_id
-            """
-            search_pattern = f"%{search_term}%"
-            self.cursor.execute(query, (search_pattern, search_pattern, search_pattern))
-            inventory_items = self.cursor.fetchall()
-            
-            for item in inventory_items:
-                # 使用正确的列名构建显示值
-                values = (
-                    item['product_id'],
-                    item['product_name'],
-                    item['category'],
-                    '',  # barcode列不存在，使用空字符串
-                    item['current_stock'],
-                    10,  # min_stock_level列不存在，使用默认值
-                    100,  # max_stock_level列不存在，使用默认值
-                    item['stock_status'],
-                    item['price'],
-                    0.0,  # cost列不存在，使用默认值
-                    None  # last_updated列不存在，使用None
-                )
-                
-                # 根据库存状态设置行颜色
-                tag = item['stock_status']
-                self.inventory_tree.insert("", "end", values=values, tags=(tag,))
-            
-            self.inventory_status_var.set(f"找到 {len(inventory_items)} 条记录")
-        except Error as e:
-            messagebox.showerror("错误", f"搜索库存失败: {e}")
+        # 使用商品名称和分类上的全文索引，未选择排序列时按相关度排序
+        select = inventory_search_select(search_term)
+        if select is None:
+            self.load_inventory_status()
+            return
+        args = dict(done_text="找到 {} 条记录", error_text="搜索库存失败",
+                    select=select, sort=[("relevance", "relevance", True)])
+        terms = search_term.lower().split()
+        if self.narrows_search("inventory", search_term.lower(), "text"):
+            # 关键字继续输入时先在已显示的行中筛选
+            self.inventory_grid.narrow(
+                lambda row: all(term in f"{row['product_name']} {row['category'] or ''}".lower() for term in terms),
+                **args
+            )
+        else:
+            self.inventory_grid.load(**args)
     
     def adjust_inventory(self):
         """调整库存"""
@@ -2249,16 +2145,15 @@ class RetailManagementSystem:
                 return
             
             try:
-                # 调用存储过程调整库存
-                query = "CALL adjust_inventory(%s, %s, %s)"
-                self.cursor.execute(query, (product_id, new_quantity, notes))
-                self.connection.commit()
+                # 库存、商品表库存字段和调整记录在一个事务中写入
+                self.db.run_transaction(lambda cursor: set_stock(cursor, product_id, new_quantity, notes))
                 messagebox.showinfo("成功", "库存调整成功")
                 adjust_window.destroy()
                 
-                # 刷新库存状态和商品列表
-                self.load_inventory_status()
-                self.load_products()  # 添加刷新商品列表
+                # 刷新库存状态和商品列表中该商品的行
+                self.barcode_cache.invalidate([product_id])
+                self.refresh_inventory_rows([product_id])
+                self.product_grid.refresh_rows([product_id])
             except Error as e:
                 messagebox.showerror("错误", f"库存调整失败: {e}")
         
@@ -2269,6 +2164,218 @@ class RetailManagementSystem:
         ttk.Button(button_frame, text="保存", command=save_adjustment).pack(side=tk.RIGHT, padx=5)
         ttk.Button(button_frame, text="取消", command=adjust_window.destroy).pack(side=tk.RIGHT, padx=5)
     
+    def import_stocktake(self):
+        """从 CSV 或扫码枪导出的文件导入盘点数量，预览差异后一次应用到库存"""
+        from tkinter import filedialog
+        file_path = filedialog.askopenfilename(
+            title="选择盘点文件",
+            filetypes=[("盘点文件", "*.csv *.txt"), ("所有文件", "*.*")]
+        )
+        if not file_path:
+            return
+        
+        def load():
+            # 在后台读取文件、解析条码并写入暂存表
+            counts, bad_lines = read_counts(file_path)
+            quantities, unknown = resolve_counts(self.db, counts)
+            stocktake_id = create_stocktake(self.db, quantities, f"导入 {os.path.basename(file_path)}") if quantities else None
+            return stocktake_id, len(quantities), bad_lines, unknown
+        
+        def on_loaded(result):
+            stocktake_id, count, bad_lines, unknown = result
+            problems = []
+            if bad_lines:
+                problems.append(f"{len(bad_lines)} 行无法识别（第 {', '.join(map(str, bad_lines[:10]))} 行）")
+            if unknown:
+                problems.append(f"{len(unknown)} 个条码或商品ID不存在（{', '.join(unknown[:10])}）")
+            self.status_var.set("就绪")
+            if stocktake_id is None:
+                messagebox.showinfo("提示", "文件中没有可导入的盘点数量" + ("\n\n" + "\n".join(problems) if problems else ""))
+                return
+            self.show_stocktake_preview(stocktake_id, count, problems)
+        
+        def on_error(e):
+            self.status_var.set("就绪")
+            messagebox.showerror("错误", f"导入盘点文件失败: {e}")
+        
+        self.status_var.set("正在导入盘点文件...")
+        self.query_runner.submit("stocktake", load, on_error=on_error, on_result=on_loaded)
+    
+    def show_stocktake_preview(self, stocktake_id, count, problems):
+        """盘点差异预览，确认后应用盘点"""
+        preview_window = tk.Toplevel(self.root)
+        preview_window.title(f"盘点单 #{stocktake_id}")
+        preview_window.geometry("650x500")
+        preview_window.transient(self.root)
+        
+        top_frame = ttk.Frame(preview_window)
+        top_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(top_frame, text=f"已导入 {count} 个商品的盘点数量").pack(anchor=tk.W)
+        for problem in problems:
+            ttk.Label(top_frame, text=problem, foreground="red").pack(anchor=tk.W)
+        zero_missing_var = tk.BooleanVar(value=False)
+        
+        columns = ("product_id", "product_name", "book_quantity", "counted", "difference")
+        tree = ttk.Treeview(preview_window, columns=columns, show="headings")
+        for col, title, width in zip(columns, ("ID", "商品名称", "账面库存", "盘点数量", "差异"), (60, 220, 80, 80, 80)):
+            tree.heading(col, text=title)
+            tree.column(col, width=width)
+        scrollbar = ttk.Scrollbar(preview_window, orient="vertical", command=tree.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        status_var = tk.StringVar()
+        
+        def load_differences():
+            zero_missing = zero_missing_var.get()
+            self.run_tree_query(
+                "stocktake.preview", tree, status_var,
+                lambda: differences(self.db, stocktake_id, zero_missing),
+                lambda row: (row['product_id'], row['product_name'], row['book_quantity'], row['counted'],
+                             f"{row['counted'] - row['book_quantity']:+d}"),
+                "{} 个商品库存有差异", "计算盘点差异失败", iid_field='product_id'
+            )
+        
+        ttk.Checkbutton(top_frame, text="未盘到的商品库存清零", variable=zero_missing_var,
+                        command=load_differences).pack(anchor=tk.W)
+        
+        bottom_frame = ttk.Frame(preview_window)
+        bottom_frame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(bottom_frame, textvariable=status_var).pack(side=tk.LEFT)
+        
+        def apply():
+            if not messagebox.askyesno("确认", "确定按盘点数量更新库存吗？", parent=preview_window):
+                return
+            apply_button.config(state=tk.DISABLED)
+            zero_missing = zero_missing_var.get()
+            
+            def on_result(changed):
+                if preview_window.winfo_exists():
+                    preview_window.destroy()
+                messagebox.showinfo("成功", f"盘点完成，{len(changed)} 个商品的库存已更新")
+                self.barcode_cache.invalidate(changed)
+                self.load_inventory_status()
+                self.product_grid.refresh_changed()
+                self.load_inventory_logs()
+            
+            def on_error(e):
+                if preview_window.winfo_exists():
+                    apply_button.config(state=tk.NORMAL)
+                messagebox.showerror("错误", f"应用盘点失败: {e}")
+            
+            self.query_runner.submit(
+                "stocktake.apply", lambda: apply_stocktake(self.db, stocktake_id, zero_missing),
+                on_error=on_error, on_result=on_result
+            )
+        
+        def discard():
+            self.query_runner.cancel("stocktake.preview")
+            preview_window.destroy()
+            try:
+                discard_stocktake(self.db, stocktake_id)
+            except Error as e:
+                messagebox.showerror("错误", f"放弃盘点单失败: {e}")
+        
+        apply_button = ttk.Button(bottom_frame, text="应用盘点", command=apply)
+        apply_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(bottom_frame, text="放弃", command=discard).pack(side=tk.RIGHT, padx=5)
+        preview_window.protocol("WM_DELETE_WINDOW", discard)
+        
+        load_differences()
+    
+    def show_stock_as_of(self):
+        """查看所有商品在某个时间点的库存
+
+        输入 YYYY-MM-DD 时为当天结束时（次日零点），也可以输入 YYYY-MM-DD HH:MM
+        """
+        text = self.as_of_var.get().strip()
+        at = None
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                at = datetime.datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            if fmt == "%Y-%m-%d":
+                at += datetime.timedelta(days=1)
+            break
+        if at is None:
+            messagebox.showinfo("提示", "请输入时间点，格式为 YYYY-MM-DD 或 YYYY-MM-DD HH:MM")
+            return
+        
+        as_of_window = tk.Toplevel(self.root)
+        as_of_window.title(f"历史库存 - {text}")
+        as_of_window.geometry("600x500")
+        
+        top_frame = ttk.Frame(as_of_window)
+        top_frame.pack(fill=tk.X, padx=10, pady=5)
+        description_var = tk.StringVar(value="正在计算...")
+        ttk.Label(top_frame, textvariable=description_var).pack(side=tk.LEFT)
+        
+        columns = ("product_id", "product_name", "category", "quantity")
+        tree = ttk.Treeview(as_of_window, columns=columns, show="headings")
+        for col, title, width in zip(columns, ("ID", "商品名称", "分类", "库存"), (60, 220, 120, 80)):
+            tree.heading(col, text=title)
+            tree.column(col, width=width)
+        scrollbar = ttk.Scrollbar(as_of_window, orient="vertical", command=tree.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        status_var = tk.StringVar()
+        ttk.Label(as_of_window, textvariable=status_var).pack(side=tk.LEFT, padx=10, pady=5)
+        
+        # 查询语句由最近的快照决定，先在后台选出基准，再分批加载结果
+        query = {}
+        
+        def on_query(result):
+            query['sql'], query['params'], description = result
+            description_var.set(f"{at:%Y-%m-%d %H:%M} 的库存，{description}")
+            self.run_tree_query(
+                "stock_as_of", tree, status_var,
+                lambda: self.db.query(query['sql'], query['params']),
+                lambda row: (row['product_id'], row['product_name'], row['category'], row['quantity']),
+                "共 {} 个商品", "查询历史库存失败"
+            )
+        
+        def on_error(e):
+            description_var.set("查询历史库存失败")
+            messagebox.showerror("错误", f"查询历史库存失败: {e}")
+        
+        self.query_runner.submit("stock_as_of", lambda: stock_as_of_query(self.db, at), on_error=on_error, on_result=on_query)
+        
+        def export():
+            if not query:
+                return
+            from tkinter import filedialog
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=".csv",
+                filetypes=[("CSV文件", "*.csv")],
+                initialfile=f"库存_{at:%Y%m%d_%H%M}.csv"
+            )
+            if not file_path:
+                return
+            try:
+                import csv
+                rows = self.db.query(query['sql'], query['params'])
+                with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(['商品ID', '商品名称', '分类', '库存'])
+                    for row in rows:
+                        writer.writerow([row['product_id'], row['product_name'], row['category'], row['quantity']])
+                messagebox.showinfo("成功", f"已导出 {len(rows)} 个商品的库存")
+            except (Error, OSError) as e:
+                messagebox.showerror("错误", f"导出失败: {e}")
+        
+        ttk.Button(top_frame, text="导出CSV", command=export).pack(side=tk.RIGHT)
+        
+        def close():
+            # 关闭窗口时停止尚未完成的查询，避免结果交付到已销毁的表格
+            self.query_runner.cancel("stock_as_of")
+            as_of_window.destroy()
+        
+        as_of_window.protocol("WM_DELETE_WINDOW", close)
+    
     def export_inventory_report(self):
         """导出库存报表"""
         # 创建导出窗口
@@ -2333,17 +2440,7 @@ class RetailManagementSystem:
                 
             try:
                 # 根据报表类型获取数据
-                if report_type == "all":
-                    query = "SELECT * FROM product_inventory_status ORDER BY product_id"
-                    self.cursor.execute(query)
-                elif report_type == "low":
-                    query = "SELECT * FROM product_inventory_status WHERE stock_status = '不足' ORDER BY product_id"
-                    self.cursor.execute(query)
-                else:  # high
-                    query = "SELECT * FROM product_inventory_status WHERE stock_status = '过多' ORDER BY product_id"
-                    self.cursor.execute(query)
-                    
-                inventory_items = self.cursor.fetchall()
+                inventory_items = self.db.query(*self.inventory_report_query(report_type))
                 
                 if not inventory_items:
                     messagebox.showinfo("提示", "没有符合条件的数据")
@@ -2383,22 +2480,12 @@ class RetailManagementSystem:
             
             try:
                 # 根据报表类型获取数据
-                if report_type == "all":
-                    query = "SELECT * FROM product_inventory_status ORDER BY product_id"
-                    self.cursor.execute(query)
-                elif report_type == "low":
-                    query = "SELECT * FROM product_inventory_status WHERE stock_status = '不足' ORDER BY product_id"
-                    self.cursor.execute(query)
-                else:  # high
-                    query = "SELECT * FROM product_inventory_status WHERE stock_status = '过多' ORDER BY product_id"
-                    self.cursor.execute(query)
-                    
-                inventory_items = self.cursor.fetchall()
+                inventory_items = self.db.query(*self.inventory_report_query(report_type))
                 
                 # 导出为CSV
                 import csv
                 with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                    # 使用视图中实际存在的字段名
+                    # 导出库存状态汇总表中的字段
                     fieldnames = ['product_id', 'product_name', 'price', 'category', 'current_stock', 'stock_status']
                     writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                     
@@ -2448,197 +2535,107 @@ class RetailManagementSystem:
         cancel_button = ttk.Button(button_frame, text="取消", command=export_window.destroy)
         cancel_button.pack(side=tk.RIGHT, padx=5)
     
+    def inventory_log_values(self, log):
+        """库存日志表格的一行"""
+        change_type_display = {
+            'in': '入库',
+            'out': '出库',
+            'adjustment': '调整',
+            'sale': '销售'
+        }.get(log['change_type'], log['change_type'])
+        
+        reference_type_display = {
+            'stock_in': '入库单',
+            'stock_out': '出库单',
+            'adjustment': '库存调整',
+            'sales_order': '销售订单',
+            'stocktake': '盘点单'
+        }.get(log['reference_type'], log['reference_type'])
+        
+        return (
+            log['id'],
+            # 商品删除后日志仍然保留
+            log['product_name'] or f"已删除商品 #{log['product_id']}",
+            change_type_display,
+            log['quantity'],
+            log['quantity_change'] if 'quantity_change' in log else 0,
+            reference_type_display,
+            log['before_quantity'],
+            log['after_quantity'],
+            log['notes'],
+            log['created_at']
+        )
+    
     def load_inventory_logs(self):
-        """加载库存日志"""
-        # 清空现有数据
-        for item in self.inventory_log_tree.get_children():
-            self.inventory_log_tree.delete(item)
-        
-        try:
-            # 获取库存日志
-            query = """
-                SELECT 
-                    il.*,
-                    p.name AS product_name
-                FROM inventory_logs il
-                JOIN products p ON il.product_id = p.id
-                ORDER BY il.created_at DESC
-                LIMIT 1000
-            """
-            self.cursor.execute(query)
-            logs = self.cursor.fetchall()
-            
-            for log in logs:
-                change_type_display = {
-                    'in': '入库',
-                    'out': '出库',
-                    'adjustment': '调整',
-                    'sale': '销售'
-                }.get(log['change_type'], log['change_type'])
-                
-                reference_type_display = {
-                    'stock_in': '入库单',
-                    'stock_out': '出库单',
-                    'adjustment': '库存调整',
-                    'sales_order': '销售订单'
-                }.get(log['reference_type'], log['reference_type'])
-                
-                values = (
-                    log['id'],
-                    log['product_name'],
-                    change_type_display,
-                    log['quantity'],
-                    log['quantity_change'] if 'quantity_change' in log else 0,
-                    reference_type_display,
-                    log['before_quantity'],
-                    log['after_quantity'],
-                    log['notes'],
-                    log['created_at']
-                )
-                
-                self.inventory_log_tree.insert("", "end", values=values)
-            
-            self.inventory_log_status_var.set(f"显示最近 {len(logs)} 条记录")
-        except Error as e:
-            messagebox.showerror("错误", f"加载库存日志失败: {e}")
+        """加载库存日志，从最新的一页开始"""
+        self.inventory_log_grid.load(done_text="共约 {} 条记录")
+    
+    def load_older_inventory_logs(self):
+        """在表格末尾加载更早的一页日志"""
+        if not self.inventory_log_grid.load_more():
+            self.inventory_log_status_var.set("没有更早的记录了")
     
     def filter_inventory_logs(self):
-        """筛选库存日志"""
-        start_date = self.start_date_var.get().strip()
-        end_date = self.end_date_var.get().strip()
+        """按日期范围筛选库存日志"""
+        try:
+            start_date = parse_date(self.start_date_var.get())
+            end_date = parse_date(self.end_date_var.get())
+        except ValueError:
+            messagebox.showerror("错误", "日期格式应为 YYYY-MM-DD")
+            return
         
-        # 清空现有数据
-        for item in self.inventory_log_tree.get_children():
-            self.inventory_log_tree.delete(item)
+        # 半开区间直接比较 created_at，不对列做 DATE() 运算，可以使用索引和分区裁剪
+        conditions = []
+        params = []
         
-        try:
-            # 构建查询条件
-            conditions = []
-            params = []
+        if start_date:
+            conditions.append("il.created_at >= %s")
+            params.append(datetime.datetime.combine(start_date, datetime.time.min))
             
-            if start_date:
-                conditions.append("DATE(il.created_at) >= %s")
-                params.append(start_date)
-                
-            if end_date:
-                conditions.append("DATE(il.created_at) <= %s")
-                params.append(end_date)
-                
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            
-            # 获取库存日志
-            query = f"""
-                SELECT 
-                    il.*,
-                    p.name AS product_name
-                FROM inventory_logs il
-                JOIN products p ON il.product_id = p.id
-                WHERE {where_clause}
-                ORDER BY il.created_at DESC
-                LIMIT 1000
-            """
-            self.cursor.execute(query, params)
-            logs = self.cursor.fetchall()
-            
-            for log in logs:
-                change_type_display = {
-                    'in': '入库',
-                    'out': '出库',
-                    'adjustment': '调整',
-                    'sale': '销售'
-                }.get(log['change_type'], log['change_type'])
-                
-                reference_type_display = {
-                    'stock_in': '入库单',
-                    'stock_out': '出库单',
-                    'adjustment': '库存调整',
-                    'sales_order': '销售订单'
-                }.get(log['reference_type'], log['reference_type'])
-                
-                values = (
-                    log['id'],
-                    log['product_name'],
-                    change_type_display,
-                    log['quantity'],
-                    log['quantity_change'] if 'quantity_change' in log else 0,
-                    reference_type_display,
-                    log['before_quantity'],
-                    log['after_quantity'],
-                    log['notes'],
-                    log['created_at']
-                )
-                
-                self.inventory_log_tree.insert("", "end", values=values)
-            
-            self.inventory_log_status_var.set(f"显示 {len(logs)} 条记录")
-        except Error as e:
-            messagebox.showerror("错误", f"筛选库存日志失败: {e}")
+        if end_date:
+            # 包含结束日期当天
+            conditions.append("il.created_at < %s")
+            params.append(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+        
+        self.inventory_log_grid.load(
+            " AND ".join(conditions) if conditions else None, params,
+            done_text="筛选出 {} 条记录", error_text="筛选库存日志失败"
+        )
+    
+    def supplier_values(self, supplier):
+        """供应商表格的一行"""
+        return (
+            supplier['id'],
+            supplier['name'],
+            supplier['contact_person'],
+            supplier['phone'],
+            supplier['email'],
+            supplier['address'],
+            supplier['created_at']
+        )
     
     def load_suppliers(self):
         """加载供应商数据"""
-        # 清空现有数据
-        for item in self.supplier_tree.get_children():
-            self.supplier_tree.delete(item)
-        
-        try:
-            query = "SELECT * FROM suppliers ORDER BY id DESC"
-            self.cursor.execute(query)
-            suppliers = self.cursor.fetchall()
-            
-            for supplier in suppliers:
-                values = (
-                    supplier['id'],
-                    supplier['name'],
-                    supplier['contact_person'],
-                    supplier['phone'],
-                    supplier['email'],
-                    supplier['address'],
-                    supplier['created_at']
-                )
-                
-                self.supplier_tree.insert("", "end", values=values)
-            
-            self.supplier_status_var.set(f"共 {len(suppliers)} 条记录")
-        except Error as e:
-            messagebox.showerror("错误", f"加载供应商数据失败: {e}")
+        self.supplier_grid.load()
     
     def search_suppliers(self):
         """搜索供应商"""
         search_term = self.supplier_search_var.get().strip()
         if not search_term:
+            self.search_terms.pop("suppliers", None)
             self.load_suppliers()
             return
         
-        # 清空现有数据
-        for item in self.supplier_tree.get_children():
-            self.supplier_tree.delete(item)
-        
-        try:
-            query = """
-                SELECT * FROM suppliers 
-                WHERE name LIKE %s OR contact_person LIKE %s OR phone LIKE %s OR email LIKE %s OR address LIKE %s
-                ORDER BY id DESC
-            """
-            search_pattern = f"%{search_term}%"
-            self.cursor.execute(query, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-            suppliers = self.cursor.fetchall()
-            
-            for supplier in suppliers:
-                values = (
-                    supplier['id'],
-                    supplier['name'],
-                    supplier['contact_person'],
-                    supplier['phone'],
-                    supplier['email'],
-                    supplier['address'],
-                    supplier['created_at']
-                )
-                
-                self.supplier_tree.insert("", "end", values=values)
-            
-            self.supplier_status_var.set(f"找到 {len(suppliers)} 条记录")
-        except Error as e:
-            messagebox.showerror("错误", f"搜索供应商失败: {e}")
+        search_pattern = f"%{search_term}%"
+        args = ("name LIKE %s OR contact_person LIKE %s OR phone LIKE %s OR email LIKE %s OR address LIKE %s",
+                (search_pattern,) * 5, "找到 {} 条记录", "搜索供应商失败")
+        if self.narrows_search("suppliers", search_term.lower(), "text"):
+            fields = ('name', 'contact_person', 'phone', 'email', 'address')
+            self.supplier_grid.narrow(
+                lambda row: any(search_term.lower() in (row.get(field) or "").lower() for field in fields), *args
+            )
+        else:
+            self.supplier_grid.load(*args)
     
     def add_supplier(self):
         """添加供应商"""
@@ -2693,12 +2690,11 @@ class RetailManagementSystem:
                     INSERT INTO suppliers (name, contact_person, phone, email, address)
                     VALUES (%s, %s, %s, %s, %s)
                 """
-                self.cursor.execute(query, (name, contact_person, phone, email, address))
-                self.connection.commit()
+                _, supplier_id = self.db.execute(query, (name, contact_person, phone, email, address))
                 
                 messagebox.showinfo("成功", "供应商添加成功")
                 add_window.destroy()
-                self.load_suppliers()
+                self.supplier_grid.refresh_rows([supplier_id])
             except Error as e:
                 messagebox.showerror("错误", f"添加供应商失败: {e}")
         
@@ -2724,8 +2720,7 @@ class RetailManagementSystem:
         try:
             # 获取供应商信息
             query = "SELECT * FROM suppliers WHERE id = %s"
-            self.cursor.execute(query, (supplier_id,))
-            supplier = self.cursor.fetchone()
+            supplier = self.db.query_one(query, (supplier_id,))
             
             if not supplier:
                 messagebox.showinfo("提示", "供应商不存在")
@@ -2783,12 +2778,11 @@ class RetailManagementSystem:
                         SET name = %s, contact_person = %s, phone = %s, email = %s, address = %s
                         WHERE id = %s
                     """
-                    self.cursor.execute(query, (name, contact_person, phone, email, address, supplier_id))
-                    self.connection.commit()
+                    self.db.execute(query, (name, contact_person, phone, email, address, supplier_id))
                     
                     messagebox.showinfo("成功", "供应商更新成功")
                     edit_window.destroy()
-                    self.load_suppliers()
+                    self.supplier_grid.refresh_rows([supplier_id])
                 except Error as e:
                     messagebox.showerror("错误", f"更新供应商失败: {e}")
             
@@ -2821,38 +2815,13 @@ class RetailManagementSystem:
         
         try:
             query = "DELETE FROM suppliers WHERE id = %s"
-            self.cursor.execute(query, (supplier_id,))
-            self.connection.commit()
+            self.db.execute(query, (supplier_id,))
             
             messagebox.showinfo("成功", "供应商删除成功")
-            self.load_suppliers()
+            self.supplier_grid.remove_rows([supplier_id])
         except Error as e:
             messagebox.showerror("错误", f"删除供应商失败: {e}")
     
-    def create_triggers(self):
-        """创建触发器"""
-        try:
-            # 检查并创建销售减库存触发器
-            self.cursor.execute("SHOW TRIGGERS LIKE 'sales_reduce_inventory'")
-            if not self.cursor.fetchone():
-                try:
-                    self.cursor.execute("""
-                        CREATE TRIGGER sales_reduce_inventory
-                        AFTER INSERT ON sales_order_items
-                        FOR EACH ROW
-                        BEGIN
-                            UPDATE inventory SET quantity = quantity - NEW.quantity
-                            WHERE product_id = NEW.product_id;
-                        END
-                    """)
-                except Error:
-                    pass
-            
-            self.connection.commit()
-        except Error:
-            # 触发器创建失败不影响系统运行
-            pass
-    
     def debug_database(self):
         """调试数据库问题"""
         debug_window = tk.Toplevel(self.root)
@@ -2875,46 +2844,38 @@ class RetailManagementSystem:
         try:
             # 检查数据库连接
             append_text("检查数据库连接...")
-            if not self.connection.is_connected():
-                append_text("数据库连接已断开，尝试重新连接...")
-                try:
-                    self.connection = mysql.connector.connect(**self.db_config)
-                    self.cursor = self.connection.cursor(dictionary=True)
-                    append_text("重新连接成功")
-                except Error as e:
-                    append_text(f"数据库重新连接失败: {e}")
-                    return
-            else:
+            try:
+                # 连接池借出连接前会检查健康状态，失效的连接会自动重建
+                self.db.check()
                 append_text("数据库连接正常")
+            except Error as e:
+                append_text(f"数据库重新连接失败: {e}")
+                return
             
             # 检查表是否存在
             tables = ["inventory", "inventory_logs"]
             append_text("\n检查表是否存在...")
             
             for table in tables:
-                self.cursor.execute(f"SHOW TABLES LIKE '{table}'")
-                if self.cursor.fetchone():
+                if self.db.query_one(f"SHOW TABLES LIKE '{table}'"):
                     append_text(f"表 {table} 存在")
                     
                     # 检查表结构
                     append_text(f"检查 {table} 表结构...")
-                    self.cursor.execute(f"DESCRIBE {table}")
-                    columns = self.cursor.fetchall()
+                    columns = self.db.query(f"DESCRIBE {table}")
                     for col in columns:
                         append_text(f"  {col['Field']} - {col['Type']} - {col['Key']}")
                     
                     # 检查表中的数据
                     append_text(f"检查 {table} 数据量...")
-                    self.cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
-                    count = self.cursor.fetchone()['count']
+                    count = self.db.query_one(f"SELECT COUNT(*) as count FROM {table}")['count']
                     append_text(f"  {table} 表中有 {count} 条记录")
                 else:
-                    append_text(f"表 {table} 不存在")
+                    append_text(f"表 {table} 不存在，请执行数据库迁移（系统 → 数据库迁移，或 python migrations.py migrate）")
             
             # 检查触发器
             append_text("\n检查触发器...")
-            self.cursor.execute("SHOW TRIGGERS")
-            triggers = self.cursor.fetchall()
+            triggers = self.db.query("SHOW TRIGGERS")
             if triggers:
                 for trigger in triggers:
                     append_text(f"触发器: {trigger['Trigger']} - {trigger['Event']} - {trigger['Table']}")
@@ -2924,63 +2885,10 @@ class RetailManagementSystem:
         except Error as e:
             append_text(f"调试过程中出错: {e}")
         
-        # 添加创建表按钮
-        def create_missing_tables():
-            try:
-                # 创建inventory表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS inventory (
-                        product_id INT NOT NULL PRIMARY KEY,
-                        quantity INT NOT NULL DEFAULT 0,
-                        min_stock_level INT DEFAULT 10,
-                        max_stock_level INT DEFAULT 100,
-                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-                    )
-                """)
-                
-                # 初始化库存数据
-                self.cursor.execute("""
-                    INSERT INTO inventory (product_id, quantity, min_stock_level, max_stock_level)
-                    SELECT id, stock, 10, 100 FROM products
-                    ON DUPLICATE KEY UPDATE 
-                        quantity = products.stock,
-                        min_stock_level = 10,
-                        max_stock_level = 100
-                """)
-                
-                # 创建inventory_logs表
-                self.cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS inventory_logs (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        product_id INT NOT NULL,
-                        change_type ENUM('in', 'out', 'adjustment', 'sale') NOT NULL,
-                        quantity INT NOT NULL,
-                        quantity_change INT NOT NULL,
-                        reference_id INT,
-                        reference_type ENUM('stock_in', 'stock_out', 'adjustment', 'sales_order') NOT NULL,
-                        before_quantity INT NOT NULL,
-                        after_quantity INT NOT NULL,
-                        notes TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES products(id)
-                    )
-                """)
-                
-                self.connection.commit()
-                append_text("\n所有缺失的表已创建")
-                
-                # 刷新调试信息
-                text_area.delete(1.0, tk.END)
-                self.debug_database()
-                
-            except Error as e:
-                append_text(f"\n创建表失败: {e}")
-        
         button_frame = ttk.Frame(debug_window)
         button_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        ttk.Button(button_frame, text="创建缺失的表", command=create_missing_tables).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="执行数据库迁移", command=self.run_migrations).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="修复触发器", command=self.fix_triggers).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="刷新", command=lambda: [text_area.delete(1.0, tk.END), self.debug_database()]).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="关闭", command=debug_window.destroy).pack(side=tk.RIGHT, padx=5)
@@ -2988,78 +2896,12 @@ class RetailManagementSystem:
     def fix_triggers(self):
         """检查和修复触发器问题"""
         try:
-            # 检查数据库连接
-            if not self.connection.is_connected():
-                try:
-                    self.connection = mysql.connector.connect(**self.db_config)
-                    self.cursor = self.connection.cursor(dictionary=True)
-                except Error as e:
-                    messagebox.showerror("错误", f"数据库连接失败: {e}")
-                    return
-            
-            # 删除可能存在问题的触发器
-            triggers_to_drop = [
-                "sales_reduce_inventory", 
-                "sales_reduce_inventory_step",
-                "after_sales_order_item_insert",
-                "after_sales_order_item_insert_log"
-            ]
-            
-            for trigger in triggers_to_drop:
-                try:
-                    self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
-                except:
-                    pass
-            
-            # 创建销售订单触发器
-            self.cursor.execute("""
-                CREATE TRIGGER sales_reduce_inventory
-                AFTER INSERT ON sales_order_items
-                FOR EACH ROW
-                BEGIN
-                    UPDATE inventory 
-                    SET quantity = quantity - NEW.quantity
-                    WHERE product_id = NEW.product_id;
-                END
-            """)
-            
-            # 创建库存日志触发器
-            self.cursor.execute("""
-                CREATE TRIGGER after_sales_order_item_insert_log
-                AFTER INSERT ON sales_order_items
-                FOR EACH ROW
-                BEGIN
-                    INSERT INTO inventory_logs (
-                        product_id, 
-                        change_type, 
-                        quantity, 
-                        quantity_change,
-                        reference_id, 
-                        reference_type,
-                        before_quantity,
-                        after_quantity,
-                        notes
-                    )
-                    SELECT 
-                        NEW.product_id,
-                        'sale',
-                        NEW.quantity,
-                        -NEW.quantity,
-                        NEW.order_id,
-                        'sales_order',
-                        quantity + NEW.quantity,
-                        quantity,
-                        CONCAT('销售订单 #', NEW.order_id)
-                    FROM inventory
-                    WHERE product_id = NEW.product_id;
-                END
-            """)
-            
-            self.connection.commit()
+            # 删除迁移中已经删除的触发器（下单时由 checkout 批量扣减库存并写日志，旧的逐行触发器会重复扣减），
+            # 其余的触发器（如维护库存状态汇总表的触发器）按迁移中的定义重新安装
+            created, dropped = migrations.reinstall_triggers(self.db)
             # 更新状态栏而不是显示弹窗
-            self.status_var.set("触发器已修复")
-            
-        except Error as e:
+            self.status_var.set(f"触发器已修复，重新安装 {len(created)} 个，删除 {len(dropped)} 个")
+        except (Error, RuntimeError) as e:
             messagebox.showerror("错误", f"修复触发器失败: {e}")
 
 if __name__ == "__main__":
@@ -0,0 +1,235 @@
+"""库存盘点
+
+盘点数量从 CSV 或扫码枪导出的文件中读取，写入暂存表 stocktake_counts（迁移 0014），
+差异用一条关联查询计算，应用时在一个事务中用几条批量语句更新 inventory、products.stock
+并写入库存日志，语句条数与盘点的商品数无关。
+
+支持的文件格式：
+- 带表头的 CSV：条码列（条码/barcode）或商品ID列（商品ID/product_id/id），数量列（数量/盘点数量/quantity/counted）
+- 没有表头：每行一个条码，每行计1件（扫码枪逐件扫描）；或者每行 "条码,数量"
+"""
+import csv
+import io
+
+BARCODE_HEADERS = {"条码", "barcode"}
+ID_HEADERS = {"商品id", "product_id", "id"}
+QUANTITY_HEADERS = {"数量", "盘点数量", "quantity", "counted", "count"}
+# 每条 INSERT / IN 查询包含的行数
+BATCH_SIZE = 1000
+
+
+def _read_text(path):
+    """读取文本文件，先按 UTF-8（可带BOM）解码，失败时按 Excel 常用的 GBK 解码"""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("gbk")
+
+
+def read_counts(path):
+    """读取盘点文件，返回 ({(代码类型, 代码): 数量}, [无法识别的行号])
+
+    代码类型为 'barcode' 或 'id'，同一商品出现多次时数量相加
+    """
+    rows = [row for row in csv.reader(io.StringIO(_read_text(path))) if any(cell.strip() for cell in row)]
+    if not rows:
+        return {}, []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    kind = code_col = qty_col = None
+    for index, name in enumerate(header):
+        if name in BARCODE_HEADERS:
+            kind, code_col = "barcode", index
+        elif name in ID_HEADERS and kind != "barcode":
+            kind, code_col = "id", index
+        elif name in QUANTITY_HEADERS:
+            qty_col = index
+    if kind is None:
+        # 没有表头：扫码枪导出的条码，第二列（如果有）为数量
+        kind, code_col, qty_col, first_line = "barcode", 0, 1, 1
+    else:
+        rows = rows[1:]
+        first_line = 2
+
+    counts = {}
+    bad_lines = []
+    for line_no, row in enumerate(rows, first_line):
+        code = row[code_col].strip() if code_col < len(row) else ""
+        qty_text = row[qty_col].strip() if qty_col is not None and qty_col < len(row) else ""
+        try:
+            quantity = int(qty_text) if qty_text else 1
+        except ValueError:
+            quantity = -1
+        if not code or quantity < 0 or (kind == "id" and not code.isdigit()):
+            bad_lines.append(line_no)
+            continue
+        key = (kind, str(int(code)) if kind == "id" else code)
+        counts[key] = counts.get(key, 0) + quantity
+    return counts, bad_lines
+
+
+def resolve_counts(db, counts):
+    """把条码和商品ID解析为商品，返回 ({商品ID: 数量}, [找不到的代码])
+
+    每 BATCH_SIZE 个代码一条 IN 查询，条码使用 products.barcode 的唯一索引
+    """
+    found = {}
+    for kind, column in (("barcode", "barcode"), ("id", "id")):
+        codes = [code for code_kind, code in counts if code_kind == kind]
+        for start in range(0, len(codes), BATCH_SIZE):
+            chunk = codes[start:start + BATCH_SIZE]
+            rows = db.query(
+                f"SELECT id, {column} AS code FROM products WHERE {column} IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            for row in rows:
+                found[(kind, str(row['code']))] = row['id']
+
+    quantities = {}
+    unknown = []
+    for key, quantity in counts.items():
+        product_id = found.get(key)
+        if product_id is None:
+            unknown.append(key[1])
+        else:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities, unknown
+
+
+def create_stocktake(db, quantities, notes=""):
+    """新建盘点单并把盘点数量写入暂存表，返回盘点单号"""
+    items = sorted(quantities.items())
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO stocktakes (notes) VALUES (%s)", (notes,))
+        stocktake_id = cursor.lastrowid
+        for start in range(0, len(items), BATCH_SIZE):
+            chunk = items[start:start + BATCH_SIZE]
+            params = []
+            for product_id, counted in chunk:
+                params.extend((stocktake_id, product_id, counted))
+            cursor.execute(
+                "INSERT INTO stocktake_counts (stocktake_id, product_id, counted) VALUES "
+                + ", ".join(["(%s, %s, %s)"] * len(chunk)),
+                params
+            )
+    return stocktake_id
+
+
+def differences(db, stocktake_id, zero_missing=False):
+    """盘点数量与账面库存不同的商品 [{product_id, product_name, book_quantity, counted}]
+
+    zero_missing 为 True 时，有库存但没有盘到的商品按盘点数量0计算
+    """
+    sql = """
+        SELECT c.product_id, p.name AS product_name, IFNULL(i.quantity, 0) AS book_quantity, c.counted
+        FROM stocktake_counts c
+        JOIN products p ON p.id = c.product_id
+        LEFT JOIN inventory i ON i.product_id = c.product_id
+        WHERE c.stocktake_id = %s AND c.counted <> IFNULL(i.quantity, 0)
+    """
+    params = [stocktake_id]
+    if zero_missing:
+        sql += """
+            UNION ALL
+            SELECT i.product_id, p.name, i.quantity, 0
+            FROM inventory i
+            JOIN products p ON p.id = i.product_id
+            LEFT JOIN stocktake_counts c ON c.stocktake_id = %s AND c.product_id = i.product_id
+            WHERE c.product_id IS NULL AND i.quantity <> 0
+        """
+        params.append(stocktake_id)
+    return db.query(sql + " ORDER BY product_id", params)
+
+
+def apply_stocktake(db, stocktake_id, zero_missing=False):
+    """在一个事务中按盘点数量更新库存，返回库存有变化的商品ID
+
+    按商品ID顺序锁定库存行（与下单的加锁顺序一致），在锁内记下账面数量，
+    然后各用一条语句写库存日志、更新 inventory 和 products.stock。盘点单只能应用一次。
+    """
+    def work(cursor):
+        cursor.execute("SELECT status FROM stocktakes WHERE id = %s FOR UPDATE", (stocktake_id,))
+        row = cursor.fetchone()
+        if row is None or row['status'] != 'draft':
+            raise ValueError(f"盘点单 #{stocktake_id} 不存在或已经应用")
+
+        if zero_missing:
+            cursor.execute("""
+                INSERT INTO stocktake_counts (stocktake_id, product_id, counted)
+                SELECT %s, i.product_id, 0
+                FROM inventory i
+                LEFT JOIN stocktake_counts c ON c.stocktake_id = %s AND c.product_id = i.product_id
+                WHERE c.product_id IS NULL AND i.quantity <> 0
+            """, (stocktake_id, stocktake_id))
+        # 盘点到但还没有库存行的商品
+        cursor.execute("""
+            INSERT IGNORE INTO inventory (product_id, quantity)
+            SELECT c.product_id, 0
+            FROM stocktake_counts c
+            LEFT JOIN inventory i ON i.product_id = c.product_id
+            WHERE c.stocktake_id = %s AND i.product_id IS NULL
+        """, (stocktake_id,))
+        cursor.execute("""
+            SELECT i.product_id FROM inventory i
+            JOIN stocktake_counts c ON c.product_id = i.product_id
+            WHERE c.stocktake_id = %s
+            ORDER BY i.product_id
+            FOR UPDATE
+        """, (stocktake_id,))
+        cursor.fetchall()
+
+        # 一条语句算出所有差异：在锁内记下账面数量
+        cursor.execute("""
+            UPDATE stocktake_counts c
+            JOIN inventory i ON i.product_id = c.product_id
+            SET c.book_quantity = i.quantity
+            WHERE c.stocktake_id = %s
+        """, (stocktake_id,))
+        cursor.execute("""
+            SELECT product_id FROM stocktake_counts
+            WHERE stocktake_id = %s AND counted <> book_quantity
+        """, (stocktake_id,))
+        changed = [row['product_id'] for row in cursor.fetchall()]
+
+        cursor.execute("""
+            INSERT INTO inventory_logs (
+                product_id, change_type, quantity, quantity_change, reference_id,
+                reference_type, before_quantity, after_quantity, notes
+            )
+            SELECT product_id, 'adjustment', counted, counted - book_quantity, stocktake_id,
+                   'stocktake', book_quantity, counted, CONCAT('盘点单 #', stocktake_id)
+            FROM stocktake_counts
+            WHERE stocktake_id = %s AND counted <> book_quantity
+        """, (stocktake_id,))
+        cursor.execute("""
+            UPDATE inventory i
+            JOIN stocktake_counts c ON c.product_id = i.product_id
+            SET i.quantity = c.counted
+            WHERE c.stocktake_id = %s AND c.counted <> c.book_quantity
+        """, (stocktake_id,))
+        cursor.execute("""
+            UPDATE products p
+            JOIN stocktake_counts c ON c.product_id = p.id
+            SET p.stock = c.counted
+            WHERE c.stocktake_id = %s AND NOT (p.stock <=> c.counted)
+        """, (stocktake_id,))
+        cursor.execute(
+            "UPDATE stocktakes SET status = 'applied', applied_at = CURRENT_TIMESTAMP WHERE id = %s",
+            (stocktake_id,)
+        )
+        return changed
+
+    return db.run_transaction(work)
+
+
+def discard_stocktake(db, stocktake_id):
+    """放弃未应用的盘点单，删除暂存的盘点数量；已经应用的盘点单不受影响"""
+    with db.transaction() as cursor:
+        cursor.execute("SELECT status FROM stocktakes WHERE id = %s FOR UPDATE", (stocktake_id,))
+        row = cursor.fetchone()
+        if row is None or row['status'] != 'draft':
+            return
+        cursor.execute("DELETE FROM stocktake_counts WHERE stocktake_id = %s", (stocktake_id,))
+        cursor.execute("UPDATE stocktakes SET status = 'cancelled' WHERE id = %s", (stocktake_id,))
@@ -0,0 +1,576 @@
+import threading
+
+from tkinter import messagebox
+
+# 每张表的索引列缓存 {表名: [[列名, ...], ...]}，表结构在运行期间不变，只查询一次
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def table_indexes(db, table):
+    """返回表上各索引的列（按索引中的顺序），二级索引末尾隐含主键列"""
+    with _index_lock:
+        if table in _index_cache:
+            return _index_cache[table]
+
+    indexes = {}
+    for row in db.query(f"SHOW INDEX FROM `{table}`"):
+        indexes.setdefault(row['Key_name'], []).append((row['Seq_in_index'], row['Column_name']))
+    for name in indexes:
+        indexes[name] = [column for _, column in sorted(indexes[name])]
+    primary = indexes.get('PRIMARY', [])
+    # InnoDB 的二级索引按 (索引列, 主键) 排序
+    result = [columns + [c for c in primary if c not in columns] for columns in indexes.values()]
+
+    with _index_lock:
+        _index_cache[table] = result
+    return result
+
+
+def sort_index_warning(db, table, columns):
+    """检查排序列是否有索引支持，没有时返回提示文字
+
+    columns: 排序列在 table 上的列名，None 表示该列不是 table 的列（计算列或关联表的列）
+    """
+    if not columns:
+        return None
+    if None in columns:
+        return "当前排序包含计算列或关联表的列，无法使用索引，数据量大时可能较慢"
+    for index_columns in table_indexes(db, table):
+        if index_columns[:len(columns)] == list(columns):
+            return None
+    return f"没有 ({', '.join(columns)}) 上的索引，按此排序在数据量大时可能较慢"
+
+
+class SortHeadings:
+    """可点击排序的表头
+
+    单击表头按该列排序，再次单击切换升序/降序；Shift+单击把该列追加为次要排序列。
+    排序变化后调用 on_change(order)，order 为 [(列名, 是否降序), ...]，为空时使用默认排序。
+    """
+
+    def __init__(self, tree, columns, on_change):
+        self.tree = tree
+        # 可以排序的列名
+        self.columns = list(columns)
+        self.on_change = on_change
+        self.order = []
+        self.titles = {col: tree.heading(col, "text") for col in self.columns}
+        for col in self.columns:
+            tree.heading(col, command=lambda c=col: self.toggle(c))
+        tree.bind("<Shift-Button-1>", self._on_shift_click, add="+")
+
+    def _on_shift_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "heading":
+            return None
+        col = self.tree.column(self.tree.identify_column(event.x), "id")
+        if col not in self.columns:
+            return None
+        self.toggle(col, add=True)
+        # 阻止表头默认的单击排序
+        return "break"
+
+    def clear(self):
+        """清除排序标记，不触发重新加载"""
+        self.order = []
+        self._update_titles()
+
+    def toggle(self, col, add=False):
+        current = dict(self.order)
+        if add:
+            if col in current:
+                self.order = [(c, not d if c == col else d) for c, d in self.order]
+            else:
+                self.order.append((col, False))
+        elif len(self.order) == 1 and col in current:
+            self.order = [(col, not current[col])]
+        else:
+            self.order = [(col, False)]
+        self._update_titles()
+        self.on_change(self.order)
+
+    def _update_titles(self):
+        positions = {col: (i, desc) for i, (col, desc) in enumerate(self.order, 1)}
+        for col, title in self.titles.items():
+            if col in positions:
+                i, desc = positions[col]
+                arrow = "▼" if desc else "▲"
+                title = f"{title} {arrow}{i if len(self.order) > 1 else ''}"
+            self.tree.heading(col, text=title)
+
+
+class VirtualGrid:
+    """基于键集分页的虚拟化表格
+
+    不再一次性查询整张表，而是按排序键分页（WHERE 排序键在上一页最后一行之后 LIMIT n），
+    滚动到底部附近时加载下一页，滚动到顶部附近时加载上一页。表格中最多保留
+    max_rows 行，超出的部分从另一端移除，所以加载时间和内存不随表大小增长。
+    总数来自 information_schema 的估算值，不执行 COUNT(*)。
+
+    默认按 default_sort（未指定时按主键倒序），sort_columns 中的列可以点击表头排序
+    （支持多列），主键始终作为最后一个排序键保证顺序唯一。
+
+    表格行的 iid 为主键值，主键必须是整数。刷新时不再清空表格重新插入，
+    而是按 updated_column 水位线只查询上次刷新后修改过的行，逐行更新或插入；
+    程序内的增删改则通过 refresh_rows / remove_rows 只刷新受影响的行。
+    """
+
+    def __init__(self, tree, runner, db, key, select_sql, make_values, status_var,
+                 table=None, pk_column="id", pk_field="id", page_size=100, max_rows=500,
+                 scrollbar=None, done_text="共约 {} 条数据", error_text="加载数据失败",
+                 on_loaded=None, updated_column=None, sort_columns=None, default_sort=None, make_tags=None):
+        self.tree = tree
+        self.runner = runner
+        self.db = db
+        self.key = key
+        # 不含 WHERE / ORDER BY / LIMIT 的查询语句
+        self.select_sql = select_sql
+        self.make_values = make_values
+        # 行的标签（用于设置行颜色），make_tags(行) 返回标签元组
+        self.make_tags = make_tags
+        self.status_var = status_var
+        # 查询的主表，用于估算总数和检查排序索引
+        self.table = table
+        self.pk_column = pk_column
+        self.pk_field = pk_field
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.scrollbar = scrollbar
+        self.default_done_text = done_text
+        self.default_error_text = error_text
+        self.on_loaded = on_loaded
+        # 修改时间列，用于增量刷新
+        self.updated_column = updated_column
+        # 可排序的列 {表格列名: (SQL表达式, 结果字段, 主表列名或None)}
+        self.sort_columns = sort_columns or {}
+        # 没有选择排序列时的排序键 [(SQL表达式, 结果字段, 是否降序)]
+        self.default_sort = list(default_sort or [])
+
+        self.where = None
+        self.params = ()
+        # 替换 select_sql 的查询 (SQL, 参数)，例如带相关度的全文检索，为None时使用 select_sql
+        self.select = None
+        self.done_text = done_text
+        self.error_text = error_text
+        self.estimate = None
+        self.sort_warning = None
+        # 当前排序键 [(SQL表达式, 结果字段, 是否降序)]，不含主键
+        self.sort = list(self.default_sort)
+        # 上次加载时数据库的时间，None 表示尚未加载
+        self.watermark = None
+        # 已显示行的排序键 {iid: (排序值..., 主键)} 和原始数据 {iid: 行}
+        self._keys = {}
+        self._rows = {}
+        self._has_before = False
+        self._has_after = False
+        self._loading = False
+        # 等待按主键刷新的行，连续的 refresh_rows 合并为一次查询
+        self._refresh_ids = set()
+
+        self.tree.configure(yscrollcommand=self._on_yscroll)
+        if self.sort_columns:
+            self.headings = SortHeadings(tree, self.sort_columns, self.sort_by)
+
+    def load(self, where=None, params=(), done_text=None, error_text=None, select=None, sort=None):
+        """加载数据，where 为附加的筛选条件
+
+        select 为替换 select_sql 的 (SQL, 参数)，sort 为切换查询时使用的默认排序键。
+        查询和筛选条件不变且已经加载过时只做增量刷新，否则从第一页重新加载
+        """
+        if self.watermark is not None and self.updated_column and select == self.select \
+                and where == self.where and tuple(params) == self.params:
+            self.refresh_changed()
+            return
+        if select != self.select:
+            # 切换查询时恢复默认排序
+            self.select = select
+            self.sort = list(sort or self.default_sort)
+            if self.sort_columns:
+                self.headings.clear()
+        self.where = where
+        self.params = tuple(params)
+        self.done_text = done_text or self.default_done_text
+        self.error_text = error_text or self.default_error_text
+        self._reset()
+
+    def narrow(self, predicate, where=None, params=(), done_text=None, error_text=None, select=None, sort=None):
+        """新的筛选条件只会缩小结果时，先在内存中移除不符合 predicate(行) 的行
+
+        已加载的结果是完整的（没有更多分页）时不再查询数据库，否则立即显示缩小后的结果，
+        再按新条件从数据库重新加载。
+        """
+        stale = [iid for iid, row in self._rows.items() if not predicate(row)]
+        self._delete(stale)
+        if self._loading or self._has_before or self._has_after:
+            self.load(where, params, done_text, error_text, select, sort)
+            return
+        self.select = select
+        self.where = where
+        self.params = tuple(params)
+        self.done_text = done_text or self.default_done_text
+        self.error_text = error_text or self.default_error_text
+        self.estimate = None
+        self._update_status()
+
+    def _reset(self):
+        self._has_before = False
+        self._has_after = False
+        self.status_var.set("加载中...")
+        self.tree.configure(cursor="watch")
+        self._fetch("reset", None)
+
+    def refresh(self):
+        """按当前筛选条件刷新"""
+        self.load(self.where, self.params, self.done_text, self.error_text, self.select, self.sort)
+
+    def load_more(self):
+        """加载表格末尾之后的一页，没有更多数据或正在加载时返回False"""
+        children = self.tree.get_children()
+        if self._loading or not self._has_after or not children:
+            return False
+        self._fetch("after", self._keys[children[-1]])
+        return True
+
+    def sort_by(self, order):
+        """按表头选择的列排序，order 为 [(列名, 是否降序)]，从第一页重新加载"""
+        self.sort = [(self.sort_columns[col][0], self.sort_columns[col][1], desc) for col, desc in order] \
+            or list(self.default_sort)
+        self._reset()
+
+    def refresh_changed(self):
+        """只查询水位线之后修改过的行并更新到表格中，还没有加载过第一页时从第一页加载"""
+        watermark = self.watermark
+        if watermark is None or not self.updated_column:
+            self._reset()
+            return
+        sql, params = self._build_query("changed", watermark)
+
+        def task():
+            now = self._server_time()
+            return self.db.query(sql, params), now
+
+        self.runner.submit(
+            self.key + ".changes", task,
+            on_error=self._on_error,
+            on_result=lambda result: self._on_changes(*result)
+        )
+
+    def refresh_rows(self, ids):
+        """重新查询指定主键的行：存在的更新或插入，不存在（已删除或不再符合筛选条件）的移除
+
+        上一次刷新还没有完成时，新的查询包含上一次的主键，取消上一次查询不会漏掉它的行
+        """
+        self._refresh_ids.update(int(i) for i in ids)
+        if not self._refresh_ids:
+            return
+        ids = sorted(self._refresh_ids)
+        sql, params = self._build_query("ids", ids)
+
+        def task():
+            return self.db.query(sql, params)
+
+        def on_result(rows):
+            self._refresh_ids.difference_update(ids)
+            self._apply_rows(rows)
+            found = {row[self.pk_field] for row in rows}
+            self.remove_rows([i for i in ids if i not in found])
+
+        def on_error(e):
+            self._refresh_ids.difference_update(ids)
+            self._on_error(e)
+
+        self.runner.submit(self.key + ".rows", task, on_error=on_error, on_result=on_result)
+
+    def remove_rows(self, ids):
+        """从表格中移除指定主键的行"""
+        existing = [str(i) for i in ids if self.tree.exists(str(i))]
+        if existing:
+            self._delete(existing)
+
+    def _sort_keys(self):
+        """完整的排序键，主键作为最后一个排序键，方向跟随最后一个排序列"""
+        last_desc = self.sort[-1][2] if self.sort else True
+        return self.sort + [(self.pk_column, self.pk_field, last_desc)]
+
+    def _row_key(self, row):
+        return tuple(row[field] for _, field, _ in self._sort_keys())
+
+    def _keyset_condition(self, boundary, forward):
+        """排在 boundary 之后（forward=False 时为之前）的行的条件
+
+        展开为 (a > ?) OR (a = ? AND b > ?) OR ...，按 MySQL 的规则处理 NULL：
+        升序时 NULL 排在最前，降序时排在最后
+        """
+        terms = []
+        params = []
+        equal_parts = []
+        equal_params = []
+        for (expr, _, desc), value in zip(self._sort_keys(), boundary):
+            if not forward:
+                desc = not desc
+            if value is None:
+                after, after_params = (None, []) if desc else (f"{expr} IS NOT NULL", [])
+            elif desc and expr == self.pk_column:
+                # 主键不会为NULL
+                after, after_params = f"{expr} < %s", [value]
+            elif desc:
+                after, after_params = f"({expr} < %s OR {expr} IS NULL)", [value]
+            else:
+                after, after_params = f"{expr} > %s", [value]
+            if after:
+                terms.append("(" + " AND ".join(equal_parts + [after]) + ")")
+                params.extend(equal_params + after_params)
+            if value is None:
+                equal_parts.append(f"{expr} IS NULL")
+            else:
+                equal_parts.append(f"{expr} = %s")
+                equal_params.append(value)
+        if not terms:
+            return "1 = 0", []
+        return "(" + " OR ".join(terms) + ")", params
+
+    def _build_query(self, direction, boundary):
+        select_sql, params = self.select or (self.select_sql, ())
+        params = list(params) + list(self.params)
+        conditions = [f"({self.where})"] if self.where else []
+        if direction in ("after", "before"):
+            condition, condition_params = self._keyset_condition(boundary, direction == "after")
+            conditions.append(condition)
+            params.extend(condition_params)
+        elif direction == "changed":
+            # 水位线取自上次查询之前的数据库时间，用 >= 避免漏掉同一秒内的修改
+            conditions.append(f"{self.updated_column} >= %s")
+            params.append(boundary)
+        elif direction == "ids":
+            conditions.append(f"{self.pk_column} IN ({', '.join(['%s'] * len(boundary))})")
+            params.extend(boundary)
+
+        sql = select_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # 向上翻页时按相反顺序取紧挨着的一页，交付前再反转
+        reverse = direction == "before"
+        order = ", ".join(
+            f"{expr} {'ASC' if desc == reverse else 'DESC'}" for expr, _, desc in self._sort_keys()
+        )
+        sql += f" ORDER BY {order}"
+        if direction in ("reset", "after", "before"):
+            # 多取一行用来判断是否还有下一页
+            sql += " LIMIT %s"
+            params.append(self.page_size + 1)
+        return sql, params
+
+    def _server_time(self):
+        return self.db.query_one("SELECT NOW() AS now")['now']
+
+    def _estimate_total(self):
+        row = self.db.query_one(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (self.table,)
+        )
+        return row['TABLE_ROWS'] if row else None
+
+    def _sort_index_warning(self):
+        # 替换的查询（如全文检索）已经由自己的索引限定了范围
+        if not self.sort or not self.table or self.select:
+            return None
+        index_columns = []
+        for expr, field, _ in self.sort:
+            index_columns.append(next(
+                (column for e, f, column in self.sort_columns.values() if e == expr and f == field), None
+            ))
+        return sort_index_warning(self.db, self.table, index_columns)
+
+    def _fetch(self, direction, boundary):
+        self._loading = True
+        sql, params = self._build_query(direction, boundary)
+        # 估算的是整个表的行数，只在没有筛选条件、也没有替换查询（如全文检索）时显示
+        with_estimate = direction == "reset" and self.table and not self.where and self.select is None
+
+        def task():
+            watermark = self._server_time() if direction == "reset" and self.updated_column else None
+            rows = self.db.query(sql, params)
+            estimate = self._estimate_total() if with_estimate else None
+            warning = self._sort_index_warning() if direction == "reset" else None
+            return rows, estimate, watermark, warning
+
+        self.runner.submit(
+            self.key, task,
+            on_error=self._on_error,
+            on_result=lambda result: self._on_page(direction, *result)
+        )
+
+    def _on_page(self, direction, rows, estimate, watermark, warning):
+        self._loading = False
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if direction == "reset":
+            self._delete(self.tree.get_children())
+            self._append(rows)
+            self._has_after = has_more
+            self.estimate = estimate
+            self.watermark = watermark
+            self.sort_warning = warning
+            self.tree.configure(cursor="")
+            self._update_status()
+            if self.on_loaded:
+                self.on_loaded(self.key)
+        elif direction == "after":
+            self._append(rows)
+            self._has_after = has_more
+            self._trim_top()
+        else:
+            rows.reverse()
+            self._prepend(rows)
+            self._has_before = has_more
+            self._trim_bottom()
+
+    def _on_error(self, e):
+        self._loading = False
+        self.tree.configure(cursor="")
+        self.status_var.set(self.error_text)
+        if self.on_loaded:
+            self.on_loaded(self.key)
+        messagebox.showerror("错误", f"{self.error_text}: {e}")
+
+    def _on_changes(self, rows, now):
+        self._apply_rows(rows)
+        self.watermark = now
+        self._update_status()
+
+    def _compare(self, a, b):
+        """按表格的显示顺序比较两个排序键，返回 -1 / 0 / 1"""
+        for (_, _, desc), x, y in zip(self._sort_keys(), a, b):
+            if x == y:
+                continue
+            if x is None:
+                result = -1
+            elif y is None:
+                result = 1
+            else:
+                result = -1 if x < y else 1
+            return -result if desc else result
+        return 0
+
+    def _apply_rows(self, rows):
+        """逐行更新表格：已显示的行只在值变化时更新，新行插入到排序中的对应位置"""
+        children = list(self.tree.get_children())
+        for row in rows:
+            iid = str(row[self.pk_field])
+            key = self._row_key(row)
+            values = self.make_values(row)
+            if self.tree.exists(iid):
+                if self._keys.get(iid) != key:
+                    # 排序键变了，移到新的位置
+                    self._delete([iid])
+                    children.remove(iid)
+                elif tuple(str(v) for v in self.tree.item(iid, "values")) != tuple(str(v) for v in values):
+                    self.tree.item(iid, values=values, tags=self._tags(row))
+                    self._rows[iid] = row
+                    continue
+                else:
+                    self._rows[iid] = row
+                    continue
+            # 只插入落在当前窗口范围内的行，窗口外的行滚动到时自然会被加载
+            if children and ((self._has_before and self._compare(key, self._keys[children[0]]) < 0)
+                             or (self._has_after and self._compare(key, self._keys[children[-1]]) > 0)):
+                continue
+            index = self._position_of(children, key)
+            self._insert(index, iid, values, key, row)
+            children.insert(index, iid)
+
+    def _position_of(self, children, key):
+        """排序后 key 应插入的位置"""
+        low, high = 0, len(children)
+        while low < high:
+            middle = (low + high) // 2
+            if self._compare(self._keys[children[middle]], key) < 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _tags(self, row):
+        return self.make_tags(row) if self.make_tags else ()
+
+    def _insert(self, index, iid, values, key, row):
+        self.tree.insert("", index, iid=iid, values=values, tags=self._tags(row))
+        self._keys[iid] = key
+        self._rows[iid] = row
+
+    def _delete(self, iids):
+        if iids:
+            self.tree.delete(*iids)
+        for iid in iids:
+            self._keys.pop(iid, None)
+            self._rows.pop(iid, None)
+
+    def _append(self, rows):
+        for row in rows:
+            iid = str(row[self.pk_field])
+            if not self.tree.exists(iid):
+                self._insert("end", iid, self.make_values(row), self._row_key(row), row)
+
+    def _prepend(self, rows):
+        top_index = self._top_index()
+        added = 0
+        for row in rows:
+            iid = str(row[self.pk_field])
+            if not self.tree.exists(iid):
+                self._insert(added, iid, self.make_values(row), self._row_key(row), row)
+                added += 1
+        # 保持当前看到的行不动
+        self._move_to(top_index + added)
+
+    def _trim_top(self):
+        children = self.tree.get_children()
+        excess = len(children) - self.max_rows
+        if excess <= 0:
+            return
+        top_index = self._top_index()
+        self._delete(children[:excess])
+        self._has_before = True
+        self._move_to(top_index - excess)
+
+    def _trim_bottom(self):
+        children = self.tree.get_children()
+        excess = len(children) - self.max_rows
+        if excess <= 0:
+            return
+        self._delete(children[-excess:])
+        self._has_after = True
+
+    def _top_index(self):
+        count = len(self.tree.get_children())
+        return round(self.tree.yview()[0] * count) if count else 0
+
+    def _move_to(self, index):
+        count = len(self.tree.get_children())
+        if count:
+            self.tree.yview_moveto(max(index, 0) / count)
+
+    def _update_status(self):
+        if self.estimate is not None:
+            text = self.done_text.format(self.estimate)
+        else:
+            count = len(self.tree.get_children())
+            text = self.done_text.format(f"{count}+" if self._has_after else count)
+        if self.sort_warning:
+            text += f"（{self.sort_warning}）"
+        self.status_var.set(text)
+
+    def _on_yscroll(self, first, last):
+        """滚动时按需加载相邻的一页"""
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self._loading:
+            return
+        children = self.tree.get_children()
+        if not children:
+            return
+        if float(last) >= 0.9 and self._has_after:
+            self._fetch("after", self._keys[children[-1]])
+        elif float(first) <= 0.1 and self._has_before:
+            self._fetch("before", self._keys[children[0]])
@@ -1,7 +1,7 @@
 import sys
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QPushButton, QLabel, QLineEdit, 
-                           QTableWidget, QTableWidgetItem, QMessageBox,
+                           QTableView, QMessageBox,
                            QMenu, QInputDialog)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QAction
@@ -9,9 +9,28 @@ import sqlite3
 from datetime import datetime
 from product_dialog import AddProductDialog
 from sale_dialog import AddSaleDialog
+from table_model import Column, SqlTableModel
 from user_management import (LoginDialog, UserManagementDialog, init_user_database,
                            UserRole, Permission, ROLE_PERMISSIONS)
 
+# 商品列表的列：查询表达式、表头、存储类型、排序表达式、显示格式
+PRODUCT_COLUMNS = [
+    Column("id", "ID", 'q', "id"),
+    Column("name", "商品名称", None, "name"),
+    Column("price", "价格", 'd', "price", "¥{:.2f}"),
+    Column("stock", "库存", 'q', "stock"),
+]
+
+# 销售记录的列
+SALES_COLUMNS = [
+    Column("s.id", "ID", 'q', "s.id"),
+    Column("p.name", "商品名称", None, "p.name"),
+    Column("s.quantity", "数量", 'q', "s.quantity"),
+    Column("s.total_price", "总价", 'd', "s.total_price", "¥{:.2f}"),
+    Column("date(s.sale_date)", "日期", None, "s.sale_date"),
+    Column("time(s.sale_date)", "时间", None, "time(s.sale_date)"),
+]
+
 class RetailManagementSystem(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -150,9 +169,21 @@ class RetailManagementSystem(QMainWindow):
         user_info = QLabel(f"当前用户：{self.current_username} ({self.current_role})")
         toolbar_layout.addWidget(user_info)
         
-        # 添加表格
-        self.table = QTableWidget()
-        self.setup_products_table()
+        # 添加表格：数据由模型按需分批加载，排序在数据库中完成
+        self.table = QTableView()
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        
+        self.products_model = SqlTableModel(self.db_path, PRODUCT_COLUMNS, "products", "id", parent=self)
+        self.sales_model = SqlTableModel(
+            self.db_path, SALES_COLUMNS,
+            "sales s JOIN products p ON s.product_id = p.id", "s.id", parent=self
+        )
+        # 销售记录默认按时间倒序
+        self.sales_model.sort_column = 4
+        self.sales_model.sort_order = Qt.SortOrder.DescendingOrder
         
         # 将布局添加到主布局
         main_layout.addLayout(toolbar_layout)
@@ -169,19 +200,21 @@ class RetailManagementSystem(QMainWindow):
         # 显示初始数据
         self.show_products()
         
+    def set_table_model(self, model):
+        """切换表格显示的模型，表头排序标记与模型当前的排序保持一致"""
+        if self.table.model() is not model:
+            self.table.setModel(model)
+        header = self.table.horizontalHeader()
+        # 只同步标记，不触发重新排序
+        header.blockSignals(True)
+        header.setSortIndicator(model.sort_column, model.sort_order)
+        header.blockSignals(False)
+        
     def setup_products_table(self):
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["ID", "商品名称", "价格", "库存"])
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.set_table_model(self.products_model)
         
     def setup_sales_table(self):
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["ID", "商品名称", "数量", "总价", "日期", "时间"])
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
-        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.set_table_model(self.sales_model)
         
     def show_context_menu(self, position):
         if self.current_view != 'products':
@@ -216,40 +249,14 @@ class RetailManagementSystem(QMainWindow):
                 self.adjust_stock(row)
                 
     def edit_product(self, row):
-        item = self.table.item(row, 0)
-        if not item:
-            return
-        product_id = int(item.text())
-        
-        item = self.table.item(row, 1)
-        if not item:
-            return
-        name = item.text()
-        
-        item = self.table.item(row, 2)
-        if not item:
-            return
-        price = float(item.text().replace('¥', '').strip())
-        
-        item = self.table.item(row, 3)
-        if not item:
-            return
-        stock = int(item.text())
+        product_id, name, price, stock = self.products_model.row_values(row)
         
         dialog = AddProductDialog(self.db_path, self, (product_id, name, price, stock))
         if dialog.exec():
             self.show_products()
             
     def delete_product(self, row):
-        item = self.table.item(row, 0)
-        if not item:
-            return
-        product_id = int(item.text())
-        
-        item = self.table.item(row, 1)
-        if not item:
-            return
-        name = item.text()
+        product_id, name, _, _ = self.products_model.row_values(row)
         
         reply = QMessageBox.question(self, '确认删除', 
                                    f'确定要删除商品 "{name}" 吗？\n此操作不可撤销！',
@@ -282,20 +289,7 @@ class RetailManagementSystem(QMainWindow):
                 QMessageBox.critical(self, "错误", f"删除失败：\n{str(e)}")
                 
     def adjust_stock(self, row):
-        item = self.table.item(row, 0)
-        if not item:
-            return
-        product_id = int(item.text())
-        
-        item = self.table.item(row, 1)
-        if not item:
-            return
-        name = item.text()
-        
-        item = self.table.item(row, 3)
-        if not item:
-            return
-        current_stock = int(item.text())
+        product_id, name, _, current_stock = self.products_model.row_values(row)
         
         adjustment, ok = QInputDialog.getInt(
             self, "调整库存",
@@ -333,31 +327,11 @@ class RetailManagementSystem(QMainWindow):
             return
             
         try:
-            conn = self.get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT id, name, price, stock 
-                FROM products 
-                WHERE name LIKE ? 
-                ORDER BY id
-            """, (f'%{search_text}%',))
-            
-            products = cur.fetchall()
-            
-            self.table.setRowCount(len(products))
+            self.current_view = 'products'
+            self.setup_products_table()
+            self.products_model.set_filter("name LIKE ?", (f'%{search_text}%',))
             
-            for row, product in enumerate(products):
-                for col, value in enumerate(product):
-                    if col == 2:  # 价格列
-                        value = f"¥{value:.2f}"
-                    item = QTableWidgetItem(str(value))
-                    self.table.setItem(row, col, item)
-            
-            cur.close()
-            conn.close()
-            
-            if len(products) == 0:
+            if self.products_model.rowCount() == 0:
                 QMessageBox.information(self, "搜索结果", "未找到匹配的商品")
             
         except sqlite3.Error as e:
@@ -415,27 +389,11 @@ class RetailManagementSystem(QMainWindow):
         self.current_view = 'products'
         self.setup_products_table()
         try:
-            conn = self.get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute("SELECT id, name, price, stock FROM products ORDER BY id")
-            products = cur.fetchall()
-            
-            self.table.setRowCount(len(products))
-            
-            for row, product in enumerate(products):
-                for col, value in enumerate(product):
-                    if col == 2:  # 价格列
-                        value = f"¥{value:.2f}"
-                    item = QTableWidgetItem(str(value))
-                    self.table.setItem(row, col, item)
+            self.products_model.set_filter()
             
             # 调整列宽
             self.table.resizeColumnsToContents()
             
-            cur.close()
-            conn.close()
-            
         except sqlite3.Error as e:
             QMessageBox.critical(self, "错误", f"获取商品列表失败：\n{str(e)}")
     
@@ -451,33 +409,11 @@ class RetailManagementSystem(QMainWindow):
         self.current_view = 'sales'
         self.setup_sales_table()
         try:
-            conn = self.get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT s.id, p.name, s.quantity, s.total_price, 
-                       date(s.sale_date), time(s.sale_date)
-                FROM sales s
-                JOIN products p ON s.product_id = p.id
-                ORDER BY s.sale_date DESC
-            """)
-            sales = cur.fetchall()
-            
-            self.table.setRowCount(len(sales))
-            
-            for row, sale in enumerate(sales):
-                for col, value in enumerate(sale):
-                    if col == 3:  # 总价列
-                        value = f"¥{value:.2f}"
-                    item = QTableWidgetItem(str(value))
-                    self.table.setItem(row, col, item)
+            self.sales_model.reload()
             
             # 调整列宽
             self.table.resizeColumnsToContents()
             
-            cur.close()
-            conn.close()
-            
         except sqlite3.Error as e:
             QMessageBox.critical(self, "错误", f"获取销售记录失败：\n{str(e)}")
     
@@ -0,0 +1,179 @@
+from array import array
+import sqlite3
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class Column:
+    """表格列定义
+
+    expr: 查询中的列表达式
+    typecode: 数值列的 array 类型码（'q' 整数，'d' 浮点），None 表示文本列
+    sort_expr: 按此列排序时使用的SQL表达式，None 表示不可排序
+    fmt: 显示格式，例如 "¥{:.2f}"
+    """
+
+    def __init__(self, expr, header, typecode=None, sort_expr=None, fmt="{}"):
+        self.expr = expr
+        self.header = header
+        self.typecode = typecode
+        self.sort_expr = sort_expr
+        self.fmt = fmt
+
+    def new_storage(self):
+        return array(self.typecode) if self.typecode else []
+
+
+class SqlTableModel(QAbstractTableModel):
+    """按需从SQLite分批加载数据的表格模型
+
+    数据按列存储（数值列使用 array，文本列使用字符串列表），不为每个单元格
+    创建 Python 对象。视图滚动到底部时通过 canFetchMore/fetchMore 按键集分页
+    继续加载，排序通过 ORDER BY 交给数据库完成。
+    """
+
+    def __init__(self, db_path, columns, from_sql, pk_expr, batch_size=256, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.columns = columns
+        self.from_sql = from_sql
+        self.pk_expr = pk_expr
+        self.batch_size = batch_size
+
+        self.where = None
+        self.params = ()
+        self.sort_column = 0
+        self.sort_order = Qt.SortOrder.AscendingOrder
+
+        self._data = [column.new_storage() for column in columns]
+        self._row_count = 0
+        # 最后一行的 (排序值, 主键)，用于键集分页
+        self._last_key = None
+        self._has_more = True
+        # 每个模型复用一个连接，滚动加载时不再为每一批重新连接
+        self._conn = None
+
+    def get_db_connection(self):
+        """返回模型的数据库连接，第一次使用时创建"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path)
+        return self._conn
+
+    def close(self):
+        """关闭模型的数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.columns[section].header
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = self._data[index.column()][index.row()]
+        return self.columns[index.column()].fmt.format(value)
+
+    def row_values(self, row):
+        """返回一行的原始值"""
+        return tuple(storage[row] for storage in self._data)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        rows = self._query_batch()
+        if not rows:
+            self._has_more = False
+            return
+        self.beginInsertRows(QModelIndex(), self._row_count, self._row_count + len(rows) - 1)
+        self._append(rows)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """排序交给数据库，重新从第一页加载"""
+        if self.columns[column].sort_expr is None:
+            return
+        self.sort_column = column
+        self.sort_order = order
+        self.reload()
+
+    def set_filter(self, where=None, params=()):
+        """设置筛选条件并重新加载"""
+        self.where = where
+        self.params = tuple(params)
+        self.reload()
+
+    def reload(self):
+        """清空已加载的数据，重新加载第一页"""
+        self.beginResetModel()
+        self._data = [column.new_storage() for column in self.columns]
+        self._row_count = 0
+        self._last_key = None
+        self._has_more = True
+        rows = self._query_batch()
+        if rows:
+            self._append(rows)
+        self.endResetModel()
+
+    def _query_batch(self):
+        sort_expr = self.columns[self.sort_column].sort_expr
+        descending = self.sort_order == Qt.SortOrder.DescendingOrder
+        direction = "DESC" if descending else "ASC"
+
+        conditions = [f"({self.where})"] if self.where else []
+        params = list(self.params)
+        if self._last_key is not None:
+            # 键集分页：从上一批最后一行之后继续，主键作为排序值相同时的次序
+            condition, key_params = self._after_last_key(sort_expr, descending)
+            conditions.append(condition)
+            params.extend(key_params)
+
+        select_list = ", ".join(column.expr for column in self.columns)
+        sql = f"SELECT {select_list}, {sort_expr}, {self.pk_expr} FROM {self.from_sql}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {sort_expr} {direction}, {self.pk_expr} {direction} LIMIT ?"
+        params.append(self.batch_size)
+
+        rows = self.get_db_connection().execute(sql, params).fetchall()
+
+        if len(rows) < self.batch_size:
+            self._has_more = False
+        if rows:
+            self._last_key = rows[-1][-2:]
+        return rows
+
+    def _after_last_key(self, sort_expr, descending):
+        """排在上一批最后一行之后的行的条件，返回 (条件, 参数)
+
+        行值比较遇到 NULL 时结果为 NULL，会漏掉排序值为 NULL 的行，因此展开比较并单独处理 NULL：
+        SQLite 升序时 NULL 排在最前，降序时排在最后
+        """
+        value, pk = self._last_key
+        op = "<" if descending else ">"
+        if value is None:
+            # 还在 NULL 段中：先取完 NULL 段剩下的行，升序时之后是所有非 NULL 的行
+            condition = f"({sort_expr} IS NULL AND {self.pk_expr} {op} ?)"
+            if not descending:
+                condition = f"({condition} OR {sort_expr} IS NOT NULL)"
+            return condition, [pk]
+        condition = f"{sort_expr} {op} ? OR ({sort_expr} = ? AND {self.pk_expr} {op} ?)"
+        if descending:
+            condition += f" OR {sort_expr} IS NULL"
+        return f"({condition})", [value, value, pk]
+
+    def _append(self, rows):
+        for col, storage in enumerate(self._data):
+            storage.extend(row[col] for row in rows)
+        self._row_count += len(rows)